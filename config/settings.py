@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.middleware.PerformanceMiddleware', # первым: замеряет все остальное
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +56,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга (store/instrumentation.py)
+        'BACKEND': 'store.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -63,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'store.context_processors.cart', # Счетчик корзины в шапке
             ],
         },
     },
@@ -78,10 +81,52 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Обычные atomic() начинаются с BEGIN (DEFERRED) и блокировку записи не берут.
+            # Транзакции, которые читают, а потом пишут (оформление заказа, резервы),
+            # начинаются с BEGIN IMMEDIATE - см. store.transactions.write_transaction
+            'timeout': 20, # сколько секунд ждать освобождения блокировки
+        },
+        # Тестовая база в файле, а не в памяти: тестам с параллельными потоками
+        # нужны настоящие блокировки SQLite
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# Замеры запросов (store.middleware.PerformanceMiddleware)
+PERF_SERVER_TIMING = True # заголовок Server-Timing в каждом ответе (боевой профиль выключает)
+PERF_SAMPLE_RATE = 0 # доля запросов, которые пишутся в лог (выборку включает боевой профиль)
+PERF_SLOW_MS = 500 # медленные запросы пишутся в лог всегда
+PERF_DUPLICATE_QUERIES = 3 # столько одинаковых SQL за запрос - подозрение на N+1
+PERF_LOG_FILE = BASE_DIR / 'perf.jsonl' # JSONL, по одной записи на запрос (пишет только боевой профиль)
+
+# При разработке медленные запросы видны в консоли runserver (DEBUG = True),
+# тесты ничего не пишут. Файл PERF_LOG_FILE подключает config/settings_production.py
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'filters': {
+        'require_debug_true': {'()': 'django.utils.log.RequireDebugTrue'},
+    },
+    'handlers': {
+        'performance': {
+            'class': 'logging.StreamHandler',
+            'filters': ['require_debug_true'],
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'store.performance': {'handlers': ['performance'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
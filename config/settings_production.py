@@ -0,0 +1,56 @@
+"""
+Боевой профиль: python manage.py ... --settings=config.settings_production
+(или DJANGO_SETTINGS_MODULE=config.settings_production для gunicorn/uvicorn).
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES, LOGGING, MIDDLEWARE, PERF_LOG_FILE
+
+DEBUG = False
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)  # noqa: F405
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',')
+
+# Постоянные соединения: без переподключения (и повторных PRAGMA) на каждый запрос
+DATABASES['default']['CONN_MAX_AGE'] = 600
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Реплика для чтения каталога. Локально - второй файл SQLite,
+# который обновляет manage.py sync_replica (например, из cron раз в несколько секунд).
+# sync_replica подменяет файл целиком, поэтому соединение с репликой - на один запрос:
+# постоянное так и читало бы старый снимок
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.environ.get('DJANGO_REPLICA_DB', BASE_DIR / 'db_replica.sqlite3'),
+    'CONN_MAX_AGE': 0,
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['store.routers.PrimaryReplicaRouter']
+
+# Сколько секунд после записи посетитель читает с основной базы (больше интервала sync_replica)
+REPLICA_PIN_SECONDS = 15
+# Умеет и sync, и async: async-представления каталога не уходят из-за нее в поток
+MIDDLEWARE = [*MIDDLEWARE, 'store.middleware.PrimaryAfterWriteMiddleware']
+
+# Server-Timing раскрывал бы любому посетителю число и время SQL - только в логе
+PERF_SERVER_TIMING = False
+# В лог - каждый двадцатый запрос и все медленные, в файл PERF_LOG_FILE (см. perf_report)
+PERF_SAMPLE_RATE = 0.05
+LOGGING['handlers']['performance'] = {
+    'class': 'logging.FileHandler',
+    'filename': PERF_LOG_FILE,
+    'formatter': 'message',
+    'delay': True, # файл создается при первой записи
+}
+
+# Выполняются на каждом новом соединении (store/signals.py).
+# WAL: читатели не блокируют писателя и наоборот - оформление заказа не ждет,
+# пока дочитается каталог. synchronous=NORMAL в режиме WAL безопасен для целостности
+# (при сбое питания теряется только последняя транзакция) и убирает fsync на каждый коммит.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # мс, как OPTIONS['timeout']
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # в КиБ (отрицательное значение), т.е. 64 МиБ на соединение
+}
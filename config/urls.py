@@ -3,6 +3,7 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 from store import views # Импортируем наши вьюхи
+from store import api # JSON API каталога (только чтение)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -16,10 +17,16 @@ urlpatterns = [
 
     path('cart/', views.cart_detail, name='cart_detail'),
     path('cart/add/<int:car_id>/', views.add_to_cart, name='add_to_cart'),
-    path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('csrf/', views.csrf_token, name='csrf_token'), # токен для форм на страницах из кэша
+    path('cart/remove/<int:car_id>/', views.remove_from_cart, name='remove_from_cart'),
 
     path('profile/', views.profile_view, name='profile'),   # Личный кабинет
     path('checkout/', views.checkout, name='checkout'), 
+
+    # JSON API каталога
+    path('api/cars/', api.car_list, name='api_car_list'),
+    path('api/cars/<slug:slug>/', api.car_detail, name='api_car_detail'),
+    path('api/categories/', api.category_list, name='api_category_list'),
 ]
 
 # Чтобы работали картинки в режиме разработки:
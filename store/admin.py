@@ -1,13 +1,147 @@
+import itertools
+from datetime import timedelta
+
 from django.contrib import admin
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Category, Car, Profile, Order, OrderItem
+from .models import Category, Car, CarBatchUpdate, DailySales, Profile, Order, OrderItem, Reservation
+from .bulk_updates import apply_price_change, preview_price_change, set_availability
+from .cache import catalog_cache_key
+from .forms import RepriceForm, SalesReportForm
+from .exports import EXPORT_FORMATS, export_items, iter_export_rows
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from .sales import change_status, sales_report
+from .search import search_queryset
+
+CURSOR_VAR = 'cursor'
+
+
+class CachedValuesFilter(admin.AllValuesFieldListFilter):
+    """Варианты фильтра кэшируются до изменения каталога, а не SELECT DISTINCT на каждый показ."""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = catalog_cache_key('admin-filter', model._meta.label, field_path)
+        self.lookup_choices = cache.get_or_set(key, lambda: list(self.lookup_choices), None)
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Список заказов с курсорной навигацией по (created_at, id) вместо OFFSET.
+
+    Работает при сортировке по умолчанию; если выбрана сортировка по колонке,
+    используется обычная постраничная навигация.
+    """
+
+    keyset_page = None
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Смена фильтров или сортировки начинает список сначала
+        if CURSOR_VAR not in (new_params or {}):
+            remove = [*(remove or []), CURSOR_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        if ORDER_VAR in self.params or self.show_all:
+            return super().get_results(request)
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        page = KeysetPaginator(self.queryset, '-created_at', self.list_per_page).get_page(
+            self.params.get(CURSOR_VAR)
+        )
+        self.keyset_page = page
+        self.result_count = paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = page.object_list
+        self.can_show_all = False
+        self.multi_page = page.has_other_pages
+        self.paginator = paginator
+
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.keyset_page.next_cursor})
+
+    def previous_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.keyset_page.prev_cursor})
+
 
 @admin.register(Car)
 class CarAdmin(admin.ModelAdmin):
     list_display = ('brand', 'model', 'year', 'price', 'is_available', 'country')
-    list_filter = ('brand', 'year', 'body_type', 'country') # Фильтры в админке [cite: 11]
-    search_fields = ('brand', 'model', 'tuning_details')
+    list_filter = (
+        ('brand', CachedValuesFilter),
+        ('year', CachedValuesFilter),
+        ('body_type', CachedValuesFilter),
+        ('country', CachedValuesFilter),
+    ) # Фильтры в админке [cite: 11]
+    search_fields = ('brand', 'model', 'tuning_details') # Нужны, чтобы админка показала строку поиска
     prepopulated_fields = {'slug': ('brand', 'model', 'year')} # Авто-заполнение URL
+    list_per_page = 50
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['reprice', 'make_available', 'make_unavailable']
+
+    # Поиск через полнотекстовый индекс FTS5 вместо LIKE '%...%' по search_fields
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search_queryset(queryset, search_term), False
+
+    # Массовые изменения: один UPDATE на весь отбор (в т.ч. "выбрать все"), см. store/bulk_updates.py
+    @admin.action(description='Изменить цены выбранных автомобилей')
+    def reprice(self, request, queryset):
+        form = RepriceForm(request.POST if 'preview' in request.POST or 'apply' in request.POST else None)
+        preview = None
+        if form.is_valid():
+            action, value = form.cleaned_data['action_type'], form.cleaned_data['value']
+            if 'apply' in request.POST:
+                batch = apply_price_change(queryset, action, value, request.user, self._describe_selection(request))
+                self.message_user(
+                    request,
+                    f'Цены изменены у {batch.cars} машин: {batch.total_before} ₽ → {batch.total_after} ₽.',
+                )
+                return None
+            preview = preview_price_change(queryset, action, value)
+
+        return TemplateResponse(request, 'admin/store/car/reprice.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Изменение цен',
+            'opts': self.model._meta,
+            'form': form,
+            'preview': preview,
+            'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+        })
+
+    @admin.action(description='Отметить "В наличии"')
+    def make_available(self, request, queryset):
+        batch = set_availability(queryset, True, request.user, self._describe_selection(request))
+        self.message_user(request, f'В наличии: {batch.cars} машин.')
+
+    @admin.action(description='Снять с продажи')
+    def make_unavailable(self, request, queryset):
+        batch = set_availability(queryset, False, request.user, self._describe_selection(request))
+        self.message_user(request, f'Снято с продажи: {batch.cars} машин.')
+
+    @staticmethod
+    def _describe_selection(request):
+        # Для журнала: фильтры списка или число отмеченных машин
+        if request.POST.get('select_across') == '1':
+            return f'admin: все по фильтру {request.GET.urlencode()}'.strip()
+        return f'admin: отмечено {len(request.POST.getlist(ACTION_CHECKBOX_NAME))}'
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -17,28 +151,74 @@ class OrderItemInline(admin.TabularInline):
     model = OrderItem
     raw_id_fields = ['car']
 
+    # Машины подгружаются одним JOIN; у оформленного заказа состав не меняется,
+    # поэтому машина только отображается (виджет raw_id делал бы запрос на строку)
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('car')
+
+    def get_readonly_fields(self, request, obj=None):
+        return ('car',) if obj else ()
+
+    def has_add_permission(self, request, obj=None):
+        return obj is None and super().has_add_permission(request, obj)
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'status_colored', 'total_price', 'created_at', 'action_buttons')
     list_filter = ('status', 'created_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    ordering = ('-created_at', '-id')
+    sortable_by = ('id', 'created_at') # Только колонки с индексами: сортировка миллиона строк без индекса - секунды
+    list_per_page = 50
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [OrderItemInline]
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
     
     # Добавляем действие "Действия" (Actions)
-    actions = ['make_completed', 'make_processing']
+    actions = ['make_completed', 'make_processing', 'export_csv', 'export_jsonl']
 
     # 1. Функция-действие: "Отметить как Выполнен"
     @admin.action(description='Пометить выбранные заказы как "Выполнен"')
     def make_completed(self, request, queryset):
-        # Обновляем статус у всех выбранных заказов
-        updated = queryset.update(status='shipped')
+        # Обновляем статус у всех выбранных заказов (и сводку продаж, см. store/sales.py)
+        updated = change_status(queryset, 'shipped')
         self.message_user(request, f'Обновлено заказов: {updated}. Статус: Выполнен.')
 
     # 2. Функция-действие: "В обработке" (для удобства)
     @admin.action(description='Пометить как "В обработке"')
     def make_processing(self, request, queryset):
-        queryset.update(status='processing')
+        change_status(queryset, 'processing')
         self.message_user(request, f'Заказы переведены в статус "В обработке".')
 
+    # Статус, измененный в форме заказа, тоже переносится в сводке продаж
+    def save_model(self, request, obj, form, change):
+        if change and 'status' in form.changed_data:
+            change_status(Order.objects.filter(pk=obj.pk), obj.status)
+        super().save_model(request, obj, form, change)
+
+    # Выгрузка для бухгалтерии: потоком, без загрузки всех заказов в память.
+    # Фильтры по статусу и дате берутся из фильтров списка заказов
+    @admin.action(description='Выгрузить выбранные заказы в CSV')
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv')
+
+    @admin.action(description='Выгрузить выбранные заказы в JSONL')
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl')
+
+    def _export(self, queryset, fmt):
+        content_type, lines = EXPORT_FORMATS[fmt]
+        rows = iter_export_rows(export_items(orders=queryset.values('id')))
+        # BOM нужен, чтобы Excel открыл CSV в UTF-8 (кириллица в статусах)
+        body = itertools.chain(['\ufeff'], lines(rows)) if fmt == 'csv' else lines(rows)
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders-{timezone.now():%Y%m%d-%H%M}.{fmt}"'
+        return response
+
     # 3. Красивое отображение статуса цветом
     def status_colored(self, obj):
         colors = {
@@ -62,4 +242,54 @@ class OrderAdmin(admin.ModelAdmin):
         )
     action_buttons.short_description = 'Действие'
 
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('car', 'user', 'expires_at')
+    list_select_related = ('car', 'user')
+    raw_id_fields = ('car', 'user')
+
+@admin.register(CarBatchUpdate)
+class CarBatchUpdateAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'action', 'value', 'cars', 'total_before', 'total_after', 'user', 'filters')
+    list_filter = ('action',)
+    list_select_related = ('user',)
+
+    # Журнал только для чтения
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+# Отчет о продажах вместо списка строк сводки: все цифры - из DailySales,
+# без обхода заказов, поэтому годы истории считаются за миллисекунды
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Стандартный список не вызывается - права на просмотр проверяем сами
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        form = SalesReportForm(request.GET or {'since': timezone.localdate() - timedelta(days=90)})
+        report = None
+        if form.is_valid():
+            data = form.cleaned_data
+            report = sales_report(data['since'], data['until'], data['status'], data['period'])
+        return TemplateResponse(request, 'admin/store/dailysales/report.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Отчет о продажах',
+            'opts': self.model._meta,
+            'form': form,
+            'report': report,
+            **(extra_context or {}),
+        })
+
 admin.site.register(Profile) # Управление бонусами юзеров [cite: 31]
\ No newline at end of file
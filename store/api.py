@@ -0,0 +1,152 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_GET
+
+from .cache import get_catalog_version
+from .forms import CarFilterForm
+from .models import Car, Category
+from .pagination import KeysetPaginator
+
+# Поля машины, доступные через ?fields= (имя в API -> поле модели)
+CAR_FIELDS = {
+    'id': 'id',
+    'slug': 'slug',
+    'category': 'category_id',
+    'brand': 'brand',
+    'model': 'model',
+    'country': 'country',
+    'year': 'year',
+    'color': 'color',
+    'body_type': 'body_type',
+    'mileage': 'mileage',
+    'engine_power': 'engine_power',
+    'price': 'price',
+    'main_image': 'main_image',
+    'is_available': 'is_available',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'tuning_details': 'tuning_details',
+    'description': 'description',
+}
+# Длинные тексты в списке отдаются только по явному запросу в ?fields=
+DEFAULT_LIST_FIELDS = [name for name in CAR_FIELDS if name not in ('tuning_details', 'description')]
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+STREAM_CHUNK_SIZE = 2000
+
+
+class BadRequest(Exception):
+    pass
+
+
+def catalog_etag(request, *args, **kwargs):
+    # Ответы API зависят только от данных каталога и запроса: база для ETag не нужна
+    return hashlib.md5(f'{get_catalog_version()}:{request.get_full_path()}'.encode()).hexdigest()
+
+
+def api_view(view):
+    """GET-only, ETag/304 по версии каталога, ошибки параметров -> 400."""
+    @wraps(view)
+    @require_GET
+    @condition(etag_func=catalog_etag)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as error:
+            return JsonResponse({'error': error.args[0]}, status=400, json_dumps_params={'ensure_ascii': False})
+    return wrapper
+
+
+def parse_fields(request, default):
+    """?fields=brand,model,price -> список полей API (всегда с id)."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(default)
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in CAR_FIELDS]
+    if unknown:
+        raise BadRequest({'fields': f'Неизвестные поля: {", ".join(unknown)}'})
+    return ['id'] + [name for name in fields if name != 'id']
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest({'limit': 'Ожидается число'})
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def serialize_car(row, fields):
+    data = {name: row[CAR_FIELDS[name]] for name in fields}
+    if 'price' in data:
+        data['price'] = int(data['price']) # цена хранится без копеек
+    if data.get('main_image'):
+        data['main_image'] = default_storage.url(data['main_image'])
+    return data
+
+
+def filtered_cars(request):
+    """Машины в наличии с фильтрами и поиском каталога (та же CarFilterForm)."""
+    form = CarFilterForm(request.GET)
+    if not form.is_valid():
+        raise BadRequest(form.errors.get_json_data())
+    return form, form.filter_queryset(Car.objects.filter(is_available=True))
+
+
+@api_view
+def car_list(request):
+    """
+    Список машин: фильтры каталога, курсорная пагинация, ?fields=, ?limit=.
+    ?format=ndjson - потоковая выгрузка всего каталога построчно.
+    """
+    fields = parse_fields(request, DEFAULT_LIST_FIELDS)
+    columns = [CAR_FIELDS[name] for name in fields]
+    form, cars = filtered_cars(request)
+
+    if request.GET.get('format') == 'ndjson':
+        rows = cars.values(*columns).order_by('id').iterator(chunk_size=STREAM_CHUNK_SIZE)
+        lines = (json.dumps(serialize_car(row, fields), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for row in rows)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson; charset=utf-8')
+
+    ordering = form.get_ordering()
+    sort_column = ordering.lstrip('-')
+    # Колонка сортировки нужна курсору, даже если ее не просили в ?fields=
+    values = cars.values(*columns, *([sort_column] if sort_column not in columns else []))
+    page = KeysetPaginator(values, ordering, per_page=parse_limit(request)).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [serialize_car(row, fields) for row in page],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@api_view
+def car_detail(request, slug):
+    """Одна машина по slug (все поля или ?fields=)."""
+    fields = parse_fields(request, CAR_FIELDS)
+    row = Car.objects.filter(slug=slug, is_available=True).values(*[CAR_FIELDS[name] for name in fields]).first()
+    if row is None:
+        raise Http404
+    return JsonResponse(serialize_car(row, fields), json_dumps_params={'ensure_ascii': False})
+
+
+@api_view
+def category_list(request):
+    """Все категории."""
+    results = [
+        {
+            'id': category['id'],
+            'name': category['name'],
+            'slug': category['slug'],
+            'image': default_storage.url(category['image']) if category['image'] else None,
+        }
+        for category in Category.objects.order_by('name').values('id', 'name', 'slug', 'image')
+    ]
+    return JsonResponse({'results': results}, json_dumps_params={'ensure_ascii': False})
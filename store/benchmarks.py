@@ -0,0 +1,349 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .copurchases import rebuild_copurchases
+from .models import TUNING_MARKUPS, Car, Cart, CartItem, Category, Order, OrderItem, Profile
+from .sales import rebuild_sales
+from .search import rebuild_index
+from .similar import rebuild_similar_cars
+
+# Бенчмарк витрины: детерминированный набор данных заданного масштаба,
+# прогон представлений тестовым клиентом, перцентили задержек, число SQL-запросов
+# и пик памяти. Бюджеты (store/benchmark_budgets.json) хранятся по масштабам.
+
+BUDGETS_FILE = Path(__file__).with_name('benchmark_budgets.json')
+WRITE_BATCH = 2000
+
+SCALES = {
+    'tiny': {'categories': 3, 'cars': 200, 'users': 20, 'orders': 60, 'carts': 5},
+    'small': {'categories': 8, 'cars': 5000, 'users': 500, 'orders': 2000, 'carts': 100},
+    'medium': {'categories': 12, 'cars': 40000, 'users': 5000, 'orders': 15000, 'carts': 1000},
+}
+
+# Марка -> (страна, модели, вес в каталоге, медианная цена)
+BRANDS = {
+    'Toyota': ('Япония', ['Supra', 'Chaser', 'Mark II', 'Celica', 'GR86'], 16, 2_500_000),
+    'Nissan': ('Япония', ['Skyline GT-R', 'Silvia S15', '350Z', '180SX', 'GT-R R35'], 14, 2_800_000),
+    'Honda': ('Япония', ['Civic Type R', 'NSX', 'S2000', 'Integra'], 8, 2_200_000),
+    'Mazda': ('Япония', ['RX-7', 'RX-8', 'MX-5'], 7, 1_800_000),
+    'Subaru': ('Япония', ['Impreza WRX STI', 'BRZ', 'Forester STI'], 7, 2_000_000),
+    'Mitsubishi': ('Япония', ['Lancer Evolution', '3000GT'], 5, 1_900_000),
+    'BMW': ('Германия', ['M3', 'M5', 'M2', 'E30'], 10, 4_500_000),
+    'Audi': ('Германия', ['RS6', 'RS3', 'TT RS'], 6, 5_000_000),
+    'Mercedes-Benz': ('Германия', ['C63 AMG', 'E63 AMG', 'G63 AMG'], 6, 7_000_000),
+    'Volkswagen': ('Германия', ['Golf R', 'Golf GTI'], 4, 2_300_000),
+    'Porsche': ('Германия', ['911 Turbo', 'Cayman GT4'], 4, 11_000_000),
+    'Ford': ('США', ['Mustang GT', 'Focus RS'], 5, 3_500_000),
+    'Chevrolet': ('США', ['Camaro SS', 'Corvette'], 3, 4_000_000),
+    'Dodge': ('США', ['Challenger SRT', 'Viper'], 3, 4_500_000),
+    'Ferrari': ('Италия', ['F40', '488 GTB'], 1, 25_000_000),
+    'Lamborghini': ('Италия', ['Huracan', 'Aventador'], 1, 28_000_000),
+    'Lada': ('Россия', ['2107', 'Vesta Sport'], 4, 600_000),
+}
+CATEGORY_NAMES = [
+    'JDM', 'Европа', 'Маслкары', 'Суперкары', 'Дрифт', 'Трек',
+    'Рестомод', 'Ралли', 'Стенс', 'Слиперы', 'Электро', 'Внедорожники',
+]
+BODY_TYPES = {'Купе': 30, 'Седан': 30, 'Хэтчбек': 15, 'Универсал': 8, 'Кабриолет': 7, 'Внедорожник': 10}
+COLORS = ['Черный', 'Белый', 'Серый', 'Красный', 'Синий', 'Желтый', 'Оранжевый', 'Зеленый']
+TUNING_WORKS = [
+    'Турбина большего размера', 'Интеркулер', 'Прошивка ЭБУ', 'Койловеры', 'Спортивный выхлоп',
+    'Кованые диски', 'Аэродинамический обвес', 'Карбоновый капот', 'Усиленное сцепление',
+    'Блокировка дифференциала', 'Тормоза Brembo', 'Каркас безопасности', 'Ковши Recaro',
+]
+# Доли тюнинга в корзинах и заказах, статусов заказов и числа машин в заказе
+TUNING_WEIGHTS = {'base': 55, 'standard': 30, 'premium': 15}
+STATUS_WEIGHTS = {'shipped': 70, 'cancelled': 8, 'processing': 12, 'new': 10}
+ITEMS_PER_ORDER = {1: 80, 2: 15, 3: 5}
+
+
+def weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def fake_categories(count):
+    names = [CATEGORY_NAMES[number % len(CATEGORY_NAMES)] for number in range(count)]
+    return [
+        Category(name=name if number < len(CATEGORY_NAMES) else f'{name} {number}', slug=f'bench-{number}-{slugify(name)}')
+        for number, name in enumerate(names)
+    ]
+
+
+def fake_cars(rng, count, categories):
+    """
+    Несохраненные машины: марка по весам BRANDS (страна - от марки),
+    цена - логнормально вокруг медианы марки, год смещен к 2010-м.
+    Популярность категорий убывает как 1/n.
+    """
+    brands = list(BRANDS)
+    brand_weights = [BRANDS[brand][2] for brand in brands]
+    category_weights = [1 / (number + 1) for number in range(len(categories))]
+    for number in range(count):
+        brand = rng.choices(brands, weights=brand_weights)[0]
+        country, models, _, median_price = BRANDS[brand]
+        model = rng.choice(models)
+        year = int(rng.triangular(1985, 2025, 2014))
+        yield Car(
+            category=rng.choices(categories, weights=category_weights)[0],
+            brand=brand,
+            model=model,
+            country=country,
+            slug=f'{slugify(brand)}-{slugify(model)}-{year}-{number}',
+            year=year,
+            color=rng.choice(COLORS),
+            body_type=weighted(rng, BODY_TYPES),
+            mileage=(2025 - year) * rng.randint(3000, 20000),
+            engine_power=int(rng.lognormvariate(5.6, 0.35)),
+            tuning_details='. '.join(rng.sample(TUNING_WORKS, rng.randint(1, 5))),
+            price=Decimal(round(min(median_price * rng.lognormvariate(0, 0.4), 50_000_000), -4)),
+            description=f'{brand} {model} {year} года, {rng.choice(COLORS).lower()} салон.',
+            main_image='cars/benchmark.jpg',
+        )
+
+
+def spread_created_at(objects, days, rng):
+    """auto_now_add не дает задать дату в bulk_create - разносим даты вторым проходом (bulk_update)."""
+    now = timezone.now()
+    moments = sorted((now - timedelta(days=rng.uniform(0, days)) for _ in objects))
+    for obj, moment in zip(objects, moments):
+        obj.created_at = moment
+    type(objects[0]).objects.bulk_update(objects, ['created_at'], batch_size=WRITE_BATCH)
+
+
+def generate_dataset(scale, seed=0):
+    """
+    Заполняет базу набором данных масштаба scale (см. SCALES). Один и тот же seed
+    дает те же данные. Служебные пользователи: regular - постоянный клиент
+    (5% всех заказов), shopper - с корзиной, buyer - для оформления заказов.
+    Возвращает словарь с числом строк и служебными пользователями.
+    """
+    size = SCALES[scale]
+    rng = random.Random(seed)
+
+    categories = Category.objects.bulk_create(fake_categories(size['categories']))
+    cars = Car.objects.bulk_create(fake_cars(rng, size['cars'], categories), batch_size=WRITE_BATCH)
+    spread_created_at(cars, 730, rng)
+
+    users = User.objects.bulk_create(
+        [User(username=f'bench-{number:05}', password='!') for number in range(size['users'])],
+        batch_size=WRITE_BATCH,
+    )
+    Profile.objects.bulk_create([Profile(user=user) for user in users], batch_size=WRITE_BATCH)
+    regular, shopper, buyer = users[:3]
+
+    # Заказы: каждая проданная машина - ровно в одной позиции
+    pool = cars[:]
+    rng.shuffle(pool)
+    orders, items = [], []
+    for _ in range(size['orders']):
+        user = regular if rng.random() < 0.05 else rng.choice(users[3:])
+        order = Order(user=user, status=weighted(rng, STATUS_WEIGHTS), total_price=0)
+        for car in (pool.pop() for _ in range(weighted(rng, ITEMS_PER_ORDER))):
+            tuning = weighted(rng, TUNING_WEIGHTS)
+            price = int(car.price) * TUNING_MARKUPS[tuning] // 100 # как Car.price_standard и т.д.
+            order.total_price += price
+            items.append((order, OrderItem(car=car, price=price, tuning_type=tuning)))
+        orders.append(order)
+    Order.objects.bulk_create(orders, batch_size=WRITE_BATCH)
+    spread_created_at(orders, 365, rng)
+    for order, item in items:
+        item.order = order
+    OrderItem.objects.bulk_create([item for _, item in items], batch_size=WRITE_BATCH)
+    sold = [item.car_id for _, item in items]
+    for start in range(0, len(sold), WRITE_BATCH):
+        Car.objects.filter(id__in=sold[start:start + WRITE_BATCH]).update(is_available=False)
+
+    # Корзины: shopper и случайные покупатели, 1-3 машины из оставшихся в продаже
+    cart_users = [shopper, *rng.sample(users[3:], min(size['carts'], len(users) - 3) - 1)]
+    carts = Cart.objects.bulk_create([Cart(user=user) for user in [*cart_users, buyer]])
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, car=car, tuning_type=weighted(rng, TUNING_WEIGHTS))
+        for cart in carts[:-1]
+        for car in rng.sample(pool, rng.randint(1, 3))
+    ], batch_size=WRITE_BATCH)
+
+    rebuild_index()
+    rebuild_similar_cars()
+    rebuild_copurchases()
+    rebuild_sales()
+    cache.clear()
+    return {
+        'counts': {
+            'categories': len(categories), 'cars': len(cars), 'available_cars': len(cars) - len(sold),
+            'users': len(users), 'orders': len(orders), 'order_items': len(items), 'carts': len(cart_users),
+        },
+        'regular': regular,
+        'shopper': shopper,
+        'buyer': buyer,
+    }
+
+
+@dataclass
+class Scenario:
+    """Представление под нагрузкой: клиент, пути по кругу, ожидаемый код и подготовка перед запросом (не в замере)."""
+    name: str
+    client: Client
+    paths: list
+    status: int = 200
+    prepare: object = None
+    timings: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+
+
+def logged_in(user):
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def build_scenarios(dataset):
+    available = Car.objects.filter(is_available=True)
+    top_brand = Counter(available.values_list('brand', flat=True)).most_common(1)[0][0]
+    category = Category.objects.order_by('id').first()
+    catalog = reverse('catalog')
+    catalog_paths = [
+        catalog,
+        f'{catalog}?{urlencode({"brand": top_brand})}',
+        f'{catalog}?{urlencode({"sort": "price_asc"})}',
+        f'{catalog}?{urlencode({"q": BRANDS[top_brand][1][0]})}',
+        f'{catalog}?{urlencode({"category": category.id, "sort": "price_desc"})}',
+    ]
+    detail_paths = [
+        reverse('car_detail', args=[slug])
+        for slug in available.order_by('-created_at', '-id').values_list('slug', flat=True)[:20]
+    ]
+
+    # Оформлять заказ каждый раз нужно из новой корзины: две машины, которых нет
+    # в других корзинах, кладутся туда так же, как это делает покупатель
+    buyer = logged_in(dataset['buyer'])
+    free_cars = iter(available.exclude(cartitem__isnull=False).order_by('id').values_list('id', flat=True))
+
+    def fill_buyer_cart():
+        for tuning in ('base', 'premium'):
+            buyer.post(reverse('add_to_cart', args=[next(free_cars)]), {'tuning_type': tuning})
+
+    return [
+        # Анонимный каталог отдается из кэша страниц, у вошедшего - собирается каждый раз
+        Scenario('catalog_anonymous', Client(), catalog_paths),
+        Scenario('catalog', logged_in(dataset['shopper']), catalog_paths),
+        Scenario('car_detail', logged_in(dataset['shopper']), detail_paths),
+        Scenario('cart_detail', logged_in(dataset['shopper']), [reverse('cart_detail')]),
+        Scenario('profile', logged_in(dataset['regular']), [reverse('profile')]),
+        # Последним: продажи сбрасывают кэши каталога
+        Scenario('checkout', buyer, [reverse('checkout')], status=302, prepare=fill_buyer_cart),
+    ]
+
+
+def percentile(timings, percent):
+    """Перцентиль по отсортированному списку (ближайший ранг)."""
+    index = max(0, min(len(timings) - 1, round(percent / 100 * len(timings)) - 1))
+    return timings[index]
+
+
+def request(scenario, number):
+    path = scenario.paths[number % len(scenario.paths)]
+    response = scenario.client.get(path)
+    if response.status_code != scenario.status:
+        raise AssertionError(f'{scenario.name} {path}: ответ {response.status_code}, ожидался {scenario.status}')
+
+
+def run_scenario(scenario, iterations, warmup):
+    # Прогрев - warmup кругов по всем путям, отрицательные номера в замер не идут
+    for number in range(-warmup * len(scenario.paths), iterations):
+        if scenario.prepare:
+            scenario.prepare()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            request(scenario, number)
+            elapsed = time.perf_counter() - started
+        if number >= 0:
+            scenario.timings.append(elapsed * 1000)
+            scenario.queries.append(len(queries))
+
+    # Память - отдельным проходом: tracemalloc замедляет запросы в разы
+    peak = 0
+    for number in range(len(scenario.paths)):
+        if scenario.prepare:
+            scenario.prepare()
+        tracemalloc.start()
+        request(scenario, number)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    timings = sorted(scenario.timings)
+    return {
+        'requests': iterations,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'queries': max(scenario.queries),
+        'peak_memory_kb': round(peak / 1024),
+    }
+
+
+def run_benchmarks(scale, iterations=50, warmup=1, seed=0):
+    """Заполняет текущую базу (должна быть пустой) и прогоняет все сценарии. Результат - словарь для JSON."""
+    started = time.perf_counter()
+    dataset = generate_dataset(scale, seed)
+    generated = time.perf_counter() - started
+    return {
+        'scale': scale,
+        'seed': seed,
+        'iterations': iterations,
+        'dataset': dataset['counts'],
+        'generate_seconds': round(generated, 1),
+        'views': {
+            scenario.name: run_scenario(scenario, iterations, warmup)
+            for scenario in build_scenarios(dataset)
+        },
+    }
+
+
+def load_budgets(path=BUDGETS_FILE):
+    with open(path, encoding='utf-8') as budgets_file:
+        return json.load(budgets_file)
+
+
+def check_budgets(results, budgets, metrics=('queries', 'p95_ms', 'p99_ms', 'peak_memory_kb')):
+    """Нарушения бюджетов масштаба results['scale']: список строк (пустой - все в норме)."""
+    violations = []
+    for view, budget in budgets.get(results['scale'], {}).items():
+        result = results['views'].get(view)
+        if result is None:
+            continue
+        for metric in metrics:
+            if metric in budget and result[metric] > budget[metric]:
+                violations.append(f'{view}: {metric} = {result[metric]}, бюджет {budget[metric]}')
+    return violations
+
+
+def budgets_from(results, latency_headroom=2.0, memory_headroom=1.5):
+    """Бюджеты по текущему прогону: запросы - как есть, задержки и память - с запасом."""
+    return {
+        view: {
+            'queries': result['queries'],
+            'p95_ms': int(round(result['p95_ms'] * latency_headroom, -1)) + 10,
+            'p99_ms': int(round(result['p99_ms'] * latency_headroom, -1)) + 10,
+            'peak_memory_kb': int(round(result['peak_memory_kb'] * memory_headroom, -2)) + 100,
+        }
+        for view, result in results['views'].items()
+    }
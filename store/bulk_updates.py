@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Greatest, Round
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import CarBatchUpdate
+from .similar import forget_space
+from .transactions import write_transaction
+
+# Массовые изменения каталога одним UPDATE ... SET price = <выражение>.
+# QuerySet.update() не шлет сигналов, поэтому кэши витрины сбрасываются
+# одним увеличением версии каталога на весь пакет, а не по сигналу на машину.
+# updated_at обновляем явно: по нему строятся ключи кэша карточек.
+# Похожие машины массовое изменение не пересчитывает (это O(N) на каждую машину):
+# сбрасываются только векторы (forget_space), таблицу соседей выравнивает rebuild_similar_cars.
+
+PRICE_ACTIONS = ('price_percent', 'price_amount')
+
+
+def price_expression(action, value):
+    """Новая цена в SQL: процент (-5 = скидка 5%) или сумма в рублях, но не меньше нуля."""
+    value = Decimal(value)
+    if action == 'price_percent':
+        price = Round(F('price') * Value((100 + value) / 100))
+    elif action == 'price_amount':
+        price = F('price') + Value(value)
+    else:
+        raise ValueError(f'Неизвестное изменение цены: {action}')
+    return Greatest(price, Value(Decimal(0)), output_field=DecimalField(max_digits=12, decimal_places=0))
+
+
+def preview_price_change(queryset, action, value):
+    """Предпросмотр (dry-run): число машин и сумма цен до и после, одним запросом."""
+    totals = queryset.order_by().aggregate(
+        cars=Count('id'),
+        total_before=Sum('price'),
+        total_after=Sum(price_expression(action, value)),
+    )
+    totals['total_before'] = totals['total_before'] or 0
+    totals['total_after'] = totals['total_after'] or 0
+    return totals
+
+
+@write_transaction()
+def apply_price_change(queryset, action, value, user=None, filters=''):
+    totals = preview_price_change(queryset, action, value)
+    queryset.update(price=price_expression(action, value), updated_at=timezone.now())
+    return _log_batch(user, action, value, filters, **totals)
+
+
+@write_transaction()
+def set_availability(queryset, available, user=None, filters=''):
+    # Трогаем только машины, у которых наличие действительно меняется
+    changed = queryset.filter(~Q(is_available=available)).update(
+        is_available=available, updated_at=timezone.now()
+    )
+    return _log_batch(user, 'availability', int(available), filters, cars=changed)
+
+
+def _log_batch(user, action, value, filters, cars, total_before=None, total_after=None):
+    batch = CarBatchUpdate.objects.create(
+        user=user,
+        action=action,
+        value=value,
+        filters=filters[:255],
+        cars=cars,
+        total_before=total_before,
+        total_after=total_after,
+    )
+    if cars:
+        transaction.on_commit(_catalog_changed)
+    return batch
+
+
+def _catalog_changed():
+    bump_catalog_version()
+    forget_space()
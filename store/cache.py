@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import math
+import random
+import time
+import uuid
+from typing import Any, NamedTuple
+
+from django.core.cache import cache
+
+# Глобальная версия каталога: входит в ключи всех кэшей витрины.
+# Любое изменение Car/Category увеличивает версию, и старые записи
+# просто перестают читаться (их вытеснит сам бэкенд кэша).
+CATALOG_VERSION_KEY = 'store:catalog:version'
+
+
+def _fresh_version():
+    # Начальное значение - время в мс: если ключ версии вытеснили из кэша,
+    # новая версия все равно не совпадет ни с одной из старых
+    return time.time_ns() // 1_000_000
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _fresh_version(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Ключа нет (еще не создан или вытеснен)
+        version = _fresh_version()
+        cache.set(CATALOG_VERSION_KEY, version, None)
+        return version
+
+
+def cache_key(prefix, *parts):
+    """Ключ кэша без версии каталога (версию хранит сама запись, см. single_flight)."""
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'store:{prefix}:{digest}'
+
+
+def catalog_cache_key(prefix, *parts):
+    """Ключ кэша, привязанный к текущей версии каталога."""
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'store:{prefix}:{get_catalog_version()}:{digest}'
+
+
+# Защита от лавины промахов (cache stampede). После смены версии каталога
+# все посетители каталога и главной промахиваются одновременно и строят
+# одну и ту же страницу. single_flight:
+# 1. Запись хранит значение, версию каталога, срок свежести и время расчета.
+#    Устаревшая запись (истек срок или сменилась версия) остается в кэше
+#    и отдается, пока ее пересчитывает один запрос (stale-while-revalidate).
+# 2. Пересчитывает тот, кто взял лок cache.add(key:lock) с коротким сроком аренды:
+#    упавший производитель не заблокирует ключ дольше LOCK_LEASE.
+# 3. При полном промахе остальные ждут записи, опрашивая кэш.
+# 4. Незадолго до истечения запись с вероятностью, растущей к концу срока
+#    и со временем расчета, пересчитывается заранее (probabilistic early
+#    expiration, XFetch), чтобы до массового промаха дело не доходило.
+# Лок работает между процессами, если бэкенд кэша общий (Redis, memcached);
+# у LocMemCache - в пределах процесса.
+LOCK_LEASE = 10
+LOCK_POLL_INTERVAL = 0.02
+EARLY_EXPIRY_BETA = 1.0
+
+
+class CachedValue(NamedTuple):
+    value: Any
+    version: Any
+    expires: float | None # time.time(), после которого запись устарела; None - только по версии
+    delta: float # сколько секунд считалось значение
+
+
+def _is_stale(entry, version):
+    if entry.version != version:
+        return True
+    if entry.expires is None:
+        return False
+    # XFetch: -log(U) > 0, в среднем 1; чем дольше расчет, тем раньше пересчет
+    return time.time() - entry.delta * EARLY_EXPIRY_BETA * math.log(1 - random.random()) >= entry.expires
+
+
+def _entry(value, version, timeout, delta):
+    expires = None if timeout is None else time.time() + timeout
+    return CachedValue(value, version, expires, delta)
+
+
+def _backend_timeout(timeout):
+    # Устаревшая запись живет еще timeout секунд - столько ее можно отдавать, пока идет пересчет
+    return None if timeout is None else 2 * timeout
+
+
+def single_flight(key, producer, timeout, version=None):
+    """
+    Значение из кэша или producer(), который на ключ выполняется одним запросом за раз.
+    version - версия данных (обычно get_catalog_version()), запись другой версии устарела.
+    Если producer вернул None, в кэш ничего не пишется (например, страница не кэшируется).
+    """
+    entry = cache.get(key)
+    if entry is not None and not _is_stale(entry, version):
+        return entry.value
+
+    lock_key, token = f'{key}:lock', uuid.uuid4().hex
+    if cache.add(lock_key, token, LOCK_LEASE):
+        try:
+            return _produce(key, producer, timeout, version)
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+    if entry is not None:
+        return entry.value # пересчитывает другой запрос - пока отдаем старое
+
+    deadline = time.monotonic() + LOCK_LEASE
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry.value
+        if cache.get(lock_key) is None:
+            break
+    # Производитель не записал значение (упал или оно не кэшируется) - считаем сами
+    return _produce(key, producer, timeout, version)
+
+
+def _produce(key, producer, timeout, version):
+    started = time.perf_counter()
+    value = producer()
+    if value is not None:
+        cache.set(key, _entry(value, version, timeout, time.perf_counter() - started), _backend_timeout(timeout))
+    return value
+
+
+async def asingle_flight(key, producer, timeout, version=None):
+    """То же для async-представлений: producer - корутинная функция."""
+    entry = await cache.aget(key)
+    if entry is not None and not _is_stale(entry, version):
+        return entry.value
+
+    lock_key, token = f'{key}:lock', uuid.uuid4().hex
+    if await cache.aadd(lock_key, token, LOCK_LEASE):
+        try:
+            return await _aproduce(key, producer, timeout, version)
+        finally:
+            if await cache.aget(lock_key) == token:
+                await cache.adelete(lock_key)
+    if entry is not None:
+        return entry.value
+
+    deadline = time.monotonic() + LOCK_LEASE
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry.value
+        if await cache.aget(lock_key) is None:
+            break
+    return await _aproduce(key, producer, timeout, version)
+
+
+async def _aproduce(key, producer, timeout, version):
+    started = time.perf_counter()
+    value = await producer()
+    if value is not None:
+        entry = _entry(value, version, timeout, time.perf_counter() - started)
+        await cache.aset(key, entry, _backend_timeout(timeout))
+    return value
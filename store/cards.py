@@ -0,0 +1,57 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = 'store/includes/car_card.html'
+CARD_TIMEOUT = 60 * 60 * 24
+
+# Варианты карточки: показывать ли характеристики, подпись кнопки
+# и какую цену выводить (каталог с выбранной комплектацией - цену с тюнингом)
+CARD_VARIANTS = {
+    'catalog': {'show_specs': True, 'button_label': 'Подробнее'},
+    'catalog_standard': {
+        'show_specs': True, 'button_label': 'Подробнее', 'price_field': 'price_standard', 'price_note': 'со Standard Tuning',
+    },
+    'catalog_premium': {
+        'show_specs': True, 'button_label': 'Подробнее', 'price_field': 'price_premium', 'price_note': 'с Premium Tuning',
+    },
+    'home': {'show_specs': False, 'button_label': 'Смотреть'},
+    'related': {'show_specs': True, 'button_label': 'Смотреть'},
+}
+
+
+def card_key(car, variant):
+    # id + версия содержимого: после сохранения машины старый ключ просто не читается
+    version = int(car.updated_at.timestamp() * 1_000_000)
+    return f'store:card:{variant}:{car.pk}:{version}'
+
+
+def render_car_cards(cars, variant='catalog'):
+    """
+    HTML карточек машин из кэша фрагментов.
+
+    Все карточки страницы читаются одним get_many, недостающие
+    рендерятся и записываются одним set_many.
+    """
+    cars = list(cars)
+    keys = [card_key(car, variant) for car in cars]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    cards = []
+    for car, key in zip(cars, keys):
+        html = cached.get(key)
+        if html is None:
+            options = CARD_VARIANTS[variant]
+            price = getattr(car, options.get('price_field', 'price'))
+            html = render_to_string(CARD_TEMPLATE, {'car': car, 'price': price, **options})
+            missing[key] = html
+        cards.append(html)
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    return mark_safe(''.join(cards))
+
+
+def delete_car_cards(cars):
+    """Сбрасывает карточки машин всех вариантов (например, появились копии фото)."""
+    cache.delete_many([card_key(car, variant) for car in cars for variant in CARD_VARIANTS])
@@ -0,0 +1,150 @@
+import time
+
+from .models import TUNING_MARKUPS, Car, Cart, CartItem, Reservation
+from .pricing import PricedCart
+from .reservations import reserve_cars
+from .transactions import write_transaction
+
+# Корзина живет в сессии: {"<car_id>:<тюнинг>": количество}. Клики по "В корзину"
+# и "Удалить" пишут только сессию (и резерв машины), а строки Cart/CartItem
+# обновляются пачкой (write-behind): при входе, выходе, оформлении заказа
+# и не чаще раза в CART_FLUSH_SECONDS при изменениях.
+# Анонимная корзина при входе сливается с сохраненной корзиной пользователя.
+
+CART_SESSION_KEY = 'cart'
+CART_FLUSH_SECONDS = 5 * 60
+
+
+def line_key(car_id, tuning_type):
+    return f'{car_id}:{tuning_type}'
+
+
+def parse_line_key(key):
+    car_id, tuning_type = key.split(':')
+    return int(car_id), tuning_type
+
+
+def persisted_lines(user):
+    """Позиции сохраненной корзины пользователя в формате сессии."""
+    items = CartItem.objects.filter(cart__user=user).order_by('id')
+    return {line_key(car_id, tuning): quantity for car_id, tuning, quantity in items.values_list('car_id', 'tuning_type', 'quantity')}
+
+
+class SessionCart:
+    """
+    Корзина текущего посетителя. Для вошедшего пользователя при первом обращении
+    в сессии загружается его сохраненная корзина (один запрос), дальше всё из сессии.
+    Изменения сохраняет save(), в базу их переносит flush().
+    """
+
+    def __init__(self, request, user=None):
+        self.request = request
+        user = user or request.user
+        self.user = user if user.is_authenticated else None
+        self.data = request.session.get(CART_SESSION_KEY)
+        if self.data is None:
+            self.data = {'lines': {}, 'dirty': False, 'flushed_at': time.time()}
+            if self.user:
+                self.data['lines'] = persisted_lines(self.user)
+                request.session[CART_SESSION_KEY] = self.data
+
+    def lines(self):
+        """{(car_id, tuning_type): количество}"""
+        return {parse_line_key(key): quantity for key, quantity in self.data['lines'].items()}
+
+    @property
+    def total_items(self):
+        return sum(self.data['lines'].values())
+
+    def __bool__(self):
+        return bool(self.data['lines'])
+
+    def add(self, car_id, tuning_type):
+        # Машина в корзине может быть только одной позицией: повторное добавление
+        # с другим тюнингом меняет комплектацию, а не увеличивает количество
+        quantity = self.remove(car_id) or 1
+        self.data['lines'][line_key(car_id, tuning_type)] = quantity
+
+    def remove(self, car_id):
+        """Убирает машину из корзины, возвращает ее количество (0, если не было)."""
+        removed = 0
+        for key in [key for key in self.data['lines'] if parse_line_key(key)[0] == car_id]:
+            removed += self.data['lines'].pop(key)
+        return removed
+
+    def priced(self):
+        """Позиции с ценами и итоги: одна выборка машин, цены по тем же правилам, что и в SQL."""
+        lines = self.lines()
+        cars = Car.objects.in_bulk({car_id for car_id, _ in lines})
+        items = []
+        for (car_id, tuning_type), quantity in lines.items():
+            if car_id not in cars:
+                continue # машину удалили из каталога
+            item = CartItem(car=cars[car_id], quantity=quantity, tuning_type=tuning_type)
+            item.unit_price = item.get_cost()
+            item.line_total = item.unit_price * quantity
+            items.append(item)
+        return PricedCart(items)
+
+    def save(self):
+        """Сохраняет изменения в сессии; в базу - если с прошлой записи прошло CART_FLUSH_SECONDS."""
+        self.data['dirty'] = True
+        if self.user and time.time() - self.data['flushed_at'] >= CART_FLUSH_SECONDS:
+            self.flush()
+        self.request.session[CART_SESSION_KEY] = self.data
+
+    def flush(self):
+        """Переносит корзину из сессии в Cart/CartItem одной транзакцией (только изменившиеся строки)."""
+        if not self.user or not self.data['dirty']:
+            return
+        lines = self.lines()
+        with write_transaction():
+            cart, _ = Cart.objects.get_or_create(user=self.user)
+            stored = {(item.car_id, item.tuning_type): item for item in cart.items.all()}
+            CartItem.objects.filter(id__in=[item.id for line, item in stored.items() if line not in lines]).delete()
+            changed = []
+            for line, quantity in lines.items():
+                if line in stored and stored[line].quantity != quantity:
+                    stored[line].quantity = quantity
+                    changed.append(stored[line])
+            CartItem.objects.bulk_update(changed, ['quantity'])
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, car_id=car_id, tuning_type=tuning_type, quantity=quantity)
+                for (car_id, tuning_type), quantity in lines.items()
+                if (car_id, tuning_type) not in stored
+            ])
+        self.data.update(dirty=False, flushed_at=time.time())
+        self.request.session[CART_SESSION_KEY] = self.data
+
+    def ordered(self):
+        """Заказ оформлен: place_order уже очистил Cart, сессия тоже пуста."""
+        self.data.update(lines={}, dirty=False, flushed_at=time.time())
+        self.request.session[CART_SESSION_KEY] = self.data
+
+
+def merge_on_login(request, user):
+    """
+    Сливает корзину сессии (набранную анонимно) с сохраненной корзиной пользователя.
+    Машины из сессии резервируются за ним; занятые другими и проданные отбрасываются.
+    При совпадении машины побеждает выбор из сессии (он сделан позже).
+    Возвращает число отброшенных машин.
+    """
+    session_lines = (request.session.get(CART_SESSION_KEY) or {}).get('lines', {})
+    session_cars = {parse_line_key(key)[0] for key in session_lines}
+    held = set()
+    if session_cars:
+        reserve_cars(user, session_cars)
+        held = set(Reservation.objects.filter(user=user, car_id__in=session_cars).values_list('car_id', flat=True))
+
+    request.session.pop(CART_SESSION_KEY, None)
+    cart = SessionCart(request, user)
+    for key, quantity in session_lines.items():
+        car_id, tuning_type = parse_line_key(key)
+        if car_id in held and tuning_type in TUNING_MARKUPS:
+            cart.remove(car_id)
+            cart.data['lines'][key] = quantity
+    if session_lines:
+        cart.data['dirty'] = True
+        cart.flush()
+    request.session[CART_SESSION_KEY] = cart.data
+    return len(session_cars - held)
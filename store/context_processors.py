@@ -0,0 +1,9 @@
+from .carts import SessionCart
+
+
+def cart(request):
+    """Количество товаров в корзине для бейджа в шапке (base.html)."""
+    # Функция, а не число: шаблон вызовет ее только при выводе бейджа,
+    # а страница корзины может передать уже посчитанное значение сама.
+    # Корзина в сессии, запрос к базе - только при первом обращении после входа
+    return {'cart_total_items': lambda: SessionCart(request).total_items}
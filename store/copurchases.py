@@ -0,0 +1,126 @@
+import heapq
+from collections import Counter
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import F, Q, Sum, Window
+from django.db.models.functions import RowNumber
+
+from .models import Car, CoPurchase, OrderItem
+from .transactions import write_transaction
+
+# Сколько самых частых пар хранить на модель (остальные отсекаются)
+COPURCHASES_PER_LINE = 20
+REBUILD_CHUNK_SIZE = 5000
+WRITE_BATCH = 5000
+
+def order_pairs(lines):
+    """Все упорядоченные пары разных моделей одного заказа."""
+    lines = sorted(set(lines))
+    return [(line, other) for line in lines for other in lines if line != other]
+
+
+@write_transaction()
+def record_purchase(lines):
+    """
+    Учитывает один оформленный заказ: +1 каждой паре его моделей.
+
+    Список пар модели ограничен COPURCHASES_PER_LINE по алгоритму Space-Saving:
+    если места нет, новая пара вытесняет самую редкую и получает ее счетчик + 1.
+    Так часто покупаемые вместе модели не теряются, даже если появились поздно
+    (счетчики новичков завышены; точные значения дает rebuild_copurchases).
+    """
+    for (brand, model), others in groupby(order_pairs(lines), key=lambda pair: pair[0]):
+        others = [other for _, other in others]
+        pairs = CoPurchase.objects.filter(brand=brand, model=model)
+        existing = {(pair.other_brand, pair.other_model): pair for pair in pairs}
+
+        known = [existing[other].pk for other in others if other in existing]
+        pairs.filter(pk__in=known).update(count=F('count') + 1)
+
+        new = [other for other in others if other not in existing]
+        free = COPURCHASES_PER_LINE - len(existing)
+        evicted = sorted(
+            (pair for pair in existing.values() if pair.pk not in known), key=lambda pair: (pair.count, pair.pk)
+        )[:max(0, len(new) - free)]
+        pairs.filter(pk__in=[pair.pk for pair in evicted]).delete()
+
+        base_counts = [0] * min(len(new), max(free, 0)) + [pair.count for pair in evicted]
+        CoPurchase.objects.bulk_create([
+            CoPurchase(brand=brand, model=model, other_brand=other[0], other_model=other[1], count=base + 1)
+            for other, base in zip(new, base_counts)
+        ])
+
+
+def rebuild_copurchases(chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    Полный пересчет по всей истории заказов.
+
+    Позиции читаются потоком, отсортированными по заказу (iterator() не грузит
+    выборку в память целиком), в памяти - только счетчики пар.
+    Возвращает (число заказов, число сохраненных пар).
+    """
+    items = (
+        OrderItem.objects.order_by('order_id')
+        .values_list('order_id', 'car__brand', 'car__model')
+        .iterator(chunk_size=chunk_size)
+    )
+    counts = Counter()
+    orders = 0
+    for _, rows in groupby(items, key=lambda row: row[0]):
+        orders += 1
+        counts.update(order_pairs((brand, model) for _, brand, model in rows))
+
+    # Top-k на модель
+    by_line = {}
+    for (line, other), count in counts.items():
+        by_line.setdefault(line, []).append((count, other))
+    rows = (
+        CoPurchase(brand=line[0], model=line[1], other_brand=other[0], other_model=other[1], count=count)
+        for line, pairs in by_line.items()
+        for count, other in heapq.nlargest(COPURCHASES_PER_LINE, pairs)
+    )
+
+    saved = 0
+    with transaction.atomic():
+        CoPurchase.objects.all().delete()
+        while batch := [row for _, row in zip(range(WRITE_BATCH), rows)]:
+            CoPurchase.objects.bulk_create(batch)
+            saved += len(batch)
+    return orders, saved
+
+
+def also_bought_lines(lines):
+    """
+    Модели, которые чаще всего покупали вместе с lines, по убыванию.
+    Queryset словарей other_brand, other_model, score.
+    """
+    condition = Q(pk__in=[])
+    for brand, model in lines:
+        condition |= Q(brand=brand, model=model)
+    return (
+        CoPurchase.objects.filter(condition)
+        .exclude(Q(*[Q(other_brand=brand, other_model=model) for brand, model in lines], _connector=Q.OR))
+        .values('other_brand', 'other_model')
+        .annotate(score=Sum('count'))
+        .order_by('-score', 'other_brand', 'other_model')[:COPURCHASES_PER_LINE]
+    )
+
+
+def also_bought_cars(ranked_lines, exclude_ids=()):
+    """Самая новая машина в наличии от каждой модели из ranked_lines (queryset, порядок - rank_cars)."""
+    condition = Q(pk__in=[])
+    for line in ranked_lines:
+        condition |= Q(brand=line['other_brand'], model=line['other_model'])
+    return (
+        Car.objects.filter(condition, is_available=True)
+        .exclude(id__in=exclude_ids)
+        .annotate(line_rank=Window(RowNumber(), partition_by=[F('brand'), F('model')], order_by=F('created_at').desc()))
+        .filter(line_rank=1)
+    )
+
+
+def rank_cars(cars, ranked_lines, limit):
+    """Упорядочивает машины по месту их модели в ranked_lines."""
+    position = {(line['other_brand'], line['other_model']): number for number, line in enumerate(ranked_lines)}
+    return sorted(cars, key=lambda car: position[(car.brand, car.model)])[:limit]
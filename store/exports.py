@@ -0,0 +1,94 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Order, OrderItem
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Колонки выгрузки: имя в файле -> поле OrderItem (с переходами по связям)
+EXPORT_COLUMNS = {
+    'item_id': 'id',
+    'order_id': 'order_id',
+    'created_at': 'order__created_at',
+    'status': 'order__status',
+    'status_display': 'order__status', # подменяется на название статуса
+    'username': 'order__user__username',
+    'email': 'order__user__email',
+    'order_total': 'order__total_price',
+    'car_id': 'car_id',
+    'brand': 'car__brand',
+    'model': 'car__model',
+    'year': 'car__year',
+    'tuning_type': 'tuning_type',
+    'price': 'price',
+}
+STATUS_NAMES = dict(Order.STATUS_CHOICES)
+
+
+def export_items(since=None, until=None, statuses=None, after=None, orders=None):
+    """
+    Позиции заказов для выгрузки с фильтрами по дате и статусу.
+
+    Возвращает queryset values_list в порядке id позиции: id последней
+    выгруженной строки и есть курсор для продолжения (after).
+    """
+    items = OrderItem.objects.all()
+    if orders is not None:
+        items = items.filter(order__in=orders)
+    if since:
+        items = items.filter(order__created_at__gte=since)
+    if until:
+        items = items.filter(order__created_at__lt=until)
+    if statuses:
+        items = items.filter(order__status__in=statuses)
+    if after:
+        items = items.filter(id__gt=after)
+    return items.values_list(*EXPORT_COLUMNS.values()).order_by('id')
+
+
+def iter_export_rows(items, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Строки выгрузки (словари) кусками по chunk_size.
+
+    Каждый кусок - отдельный короткий запрос "id > последнего", поэтому
+    память постоянна, а SQLite не держит одну длинную читающую транзакцию.
+    """
+    last_id = None
+    while True:
+        chunk = items if last_id is None else items.filter(id__gt=last_id)
+        chunk = list(chunk[:chunk_size])
+        for values in chunk:
+            row = dict(zip(EXPORT_COLUMNS, values))
+            row['status_display'] = STATUS_NAMES.get(row['status'], row['status'])
+            yield row
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: write() просто возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, header=True):
+    writer = csv.writer(_Echo())
+    if header:
+        yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row.values())
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', csv_lines),
+    'jsonl': ('application/x-ndjson; charset=utf-8', jsonl_lines),
+}
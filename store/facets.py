@@ -0,0 +1,102 @@
+from collections import Counter
+
+from django.db.models import Count
+
+from .cache import asingle_flight, cache_key, get_catalog_version, single_flight
+from .models import Car
+from .search import search_queryset
+
+# Фасеты боковой панели каталога, в порядке колонок FacetIndex.rows
+FACET_FIELDS = ('brand', 'country', 'category', 'year')
+FACETS_TIMEOUT = 60 * 60
+
+
+class FacetIndex:
+    """
+    Индекс фасетов каталога: одна сгруппированная выборка
+    (марка, страна, категория, год) -> количество машин в наличии.
+
+    Из нее без обращений к базе считаются и списки значений для фильтров,
+    и счетчики под текущий набор фильтров.
+    """
+
+    def __init__(self, rows):
+        # rows: кортежи (brand, country, category_id, category_name, year, count)
+        self.category_names = {row[2]: row[3] for row in rows}
+        self.rows = [(brand, country, category_id, year, count)
+                     for brand, country, category_id, _, year, count in rows]
+
+    def choices(self, facet):
+        """Значения фасета в виде choices для формы."""
+        position = FACET_FIELDS.index(facet)
+        values = {row[position] for row in self.rows}
+        if facet == 'category':
+            return sorted(((pk, self.category_names[pk]) for pk in values), key=lambda choice: choice[1])
+        if facet == 'year':
+            return [(year, year) for year in sorted(values, reverse=True)]
+        return [(value, value) for value in sorted(values)]
+
+    def counts(self, selected):
+        """
+        Счетчики по каждому фасету с учетом выбранных фильтров.
+
+        Для значения фасета учитываются все фильтры, кроме фильтра по самому
+        этому фасету (иначе в списке марок осталась бы только выбранная).
+        Возвращает (счетчики по фасетам, сколько машин проходит все фильтры).
+        """
+        counts = {facet: Counter() for facet in FACET_FIELDS}
+        total = 0
+        for *values, count in self.rows:
+            mismatched = [
+                position for position, facet in enumerate(FACET_FIELDS)
+                if selected.get(facet) is not None and values[position] != selected[facet]
+            ]
+            if not mismatched:
+                total += count
+                for position, facet in enumerate(FACET_FIELDS):
+                    counts[facet][values[position]] += count
+            elif len(mismatched) == 1:
+                position = mismatched[0]
+                counts[FACET_FIELDS[position]][values[position]] += count
+        return counts, total
+
+
+def get_facet_index(price_min=None, price_max=None, search='', price_field='price'):
+    """
+    Индекс фасетов по машинам в наличии (с учетом цен и поиска), из кэша.
+    price_field - колонка цены выбранной комплектации (price_standard и т.д.).
+    """
+    return single_flight(
+        cache_key('facets', price_min, price_max, search, price_field),
+        lambda: FacetIndex(list(_facet_rows(price_min, price_max, search, price_field))),
+        FACETS_TIMEOUT,
+        version=get_catalog_version(),
+    )
+
+
+async def aget_facet_index(price_min=None, price_max=None, search='', price_field='price'):
+    """То же для async-представлений."""
+    async def produce():
+        return FacetIndex([row async for row in _facet_rows(price_min, price_max, search, price_field)])
+
+    return await asingle_flight(
+        cache_key('facets', price_min, price_max, search, price_field),
+        produce,
+        FACETS_TIMEOUT,
+        version=get_catalog_version(),
+    )
+
+
+def _facet_rows(price_min, price_max, search, price_field='price'):
+    cars = Car.objects.filter(is_available=True)
+    if price_min is not None:
+        cars = cars.filter(**{f'{price_field}__gte': price_min})
+    if price_max is not None:
+        cars = cars.filter(**{f'{price_field}__lte': price_max})
+    if search:
+        cars = search_queryset(cars, search)
+    return (
+        cars.values_list('brand', 'country', 'category_id', 'category__name', 'year')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
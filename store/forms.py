@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from .models import Car, Category
+from .facets import FACET_FIELDS, get_facet_index
+from .models import TUNING_CHOICES, TUNING_PRICE_FIELDS, Order
+from .search import search_queryset
 
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(required=True, label="Email")
@@ -20,22 +22,44 @@ class UserRegistrationForm(UserCreationForm):
             })
 
 class CarFilterForm(forms.Form):
-    # Получаем уникальные значения для марок и стран из БД
-    brands = Car.objects.values_list('brand', 'brand').order_by('brand').distinct()
-    countries = Car.objects.values_list('country', 'country').order_by('country').distinct()
-    
+    # Варианты сортировки каталога -> поле для курсорной пагинации (id добавляется как тай-брейк)
+    SORT_CHOICES = [
+        ('new', 'Сначала новые'),
+        ('price_asc', 'Сначала дешевле'),
+        ('price_desc', 'Сначала дороже'),
+        ('relevance', 'По релевантности'),
+    ]
+    ORDERING = {
+        'new': '-created_at',
+        'price_asc': 'price',
+        'price_desc': '-price',
+        'relevance': 'search_rank', # аннотация BM25 из store.search, меньше - лучше
+    }
+    PRICE_SORTS = ('price_asc', 'price_desc')
+
+    # Значения марок, стран, категорий и годов берутся из индекса фасетов
+    # в __init__, а не при импорте модуля: так они всегда актуальны
+    # и не стоят ни одного запроса, пока индекс лежит в кэше.
+
+    # 0. Полнотекстовый поиск (марка, модель, тюнинг, описание)
+    q = forms.CharField(
+        required=False,
+        max_length=200,
+        label="Поиск",
+        widget=forms.TextInput(attrs={'placeholder': 'Например, twin turbo', 'class': 'form-input'})
+    )
+
     # 1. Фильтр по Категории (выпадающий список)
-    category = forms.ModelChoiceField(
-        queryset=Category.objects.all(),
+    category = forms.TypedChoiceField(
+        coerce=int,
+        empty_value=None,
         required=False,
         label="Категория",
-        empty_label="Все категории",
         widget=forms.Select(attrs={'class': 'filter-select'})
     )
     
     # 2. Фильтр по Марке (выпадающий список)
     brand = forms.ChoiceField(
-        choices=[('', 'Все марки')] + list(brands),
         required=False,
         label="Марка",
         widget=forms.Select(attrs={'class': 'filter-select'})
@@ -43,12 +67,20 @@ class CarFilterForm(forms.Form):
 
     # 3. Фильтр по Стране производителя (выпадающий список)
     country = forms.ChoiceField(
-        choices=[('', 'Все страны')] + list(countries),
         required=False,
         label="Страна",
         widget=forms.Select(attrs={'class': 'filter-select'})
     )
 
+    # 3.1. Фильтр по Году выпуска (выпадающий список)
+    year = forms.TypedChoiceField(
+        coerce=int,
+        empty_value=None,
+        required=False,
+        label="Год выпуска",
+        widget=forms.Select(attrs={'class': 'filter-select'})
+    )
+
     # 4. Фильтр по Цене (диапазон)
     price_min = forms.IntegerField(
         required=False,
@@ -59,4 +91,167 @@ class CarFilterForm(forms.Form):
         required=False,
         label="Цена до",
         widget=forms.NumberInput(attrs={'placeholder': 'Макс. цена', 'class': 'form-input filter-input'})
-    )
\ No newline at end of file
+    )
+
+    # 4.1. Комплектация: цены в фильтре, сортировке и карточках - с этим тюнингом
+    tuning = forms.ChoiceField(
+        choices=TUNING_CHOICES,
+        required=False,
+        label="Комплектация",
+        widget=forms.Select(attrs={'class': 'filter-select'})
+    )
+
+    # Пустой вариант для каждого фасета
+    EMPTY_LABELS = {
+        'category': 'Все категории',
+        'brand': 'Все марки',
+        'country': 'Все страны',
+        'year': 'Все годы',
+    }
+
+    # 5. Сортировка
+    sort = forms.ChoiceField(
+        choices=SORT_CHOICES,
+        required=False,
+        label="Сортировка",
+        widget=forms.Select(attrs={'class': 'filter-select'})
+    )
+
+    def __init__(self, *args, facets=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # async-представление передает уже загруженный индекс (facets=await aget_facet_index())
+        self.facets = facets if facets is not None else get_facet_index()
+        for facet in FACET_FIELDS:
+            self.fields[facet].choices = [('', self.EMPTY_LABELS[facet])] + self.facets.choices(facet)
+
+    def get_filter_params(self):
+        """Собирает параметры .filter() из очищенных данных формы."""
+        filter_params = {}
+        if not self.is_valid():
+            return filter_params
+
+        # 1. Фильтр по Категории
+        category = self.cleaned_data.get('category')
+        if category is not None:
+            filter_params['category_id'] = category
+
+        # 2. Фильтр по Марке. Значения приходят из choices (то есть ровно как в БД),
+        # поэтому точное сравнение: в отличие от __iexact оно использует индекс
+        brand = self.cleaned_data.get('brand')
+        if brand:
+            filter_params['brand'] = brand
+
+        # 3. Фильтр по Стране
+        country = self.cleaned_data.get('country')
+        if country:
+            filter_params['country'] = country
+
+        # 3.1. Фильтр по Году
+        year = self.cleaned_data.get('year')
+        if year is not None:
+            filter_params['year'] = year
+
+        # 4. Фильтр по Цене (от) - по колонке цены выбранной комплектации
+        price_field = self.get_price_field()
+        price_min = self.cleaned_data.get('price_min')
+        if price_min is not None:
+            filter_params[f'{price_field}__gte'] = price_min # greater than or equal
+
+        # 5. Фильтр по Цене (до)
+        price_max = self.cleaned_data.get('price_max')
+        if price_max is not None:
+            filter_params[f'{price_field}__lte'] = price_max # less than or equal
+
+        return filter_params
+
+    def filter_queryset(self, queryset):
+        """Применяет к queryset фильтры и поисковую строку формы."""
+        queryset = queryset.filter(**self.get_filter_params())
+        if self.get_search():
+            queryset = search_queryset(queryset, self.get_search())
+        return queryset
+
+    def get_search(self):
+        return self.cleaned_data.get('q', '').strip() if self.is_valid() else ''
+
+    def get_tuning(self):
+        return (self.cleaned_data.get('tuning') if self.is_valid() else None) or 'base'
+
+    def get_price_field(self):
+        """Колонка цены выбранной комплектации: price, price_standard или price_premium."""
+        return TUNING_PRICE_FIELDS[self.get_tuning()]
+
+    def get_facet_params(self):
+        """Аргументы get_facet_index() под текущие цены и поиск."""
+        data = self.cleaned_data if self.is_valid() else {}
+        price_min, price_max = data.get('price_min'), data.get('price_max')
+        # Без границ цены комплектация на счетчики не влияет - общий индекс в кэше
+        price_field = self.get_price_field() if price_min is not None or price_max is not None else 'price'
+        return price_min, price_max, self.get_search(), price_field
+
+    def annotate_facets(self, index=None):
+        """
+        Добавляет к вариантам фильтров количество машин под текущие фильтры
+        и возвращает общее число найденных машин.
+        """
+        data = self.cleaned_data if self.is_valid() else {}
+        if index is None:
+            index = get_facet_index(*self.get_facet_params())
+        counts, total = index.counts({facet: data.get(facet) or None for facet in FACET_FIELDS})
+        for facet in FACET_FIELDS:
+            self.fields[facet].choices = [('', self.EMPTY_LABELS[facet])] + [
+                (value, f'{label} ({counts[facet][value]})')
+                for value, label in self.facets.choices(facet)
+            ]
+        return total
+
+    def get_ordering(self):
+        sort = self.cleaned_data.get('sort') if self.is_valid() else None
+        # При поиске по умолчанию сортируем по релевантности,
+        # а без поисковой строки ранга нет - возвращаемся к новинкам
+        if self.get_search():
+            sort = sort or 'relevance'
+        elif sort == 'relevance':
+            sort = None
+        ordering = self.ORDERING.get(sort or 'new')
+        if sort in self.PRICE_SORTS:
+            ordering = ordering.replace('price', self.get_price_field())
+        return ordering
+
+class RepriceForm(forms.Form):
+    """Массовое изменение цен (действие в админке, см. store/bulk_updates.py)."""
+    action_type = forms.ChoiceField(
+        label="Изменение",
+        choices=[('price_percent', 'На процент'), ('price_amount', 'На сумму, ₽')],
+    )
+    value = forms.DecimalField(label="Значение", max_digits=12, decimal_places=2, help_text="Отрицательное - скидка")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('action_type') == 'price_percent' and cleaned_data.get('value', 0) <= -100:
+            raise forms.ValidationError("Скидка должна быть меньше 100%")
+        return cleaned_data
+
+
+class SalesReportForm(forms.Form):
+    """Период и статусы для отчета о продажах в админке (store/sales.py)."""
+    since = forms.DateField(label="С", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    until = forms.DateField(label="По", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    period = forms.ChoiceField(
+        label="Шаг", required=False, choices=[('day', 'День'), ('week', 'Неделя'), ('month', 'Месяц')],
+    )
+    # По умолчанию - без отмененных заказов
+    status = forms.MultipleChoiceField(
+        label="Статусы", required=False, choices=Order.STATUS_CHOICES, widget=forms.CheckboxSelectMultiple,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        since, until = cleaned_data.get('since'), cleaned_data.get('until')
+        if since and until and since > until:
+            raise forms.ValidationError("Начало периода позже конца")
+        cleaned_data['period'] = cleaned_data.get('period') or 'day'
+        cleaned_data['status'] = cleaned_data.get('status') or [
+            code for code, _ in Order.STATUS_CHOICES if code != 'cancelled'
+        ]
+        return cleaned_data
@@ -0,0 +1,95 @@
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Ширины уменьшенных копий (для srcset) и форматы, в которых они сохраняются
+DERIVATIVE_WIDTHS = (320, 640, 960, 1440)
+DERIVATIVE_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+# Копии лежат отдельно от оригиналов: media/derivatives/cars/gtr-640w.webp
+DERIVATIVES_DIR = 'derivatives'
+# Копия для <img src> в браузерах без srcset
+FALLBACK_WIDTH = 640
+
+
+def derivative_name(name, width, ext):
+    base, _ = os.path.splitext(name)
+    return f'{DERIVATIVES_DIR}/{base}-{width}w.{ext}'
+
+
+def derivative_srcset(name, ext):
+    return ', '.join(
+        f'{default_storage.url(derivative_name(name, width, ext))} {width}w'
+        for width in DERIVATIVE_WIDTHS
+    )
+
+
+def has_derivatives(name):
+    # Самая большая JPEG-копия пишется последней, значит, есть она - есть и остальные
+    return default_storage.exists(derivative_name(name, DERIVATIVE_WIDTHS[-1], 'jpeg'))
+
+
+def _is_fresh(target, source_mtime):
+    return default_storage.exists(target) and default_storage.get_modified_time(target) >= source_mtime
+
+
+def generate_derivatives(name, force=False):
+    """
+    Создает уменьшенные копии изображения во всех ширинах и форматах.
+
+    Актуальные копии (новее оригинала) пропускаются, если не задан force.
+    Оригиналы уже нужной ширины не растягиваются: копия остается
+    исходного размера, но файл под эту ширину все равно есть (srcset не ломается).
+    Возвращает количество записанных файлов.
+    """
+    source_mtime = default_storage.get_modified_time(name)
+    pending = [
+        (width, ext)
+        for width in DERIVATIVE_WIDTHS
+        for ext in DERIVATIVE_FORMATS
+        if force or not _is_fresh(derivative_name(name, width, ext), source_mtime)
+    ]
+    if not pending:
+        return 0
+
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image) # фото с телефона хранят поворот в EXIF
+        image.load()
+    if image.mode != 'RGB':
+        image = image.convert('RGB') # JPEG не умеет прозрачность и палитры
+
+    for width, ext in pending:
+        resized = image
+        if image.width > width:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, **DERIVATIVE_FORMATS[ext])
+
+        target = derivative_name(name, width, ext)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        default_storage.save(target, ContentFile(buffer.getvalue()))
+    return len(pending)
+
+
+def generate_derivatives_for(field_file):
+    """
+    Обработчик сохранения модели: создает копии, если оригинал на месте.
+    Возвращает количество записанных файлов.
+    """
+    if not field_file or not default_storage.exists(field_file.name):
+        return 0
+    try:
+        return generate_derivatives(field_file.name)
+    except OSError:
+        logger.warning('Не удалось создать копии изображения %s', field_file.name, exc_info=True)
+        return 0
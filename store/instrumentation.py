@@ -0,0 +1,99 @@
+import hashlib
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates, Template
+
+# Замеры одного запроса: SQL (обертка execute_wrapper на каждом соединении,
+# см. store/signals.py) и рендеринг шаблонов (бэкенд TimedDjangoTemplates).
+# Копится в объекте текущего запроса из ContextVar: контекст копируется
+# в sync_to_async и asyncio.gather, поэтому async-представления тоже учитываются.
+# Вне запроса (команды, миграции) обертки ничего не делают.
+
+_current = ContextVar('request_stats', default=None)
+
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """SQL без значений: параметры и литералы -> ?, списки IN (?, ?, ...) -> (...)."""
+    sql = LITERALS.sub('?', sql.replace('%s', '?'))
+    return SPACES.sub(' ', PLACEHOLDER_LIST.sub('(...)', sql)).strip()
+
+
+def sql_fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0 # render() внутри render() (карточки в {% car_cards %})
+        self.statements = Counter()
+
+    def add_query(self, sql, duration):
+        self.sql_count += 1
+        self.sql_time += duration
+        self.statements[normalize_sql(sql)] += 1
+
+    def duplicates(self, threshold):
+        """Запросы, повторенные в одном HTTP-запросе не меньше threshold раз (признак N+1)."""
+        return [
+            {'fingerprint': sql_fingerprint(sql), 'count': count, 'sql': sql[:500]}
+            for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None or stats.template_depth:
+            # Вложенный шаблон (render_to_string из тега) уже входит во время внешнего:
+            # считается только верхний уровень. {% include %} сюда и не попадает
+            return super().render(context, request)
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+            stats.template_depth -= 1
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Обычный бэкенд шаблонов Django, который засекает время render()."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
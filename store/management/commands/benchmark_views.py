@@ -0,0 +1,95 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from store.benchmarks import percentile
+from store.models import Car
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность и хвостовые задержки витрины '
+        '(главная, каталог, карточка машины) через WSGI и ASGI (тестовые клиенты Django)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Запросов на каждый режим')
+        parser.add_argument('--concurrency', type=int, default=10, help='Одновременных запросов')
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Мимо кэша страниц: запросы с cookie флеш-сообщений (такие страницы не кэшируются)',
+        )
+
+    def handle(self, *args, **options):
+        car = Car.objects.filter(is_available=True).only('slug').first()
+        if car is None:
+            raise CommandError('В базе нет машин в наличии')
+        self.paths = [
+            reverse('home'),
+            reverse('catalog'),
+            reverse('catalog') + '?sort=price_asc',
+            reverse('car_detail', args=[car.slug]),
+        ]
+        self.cookies = {'messages': 'benchmark'} if options['cold'] else {}
+        total, concurrency = options['requests'], options['concurrency']
+
+        self.stdout.write(f'{total} запросов, {concurrency} одновременно, пути: {", ".join(self.paths)}')
+        for mode, run in (('WSGI', self.run_wsgi), ('ASGI', self.run_asgi)):
+            run(2 * len(self.paths), concurrency) # прогрев: кэши, соединения
+            started = time.perf_counter()
+            timings = sorted(run(total, concurrency))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{mode}: {total / elapsed:7.1f} запр/с  '
+                f'p50 {percentile(timings, 50) * 1000:6.1f} мс  '
+                f'p95 {percentile(timings, 95) * 1000:6.1f} мс  '
+                f'p99 {percentile(timings, 99) * 1000:6.1f} мс  '
+                f'среднее {statistics.mean(timings) * 1000:6.1f} мс'
+            )
+
+    def run_wsgi(self, total, concurrency):
+        # WSGI-сервер - пул потоков, у каждого потока свой клиент и свое соединение с базой
+        def worker(numbers):
+            client = Client()
+            client.cookies.load(self.cookies)
+            timings = [self.timed(client.get, self.paths[number % len(self.paths)]) for number in numbers]
+            connections.close_all()
+            return timings
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            chunks = pool.map(worker, [range(start, total, concurrency) for start in range(concurrency)])
+            return [timing for chunk in chunks for timing in chunk]
+
+    def run_asgi(self, total, concurrency):
+        # ASGI-сервер - один цикл событий, одновременные запросы - корутины
+        async def main():
+            client = AsyncClient()
+            client.cookies.load(self.cookies)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def request(number):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(self.paths[number % len(self.paths)])
+                    self.assert_ok(response)
+                    return time.perf_counter() - started
+
+            return await asyncio.gather(*(request(number) for number in range(total)))
+
+        return asyncio.run(main())
+
+    def timed(self, get, path):
+        started = time.perf_counter()
+        self.assert_ok(get(path))
+        return time.perf_counter() - started
+
+    @staticmethod
+    def assert_ok(response):
+        if response.status_code != 200:
+            raise CommandError(f'{response.request["PATH_INFO"]}: ответ {response.status_code}')
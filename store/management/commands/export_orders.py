@@ -0,0 +1,64 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from store.exports import EXPORT_FORMATS, csv_lines, export_items, iter_export_rows, jsonl_lines
+from store.models import Order
+
+
+def parse_date(value):
+    try:
+        return timezone.make_aware(datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), time.min))
+    except ValueError:
+        raise CommandError(f'Дата должна быть в формате ГГГГ-ММ-ДД: {value}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковая выгрузка заказов (Order + OrderItem + Car) в CSV или JSONL. '
+        'Прерванную выгрузку можно продолжить с --after <последний item_id>.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--since', type=parse_date, help='Заказы с этой даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--until', type=parse_date, help='Заказы до этой даты, не включая ее')
+        parser.add_argument('--status', action='append', choices=[code for code, _ in Order.STATUS_CHOICES],
+                            help='Статус заказа (можно указать несколько раз)')
+        parser.add_argument('--after', type=int, help='Продолжить после позиции с этим item_id')
+        parser.add_argument('--output', help='Файл (по умолчанию stdout). С --after файл дописывается')
+
+    def handle(self, *args, **options):
+        items = export_items(
+            since=options['since'],
+            until=options['until'],
+            statuses=options['status'],
+            after=options['after'],
+        )
+        self.last_id = None
+        rows = self.track(iter_export_rows(items))
+        if options['format'] == 'csv':
+            # При продолжении заголовок уже есть в файле
+            lines = csv_lines(rows, header=options['after'] is None)
+        else:
+            lines = jsonl_lines(rows)
+
+        try:
+            if options['output']:
+                mode = 'a' if options['after'] else 'w'
+                with open(options['output'], mode, encoding='utf-8', newline='') as output:
+                    for line in lines:
+                        output.write(line)
+            else:
+                for line in lines:
+                    self.stdout.write(line, ending='')
+        finally:
+            if self.last_id is not None:
+                self.stderr.write(f'Последний выгруженный item_id: {self.last_id} (для продолжения: --after {self.last_id})')
+
+    def track(self, rows):
+        # Запоминаем курсор, чтобы прерванную выгрузку можно было продолжить
+        for row in rows:
+            self.last_id = row['item_id']
+            yield row
@@ -0,0 +1,50 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from store.cards import delete_car_cards
+from store.images import generate_derivatives
+from store.models import Car, Category
+
+
+def _generate(name, force):
+    # Выполняется в отдельном процессе: ошибки возвращаем, а не роняем весь пул
+    try:
+        return generate_derivatives(name, force=force), None
+    except Exception as error:  # noqa: BLE001
+        return 0, str(error)
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии (WebP/JPEG для srcset) для всех фото автомобилей и категорий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать даже актуальные копии')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Число процессов (по умолчанию - все ядра)')
+
+    def handle(self, *args, **options):
+        names = set(Car.objects.exclude(main_image='').values_list('main_image', flat=True))
+        names |= set(Category.objects.exclude(image='').values_list('image', flat=True))
+        names = sorted(names)
+        force = options['force']
+
+        written = failed = 0
+        updated = []
+        # initializer нужен для spawn (Windows): дочерний процесс должен поднять Django сам
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            for name, (count, error) in zip(names, pool.map(_generate, names, [force] * len(names), chunksize=4)):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                written += count
+                if count:
+                    updated.append(name)
+
+        # Карточки машин с обновленными фото перерисуются уже с srcset
+        delete_car_cards(Car.objects.filter(main_image__in=updated).only('id', 'updated_at'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений: {len(names)}, записано копий: {written}, ошибок: {failed}'
+        ))
@@ -0,0 +1,201 @@
+import csv
+import hashlib
+import json
+import os
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+from django.utils.text import slugify
+
+from store.cache import bump_catalog_version
+from store.models import Car, Category
+from store.search import index_cars
+from store.similar import forget_space
+
+# Поля, которые обновляются у уже существующей машины (совпадение по slug)
+UPDATE_FIELDS = [
+    'category', 'brand', 'model', 'country', 'year', 'color', 'body_type', 'mileage',
+    'engine_power', 'tuning_details', 'price', 'description', 'main_image', 'is_available', 'updated_at',
+]
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да', '+'}
+
+
+class RowError(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовый импорт автомобилей из CSV или JSONL (пакетами, upsert по slug). '
+        'Колонки: category (slug категории), brand, model, country, year, color, body_type, mileage, '
+        'engine_power, tuning_details, price, description, image (файл в --images), is_available, slug'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .csv или .jsonl')
+        parser.add_argument('--images', default='.', help='Папка с фотографиями из колонки image')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл не найден: {path}')
+        self.images_dir = options['images']
+
+        # Все справочники - в память один раз, а не запрос на каждую строку
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.slugs = set(Car.objects.values_list('slug', flat=True))
+        self.imported_slugs = set() # slug уже встречался в этом файле - вторая строка с ним ошибочна
+        self.stored_images = {}
+
+        imported = failed = 0
+        rows = self.read_rows(path)
+        while batch := list(islice(rows, options['batch_size'])):
+            cars = []
+            for line, row in batch:
+                try:
+                    cars.append((line, self.build_car(row)))
+                except RowError as error:
+                    failed += 1
+                    self.stderr.write(f'Строка {line}: {error}')
+            if cars:
+                saved = self.save_batch(cars)
+                imported += saved
+                failed += len(cars) - saved
+
+        # bulk_create не шлет сигналов: кэши каталога сбрасываем один раз на весь импорт,
+        # похожие машины не пересчитываем по одной - только сбрасываем их векторы (forget_space)
+        bump_catalog_version()
+        forget_space()
+        self.stdout.write(self.style.SUCCESS(f'Импортировано: {imported}, с ошибками: {failed}'))
+        if imported:
+            self.stdout.write('Для новых фото запустите: python manage.py generate_image_derivatives')
+            self.stdout.write('Для похожих машин запустите: python manage.py rebuild_similar_cars')
+
+    def read_rows(self, path):
+        """(номер строки, словарь) из CSV или JSONL."""
+        with open(path, encoding='utf-8-sig', newline='') as source:
+            if path.endswith('.jsonl'):
+                for line, text in enumerate(source, start=1):
+                    if text.strip():
+                        try:
+                            yield line, json.loads(text)
+                        except ValueError as error:
+                            self.stderr.write(f'Строка {line}: некорректный JSON ({error})')
+            else:
+                # Строка 1 - заголовок
+                for line, row in enumerate(csv.DictReader(source), start=2):
+                    yield line, row
+
+    def build_car(self, row):
+        if not isinstance(row, dict):
+            raise RowError('ожидался объект JSON')
+        row = {key: (value.strip() if isinstance(value, str) else value) for key, value in row.items() if key}
+
+        category_id = self.categories.get(row.get('category'))
+        if category_id is None:
+            raise RowError(f'неизвестная категория "{row.get("category")}"')
+
+        car = Car(
+            category_id=category_id,
+            brand=row.get('brand', ''),
+            model=row.get('model', ''),
+            country=row.get('country') or 'Неуказанно',
+            year=row.get('year'),
+            color=row.get('color', ''),
+            body_type=row.get('body_type', ''),
+            mileage=row.get('mileage') or 0,
+            engine_power=row.get('engine_power'),
+            tuning_details=row.get('tuning_details', ''),
+            price=row.get('price'),
+            description=row.get('description', ''),
+            is_available=str(row.get('is_available', 'true')).lower() in TRUE_VALUES,
+            slug=row.get('slug') or '',
+        )
+        image = self.image_source(row.get('image'))
+        try:
+            # Явный slug проверяется как остальные поля (validate_slug): с "Nissan Skyline!!" не построить URL.
+            # Фото еще не сохранено - его проверяет image_source
+            exclude = ['category', 'main_image'] if car.slug else ['category', 'main_image', 'slug']
+            car.clean_fields(exclude=exclude)
+        except ValidationError as error:
+            raise RowError('; '.join(f'{field}: {" ".join(messages)}' for field, messages in error.message_dict.items()))
+        if not car.slug:
+            car.slug = self.unique_slug(car)
+        elif car.slug in self.imported_slugs:
+            raise RowError(f'slug "{car.slug}" уже есть выше в этом файле')
+        # Явный slug занимаем, чтобы сгенерированные дальше с ним не совпали
+        self.slugs.add(car.slug)
+        self.imported_slugs.add(car.slug)
+        # Фото - в хранилище последним: отклоненные строки не оставляют файлов в media/cars/
+        car.main_image = self.store_image(image)
+        return car
+
+    def unique_slug(self, car):
+        # Как prepopulated_fields в админке: марка-модель-год, с номером при совпадении
+        base = slugify(f'{car.brand} {car.model} {car.year}') or 'car'
+        slug, number = base, 2
+        while slug in self.slugs:
+            slug, number = f'{base}-{number}', number + 1
+        self.slugs.add(slug)
+        return slug
+
+    def image_source(self, filename):
+        """Путь к фото строки в папке --images (без записи в хранилище)."""
+        if not filename:
+            raise RowError('не указано фото (image)')
+        source = os.path.join(self.images_dir, filename)
+        if not os.path.isfile(source):
+            raise RowError(f'фото не найдено: {source}')
+        return source
+
+    def store_image(self, source):
+        """
+        Копирует фото в хранилище под именем с хешем содержимого (cars/IMG_0001-<хеш>.jpg).
+        Одинаковые имена у разных фото (IMG_0001.jpg двух дилеров, переснятая машина)
+        дают разные файлы, а повторный импорт того же фото не плодит копий.
+        """
+        if source not in self.stored_images:
+            with open(source, 'rb') as image:
+                digest = hashlib.file_digest(image, 'sha256').hexdigest()[:16]
+                stem, extension = os.path.splitext(os.path.basename(source))
+                name = f'cars/{stem}-{digest}{extension}'
+                if not default_storage.exists(name):
+                    image.seek(0)
+                    name = default_storage.save(name, File(image))
+            self.stored_images[source] = name
+        return self.stored_images[source]
+
+    def save_batch(self, cars):
+        """
+        Сохраняет пакет [(номер строки, Car)], возвращает число сохраненных.
+        Если база отклонила пакет целиком, сохраняет его по одной машине,
+        чтобы сообщить о плохой строке и пропустить только ее.
+        """
+        try:
+            return self.upsert([car for line, car in cars])
+        except DatabaseError:
+            pass
+        saved = 0
+        for line, car in cars:
+            try:
+                saved += self.upsert([car])
+            except DatabaseError as error:
+                self.stderr.write(f'Строка {line}: ошибка базы ({error})')
+        return saved
+
+    def upsert(self, cars):
+        # Одна транзакция и один INSERT ... ON CONFLICT(slug) DO UPDATE на пакет
+        with transaction.atomic():
+            saved = Car.objects.bulk_create(
+                cars,
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=UPDATE_FIELDS,
+            )
+            index_cars([car.pk for car in saved if car.pk])
+        return len(saved)
@@ -0,0 +1,82 @@
+import json
+import statistics
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.benchmarks import percentile
+
+
+def summarize(records):
+    """
+    Сводка по представлениям. Перцентили - только по случайной выборке (sampled):
+    медленные запросы пишутся в лог всегда и исказили бы распределение.
+    """
+    by_view = defaultdict(list)
+    for record in records:
+        by_view[record['view'] or '(не найдено)'].append(record)
+
+    summary = {}
+    for view, view_records in by_view.items():
+        sampled = [record for record in view_records if record['sampled']]
+        duplicates = Counter()
+        statements = {}
+        for record in view_records:
+            for duplicate in record['duplicates']:
+                duplicates[duplicate['fingerprint']] += 1
+                statements[duplicate['fingerprint']] = duplicate['sql']
+        row = {
+            'requests': len(sampled),
+            'slow': sum(record['slow'] for record in view_records),
+            'n_plus_one': [
+                {'fingerprint': fingerprint, 'requests': count, 'sql': statements[fingerprint]}
+                for fingerprint, count in duplicates.most_common(3)
+            ],
+        }
+        if sampled:
+            for metric in ('total_ms', 'sql_ms', 'template_ms'):
+                values = sorted(record[metric] for record in sampled)
+                for percent in (50, 95, 99):
+                    row[f'{metric[:-3]}_p{percent}_ms'] = percentile(values, percent)
+            row['sql_count_mean'] = round(statistics.mean(record['sql_count'] for record in sampled), 1)
+            row['sql_count_max'] = max(record['sql_count'] for record in sampled)
+        summary[view] = row
+    return dict(sorted(summary.items(), key=lambda item: -item[1].get('total_p95_ms', 0)))
+
+
+class Command(BaseCommand):
+    help = 'Перцентили времени, SQL и шаблонов по представлениям из лога PerformanceMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', nargs='?', default=str(settings.PERF_LOG_FILE), help='Файл JSONL')
+        parser.add_argument('--view', help='Только это представление (имя из urls.py)')
+        parser.add_argument('--json', action='store_true', help='Вывести сводку в JSON')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['log'], encoding='utf-8') as log:
+                records = [json.loads(line) for line in log if line.strip()]
+        except FileNotFoundError:
+            raise CommandError(f'Нет файла {options["log"]}')
+        if options['view']:
+            records = [record for record in records if record['view'] == options['view']]
+
+        summary = summarize(records)
+        if options['json']:
+            self.stdout.write(json.dumps(summary, ensure_ascii=False, indent=2))
+            return
+
+        for view, row in summary.items():
+            line = f'{view:28} запросов {row["requests"]:6}  медленных {row["slow"]:4}'
+            if row['requests']:
+                line += (
+                    f'  p50 {row["total_p50_ms"]:7.1f}  p95 {row["total_p95_ms"]:7.1f}  p99 {row["total_p99_ms"]:7.1f} мс'
+                    f'  SQL p95 {row["sql_p95_ms"]:6.1f} мс (в среднем {row["sql_count_mean"]}, макс. {row["sql_count_max"]})'
+                    f'  шаблоны p95 {row["template_p95_ms"]:6.1f} мс'
+                )
+            self.stdout.write(line)
+            for duplicate in row['n_plus_one']:
+                self.stdout.write(
+                    f'    N+1 [{duplicate["fingerprint"]}] в {duplicate["requests"]} запросах: {duplicate["sql"][:200]}'
+                )
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.copurchases import REBUILD_CHUNK_SIZE, rebuild_copurchases
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает "С этим также покупают" по всей истории заказов '
+        '(позиции читаются потоком, пачками по --chunk-size)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        orders, pairs = rebuild_copurchases(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Заказов: {orders}, сохранено пар: {pairs} за {time.perf_counter() - started:.1f} с'
+        ))
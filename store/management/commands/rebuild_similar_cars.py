@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.similar import rebuild_similar_cars
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает таблицу похожих машин целиком (после импорта и массовых изменений, '
+        'которые не шлют сигналов, или по расписанию - обновить нормировку признаков)'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_similar_cars()
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие машины пересчитаны для {count} машин за {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Снимает просроченные резервы автомобилей (запускать по расписанию, например из cron)'
+
+    def handle(self, *args, **options):
+        count = release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Снято просроченных резервов: {count}'))
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.bulk_updates import apply_price_change, preview_price_change, set_availability
+from store.models import Car
+
+# Опция командной строки -> фильтр по машинам
+FILTERS = {
+    'category': 'category__slug',
+    'brand': 'brand__iexact',
+    'country': 'country__iexact',
+    'body_type': 'body_type__iexact',
+    'year': 'year',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Массовое изменение цен или наличия машин одним UPDATE. '
+        'Пример: reprice_cars --category jdm --body-type Купе --percent -5 --dry-run'
+    )
+
+    def add_arguments(self, parser):
+        for option in FILTERS:
+            parser.add_argument(f'--{option.replace("_", "-")}', dest=option)
+        parser.add_argument('--only-available', action='store_true', help='Только машины в наличии')
+
+        change = parser.add_mutually_exclusive_group(required=True)
+        change.add_argument('--percent', help='Изменить цену на процент (-5 = скидка 5%%)')
+        change.add_argument('--amount', help='Изменить цену на сумму в рублях')
+        change.add_argument('--available', action='store_true', help='Отметить "В наличии"')
+        change.add_argument('--unavailable', action='store_true', help='Снять с продажи')
+
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что изменится')
+
+    def handle(self, *args, **options):
+        lookups = {FILTERS[option]: options[option] for option in FILTERS if options[option]}
+        if options['only_available']:
+            lookups['is_available'] = True
+        queryset = Car.objects.filter(**lookups)
+        filters = ' '.join(f'{key}={value}' for key, value in lookups.items()) or 'все машины'
+
+        if options['available'] or options['unavailable']:
+            available = options['available']
+            if options['dry_run']:
+                count = queryset.exclude(is_available=available).count()
+                self.stdout.write(f'Изменится наличие у {count} машин ({filters})')
+                return
+            batch = set_availability(queryset, available, filters=filters)
+            self.stdout.write(self.style.SUCCESS(f'Наличие изменено у {batch.cars} машин'))
+            return
+
+        action, value = ('price_percent', options['percent']) if options['percent'] else ('price_amount', options['amount'])
+        try:
+            value = Decimal(value)
+        except ArithmeticError:
+            raise CommandError(f'Некорректное значение: {value}')
+        if action == 'price_percent' and value <= -100:
+            raise CommandError('Скидка должна быть меньше 100%')
+
+        preview = preview_price_change(queryset, action, value)
+        self.stdout.write(
+            f'Машин: {preview["cars"]} ({filters})\n'
+            f'Сумма цен: {preview["total_before"]} ₽ -> {preview["total_after"]} ₽'
+        )
+        if options['dry_run']:
+            return
+        batch = apply_price_change(queryset, action, value, filters=filters)
+        self.stdout.write(self.style.SUCCESS(f'Цены изменены у {batch.cars} машин (запись журнала #{batch.pk})'))
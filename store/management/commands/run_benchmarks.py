@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from store.benchmarks import BUDGETS_FILE, SCALES, budgets_from, check_budgets, load_budgets, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк витрины на сгенерированных данных во временной тестовой базе: '
+        'p50/p95/p99, число SQL-запросов и пик памяти по представлениям. '
+        'Завершается с ошибкой, если превышены бюджеты масштаба (store/benchmark_budgets.json)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small')
+        parser.add_argument('--iterations', type=int, default=50, help='Замеряемых запросов на представление')
+        parser.add_argument('--warmup', type=int, default=1, help='Кругов прогрева по всем путям (не в замере)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Куда записать результаты (JSON)')
+        parser.add_argument('--budgets', default=str(BUDGETS_FILE), help='Файл бюджетов')
+        parser.add_argument(
+            '--record-budgets', action='store_true',
+            help='Записать бюджеты масштаба по этому прогону (с запасом) вместо проверки',
+        )
+
+    def handle(self, *args, **options):
+        # Как в тестах: отдельная база, которая удаляется после прогона, DEBUG выключен
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = run_benchmarks(options['scale'], options['iterations'], options['warmup'], options['seed'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+        budgets = load_budgets(options['budgets'])
+        if options['record_budgets']:
+            budgets[results['scale']] = budgets_from(results)
+            with open(options['budgets'], 'w', encoding='utf-8') as budgets_file:
+                json.dump(budgets, budgets_file, ensure_ascii=False, indent=2)
+                budgets_file.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'Бюджеты масштаба {results["scale"]} записаны в {options["budgets"]}'))
+            return
+
+        if results['scale'] not in budgets:
+            self.stdout.write(self.style.WARNING(f'Для масштаба {results["scale"]} бюджетов нет'))
+            return
+        violations = check_budgets(results, budgets)
+        if violations:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(violations))
+        self.stdout.write(self.style.SUCCESS('Все представления в пределах бюджетов'))
+
+    def report(self, results):
+        counts = ', '.join(f'{name}: {count}' for name, count in results['dataset'].items())
+        self.stdout.write(f'Масштаб {results["scale"]} ({counts}), данные за {results["generate_seconds"]} с')
+        for view, result in results['views'].items():
+            self.stdout.write(
+                f'{view:18} p50 {result["p50_ms"]:7.1f} мс  p95 {result["p95_ms"]:7.1f} мс  '
+                f'p99 {result["p99_ms"]:7.1f} мс  SQL {result["queries"]:3}  '
+                f'память {result["peak_memory_kb"]:6} КБ'
+            )
@@ -0,0 +1,52 @@
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from store.routers import REPLICA
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в реплику для чтения (онлайн-бэкап, '
+        'согласованный снимок без остановки сайта). Запускать по расписанию.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Страниц за шаг: между шагами писатели основной базы не ждут')
+
+    def handle(self, *args, **options):
+        if REPLICA not in settings.DATABASES:
+            raise CommandError('Реплика не настроена (нужен профиль config.settings_production)')
+
+        started = time.perf_counter()
+        replica = os.fspath(settings.DATABASES[REPLICA]['NAME'])
+        # Бэкап пишется во временный файл рядом с репликой и подменяет ее целиком (rename атомарен):
+        # читатели видят либо старый снимок, либо новый, но никогда - наполовину скопированный
+        fd, copy = tempfile.mkstemp(prefix='.sync-', suffix='.sqlite3', dir=os.path.dirname(os.path.abspath(replica)))
+        os.close(fd)
+        try:
+            source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+            target = sqlite3.connect(copy)
+            try:
+                source.backup(target, pages=options['pages'])
+                # Реплику только читают: без WAL у нее нет файлов -wal/-shm, которые
+                # после подмены остались бы от прежнего файла
+                target.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                target.close()
+                source.close()
+            os.replace(copy, replica)
+        except BaseException:
+            os.remove(copy)
+            raise
+
+        # Открытые соединения держат старый (уже удаленный) файл - следующий запрос откроет новый.
+        # Веб-процессы подхватывают его сами: у реплики CONN_MAX_AGE = 0 (config/settings_production.py)
+        connections[REPLICA].close()
+        self.stdout.write(self.style.SUCCESS(f'Реплика обновлена за {time.perf_counter() - started:.2f} с'))
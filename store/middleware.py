@@ -0,0 +1,133 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+
+from .instrumentation import finish_request, start_request
+from .routers import _pinned, _wrote
+
+PRIMARY_PIN_COOKIE = 'primary_pin'
+
+performance_log = logging.getLogger('store.performance')
+
+
+class PrimaryAfterWriteMiddleware:
+    """
+    Read-your-writes для реплики: если запрос записал каталог или заказ,
+    следующие REPLICA_PIN_SECONDS секунд этот посетитель читает с основной базы
+    (например, каталог сразу после правки машины в админке).
+    Работает и в async-цепочке: флаги - ContextVar, а sync_to_async возвращает
+    их изменения из потока (запись ORM) обратно в запрос.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Потоки сервера переиспользуются между запросами, поэтому флаги сбрасываем на каждый запрос
+        tokens = self.start(request)
+        try:
+            return self.pin(self.get_response(request))
+        finally:
+            self.finish(tokens)
+
+    async def __acall__(self, request):
+        tokens = self.start(request)
+        try:
+            return self.pin(await self.get_response(request))
+        finally:
+            self.finish(tokens)
+
+    def start(self, request):
+        return _pinned.set(PRIMARY_PIN_COOKIE in request.COOKIES), _wrote.set(False)
+
+    def pin(self, response):
+        if _wrote.get():
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
+
+    def finish(self, tokens):
+        pinned, wrote = tokens
+        _pinned.reset(pinned)
+        _wrote.reset(wrote)
+
+
+class PerformanceMiddleware:
+    """
+    Замеры каждого запроса: имя представления, общее время, число и время SQL,
+    время рендеринга шаблонов. Отдаются заголовком Server-Timing (видно во вкладке
+    Network браузера) и пишутся JSON-строкой в лог store.performance:
+    доля PERF_SAMPLE_RATE запросов плюс все медленнее PERF_SLOW_MS.
+    Запросы, повторенные PERF_DUPLICATE_QUERIES раз и больше (N+1), попадают в запись
+    с отпечатком SQL. Сводка по логу: python manage.py perf_report.
+    Стоит первым в MIDDLEWARE, чтобы в общее время вошли все остальные.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_request(token)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        stats, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            finish_request(token)
+        return self.report(request, response, stats)
+
+    def report(self, request, response, stats):
+        total = (time.perf_counter() - stats.started) * 1000
+        sql, template = stats.sql_time * 1000, stats.template_time * 1000
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'total;dur={total:.1f}, '
+                f'sql;dur={sql:.1f};desc="{stats.sql_count} queries", '
+                f'tpl;dur={template:.1f}'
+            )
+
+        sampled = random.random() < settings.PERF_SAMPLE_RATE
+        slow = total >= settings.PERF_SLOW_MS
+        if sampled or slow:
+            match = request.resolver_match
+            performance_log.info(json.dumps({
+                'time': timezone.now().isoformat(timespec='milliseconds'),
+                'view': match.view_name if match else None,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total, 2),
+                'sql_count': stats.sql_count,
+                'sql_ms': round(sql, 2),
+                'template_ms': round(template, 2),
+                'sampled': sampled, # perf_report считает перцентили только по случайной выборке
+                'slow': slow,
+                'duplicates': stats.duplicates(settings.PERF_DUPLICATE_QUERIES),
+            }, ensure_ascii=False))
+        return response
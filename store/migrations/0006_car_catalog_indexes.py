@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_cartitem_tuning_type_orderitem_tuning_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['created_at', 'id'], name='car_avail_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['price', 'id'], name='car_avail_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['category', 'created_at', 'id'], name='car_avail_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['category', 'price', 'id'], name='car_avail_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['brand', 'created_at', 'id'], name='car_avail_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['country', 'created_at', 'id'], name='car_avail_country_idx'),
+        ),
+    ]
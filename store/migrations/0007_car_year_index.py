@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_car_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['year', 'created_at', 'id'], name='car_avail_year_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_car_year_index'),
+    ]
+
+    operations = [
+        # Полнотекстовый индекс SQLite FTS5 по машинам (rowid = Car.id).
+        # Синхронизируется сигналами, пересобирается командой rebuild_search_index.
+        migrations.RunSQL(
+            sql=[
+                "CREATE VIRTUAL TABLE store_car_fts USING fts5("
+                "brand, model, tuning_details, description, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+                "INSERT INTO store_car_fts (rowid, brand, model, tuning_details, description) "
+                "SELECT id, brand, model, tuning_details, description FROM store_car",
+            ],
+            reverse_sql=["DROP TABLE IF EXISTS store_car_fts"],
+        ),
+    ]
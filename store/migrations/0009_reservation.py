@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_car_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+                ('car', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reservation', to='store.car', verbose_name='Автомобиль')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to=settings.AUTH_USER_MODEL, verbose_name='Покупатель')),
+            ],
+            options={
+                'verbose_name': 'Резерв',
+                'verbose_name_plural': 'Резервы',
+            },
+        ),
+    ]
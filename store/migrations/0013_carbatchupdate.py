@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_order_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarBatchUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('action', models.CharField(choices=[('price_percent', 'Цена, %'), ('price_amount', 'Цена, ₽'), ('availability', 'Наличие')], max_length=20, verbose_name='Изменение')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Значение')),
+                ('filters', models.CharField(blank=True, max_length=255, verbose_name='Отбор')),
+                ('cars', models.PositiveIntegerField(verbose_name='Машин')),
+                ('total_before', models.DecimalField(decimal_places=0, max_digits=16, null=True, verbose_name='Сумма цен до')),
+                ('total_after', models.DecimalField(decimal_places=0, max_digits=16, null=True, verbose_name='Сумма цен после')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Кто изменил')),
+            ],
+            options={
+                'verbose_name': 'Массовое изменение',
+                'verbose_name_plural': 'Массовые изменения',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_carbatchupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarCar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('car', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='store.car')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='store.car')),
+            ],
+            options={
+                'verbose_name': 'Похожая машина',
+                'verbose_name_plural': 'Похожие машины',
+                'constraints': [models.UniqueConstraint(fields=('car', 'rank'), name='similar_car_rank_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_similarcar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('brand', models.CharField(max_length=50, verbose_name='Марка')),
+                ('model', models.CharField(max_length=50, verbose_name='Модель')),
+                ('other_brand', models.CharField(max_length=50, verbose_name='Вместе с маркой')),
+                ('other_model', models.CharField(max_length=50, verbose_name='Вместе с моделью')),
+                ('count', models.PositiveIntegerField(verbose_name='Покупок вместе')),
+            ],
+            options={
+                'verbose_name': 'Совместная покупка',
+                'verbose_name_plural': 'Совместные покупки',
+                'indexes': [models.Index(fields=['brand', 'model', '-count'], name='copurchase_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('brand', 'model', 'other_brand', 'other_model'), name='copurchase_pair_unique')],
+            },
+        ),
+    ]
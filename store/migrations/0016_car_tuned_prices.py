@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:09
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_copurchase'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='price_premium',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast(models.F('price'), models.IntegerField()), '*', models.Value(130)), '/', models.Value(100)), output_field=models.DecimalField(decimal_places=0, max_digits=12), verbose_name='Цена с Premium Tuning'),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='price_standard',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast(models.F('price'), models.IntegerField()), '*', models.Value(115)), '/', models.Value(100)), output_field=models.DecimalField(decimal_places=0, max_digits=12), verbose_name='Цена со Standard Tuning'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['price_standard', 'id'], name='car_avail_price_std_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['price_premium', 'id'], name='car_avail_price_prem_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_car_tuned_prices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('brand', models.CharField(max_length=50, verbose_name='Марка')),
+                ('tuning_type', models.CharField(choices=[('base', 'Базовая комплектация'), ('standard', 'Standard Tuning (+15%)'), ('premium', 'Premium Tuning (+30%)')], max_length=10, verbose_name='Тюнинг')),
+                ('status', models.CharField(choices=[('new', 'Новый'), ('processing', 'В обработке'), ('shipped', 'Доставлен'), ('cancelled', 'Отменен')], max_length=20, verbose_name='Статус заказа')),
+                ('count', models.PositiveIntegerField(verbose_name='Продано машин')),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='Выручка')),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='store.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+                'constraints': [models.UniqueConstraint(fields=('date', 'brand', 'category', 'tuning_type', 'status'), name='daily_sales_key_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+import django.db.models.deletion
+import store.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_daily_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarSearchEntry',
+            fields=[
+                ('car', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='store.car')),
+                ('document', store.models.FtsDocumentField(db_column='store_car_fts')),
+            ],
+            options={
+                'db_table': 'store_car_fts',
+                'managed': False,
+            },
+        ),
+    ]
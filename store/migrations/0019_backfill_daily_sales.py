@@ -0,0 +1,37 @@
+from django.db import migrations
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_sales(apps, schema_editor):
+    # Сводка по заказам, оформленным до появления DailySales: та же группировка
+    # (дата / марка / категория / тюнинг / статус), что в rebuild_sales на момент
+    # этой миграции. Только исторические модели, без кода приложения:
+    # store.sales может измениться, а миграция должна делать то же, что и сейчас
+    DailySales = apps.get_model('store', 'DailySales')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    if DailySales.objects.exists():
+        return
+    rows = (
+        OrderItem.objects.order_by()
+        .values(
+            'tuning_type',
+            date=TruncDate('order__created_at'),
+            brand=F('car__brand'),
+            category_id=F('car__category_id'),
+            status=F('order__status'),
+        )
+        .annotate(count=Count('id'), revenue=Sum('price'))
+    )
+    DailySales.objects.bulk_create((DailySales(**row) for row in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_car_search_entry'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
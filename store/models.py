@@ -1,8 +1,9 @@
 from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import Cast
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from decimal import Decimal
 
 TUNING_CHOICES = [
     ('base', 'Базовая комплектация'),
@@ -10,6 +11,26 @@ TUNING_CHOICES = [
     ('premium', 'Premium Tuning (+30%)'),
 ]
 
+# Наценка за тюнинг в процентах от базовой цены (см. tuned_price)
+TUNING_MARKUPS = {
+    'base': 100,
+    'standard': 115,
+    'premium': 130,
+}
+
+# Цены с тюнингом хранятся прямо в строке машины (см. Car.price_standard):
+# по ним фильтрует и сортирует каталог и считается корзина
+TUNING_PRICE_FIELDS = {
+    'base': 'price',
+    'standard': 'price_standard',
+    'premium': 'price_premium',
+}
+
+
+def tuned_price(tuning):
+    """Цена с тюнингом в SQL: целые проценты и целочисленное деление, без ошибок округления."""
+    return Cast(F('price'), models.IntegerField()) * Value(TUNING_MARKUPS[tuning]) / Value(100)
+
 # 1. Категории (Марки или классы авто) [cite: 105]
 class Category(models.Model):
     name = models.CharField("Название", max_length=100)
@@ -42,18 +63,68 @@ class Car(models.Model):
     
     # Торговые данные
     price = models.DecimalField("Цена", max_digits=12, decimal_places=0)
+    # Вычисляемые STORED-колонки: база пересчитывает их при любом изменении price
+    # (save(), QuerySet.update(), bulk_create, импорт), рассинхронизации не бывает
+    price_standard = models.GeneratedField(
+        verbose_name="Цена со Standard Tuning",
+        expression=tuned_price('standard'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=0),
+        db_persist=True,
+    )
+    price_premium = models.GeneratedField(
+        verbose_name="Цена с Premium Tuning",
+        expression=tuned_price('premium'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=0),
+        db_persist=True,
+    )
     description = models.TextField("Общее описание")
     main_image = models.ImageField("Главное фото", upload_to='cars/') # [cite: 54]
     is_available = models.BooleanField("В наличии", default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Версия содержимого: меняется при каждом сохранении (ключи кэша карточек, см. store/cards.py)
+    updated_at = models.DateTimeField("Изменен", auto_now=True)
 
     class Meta:
         verbose_name = "Автомобиль"
         verbose_name_plural = "Автомобили"
+        # Частичные индексы под фильтры и сортировки каталога (только машины в наличии).
+        # Django превращает is_available=True в голое WHERE "is_available", поэтому
+        # SQLite не может искать по такому столбцу как по префиксу индекса,
+        # а вот частичный индекс с тем же условием подхватывает.
+        # Курсорная пагинация идет по (поле, id), отсюда id в конце.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], condition=Q(is_available=True), name='car_avail_created_idx'),
+            models.Index(fields=['price', 'id'], condition=Q(is_available=True), name='car_avail_price_idx'),
+            models.Index(fields=['price_standard', 'id'], condition=Q(is_available=True), name='car_avail_price_std_idx'),
+            models.Index(fields=['price_premium', 'id'], condition=Q(is_available=True), name='car_avail_price_prem_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], condition=Q(is_available=True), name='car_avail_cat_created_idx'),
+            models.Index(fields=['category', 'price', 'id'], condition=Q(is_available=True), name='car_avail_cat_price_idx'),
+            models.Index(fields=['brand', 'created_at', 'id'], condition=Q(is_available=True), name='car_avail_brand_idx'),
+            models.Index(fields=['country', 'created_at', 'id'], condition=Q(is_available=True), name='car_avail_country_idx'),
+            models.Index(fields=['year', 'created_at', 'id'], condition=Q(is_available=True), name='car_avail_year_idx'),
+        ]
 
     def __str__(self):
         return f"{self.brand} {self.model} ({self.tuning_details[:20]}...)"
 
+# 2.1. Полнотекстовый индекс машин - виртуальная таблица FTS5 (миграция 0008,
+# синхронизация в store/search.py). Модель без управления схемой нужна,
+# чтобы поиск был обычным JOIN по rowid = Car.id: Django сам дает таблице
+# псевдоним в подзапросах. document - скрытая колонка FTS5 с именем таблицы,
+# по ней работают MATCH и bm25()
+class FtsDocumentField(models.TextField):
+    pass
+
+class CarSearchEntry(models.Model):
+    car = models.OneToOneField(
+        Car, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_entry',
+    )
+    document = FtsDocumentField(db_column='store_car_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'store_car_fts'
+
 # 3. Профиль пользователя (Бонусная система) [cite: 23, 102]
 # Мы расширяем стандартного пользователя Django
 class Profile(models.Model):
@@ -77,6 +148,9 @@ class Order(models.Model):
         ('shipped', 'Доставлен'),
         ('cancelled', 'Отменен'),
     ]
+    # Разделы личного кабинета
+    ACTIVE_STATUSES = ('new', 'processing')
+    HISTORY_STATUSES = ('shipped', 'cancelled')
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Покупатель")
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
@@ -86,6 +160,13 @@ class Order(models.Model):
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        # Личный кабинет: заказы пользователя по статусам, от новых к старым (id - тай-брейк пагинации).
+        # Админка: курсорная навигация по всем заказам и по статусу
+        indexes = [
+            models.Index(fields=['user', 'status', 'created_at', 'id'], name='order_user_status_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.id} от {self.user.username}"
@@ -105,11 +186,14 @@ class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Итоги считаются в SQL одним запросом (см. store/pricing.py)
     def get_total_price(self):
-        return sum(item.get_total_item_price() for item in self.items.all())
+        from .pricing import cart_totals
+        return cart_totals(self.items.all())['total_price']
     
     def get_total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        from .pricing import cart_totals
+        return cart_totals(self.items.all())['total_items']
 
     def __str__(self):
         return f"Корзина {self.user.username}"
@@ -123,16 +207,123 @@ class CartItem(models.Model):
     tuning_type = models.CharField(max_length=10, choices=TUNING_CHOICES, default='base')
 
     def get_cost(self):
-        base_price = self.car.price
-        # Превращаем множители в Decimal (строки '1.15' обязательны для точности)
-        if self.tuning_type == 'standard':
-            price = base_price * Decimal('1.15')
-        elif self.tuning_type == 'premium':
-            price = base_price * Decimal('1.30')
-        else:
-            price = base_price
-        return int(price) # Возвращаем цену за 1 шт.
+        # Если позиция получена через store.pricing.price_items, цена уже посчитана в SQL
+        if hasattr(self, 'unit_price'):
+            return self.unit_price
+        # Цена с тюнингом уже посчитана базой в колонке машины (Car.price_standard и т.д.)
+        return int(getattr(self.car, TUNING_PRICE_FIELDS.get(self.tuning_type, 'price'))) # Возвращаем цену за 1 шт.
     
     def get_total_item_price(self):
         """Возвращает общую стоимость позиции (цена с тюнингом * количество) [cite: 17, 115]"""
-        return self.get_cost() * self.quantity
\ No newline at end of file
+        return self.get_cost() * self.quantity
+
+# 6. Резерв автомобиля
+# Каждая машина существует в единственном экземпляре, поэтому при добавлении
+# в корзину она резервируется за покупателем на короткое время (см. store/reservations.py).
+# Уникальность car гарантирует, что действующий резерв у машины только один.
+class Reservation(models.Model):
+    car = models.OneToOneField(Car, on_delete=models.CASCADE, related_name='reservation', verbose_name="Автомобиль")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations', verbose_name="Покупатель")
+    expires_at = models.DateTimeField("Действует до", db_index=True)
+
+    class Meta:
+        verbose_name = "Резерв"
+        verbose_name_plural = "Резервы"
+
+    def __str__(self):
+        return f"Резерв {self.car_id} за {self.user_id} до {self.expires_at:%H:%M}"
+
+# 7. Журнал массовых изменений каталога (store/bulk_updates.py).
+# Одна строка на пакет: что сделали, с какими машинами и как изменилась сумма цен
+class CarBatchUpdate(models.Model):
+    ACTION_CHOICES = [
+        ('price_percent', 'Цена, %'),
+        ('price_amount', 'Цена, ₽'),
+        ('availability', 'Наличие'),
+    ]
+
+    created_at = models.DateTimeField("Дата", auto_now_add=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Кто изменил")
+    action = models.CharField("Изменение", max_length=20, choices=ACTION_CHOICES)
+    value = models.DecimalField("Значение", max_digits=12, decimal_places=2)
+    filters = models.CharField("Отбор", max_length=255, blank=True)
+    cars = models.PositiveIntegerField("Машин")
+    total_before = models.DecimalField("Сумма цен до", max_digits=16, decimal_places=0, null=True)
+    total_after = models.DecimalField("Сумма цен после", max_digits=16, decimal_places=0, null=True)
+
+    class Meta:
+        verbose_name = "Массовое изменение"
+        verbose_name_plural = "Массовые изменения"
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.value} ({self.cars} машин)"
+
+# 8. Похожие машины (store/similar.py): для каждой машины в наличии -
+# ближайшие соседи по характеристикам, rank 0 - самая похожая.
+# Карточка машины читает их одним запросом по индексу (car, rank)
+class SimilarCar(models.Model):
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='neighbours', db_index=False)
+    similar = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='neighbour_of')
+    rank = models.PositiveSmallIntegerField("Место")
+    score = models.FloatField("Сходство")
+
+    class Meta:
+        verbose_name = "Похожая машина"
+        verbose_name_plural = "Похожие машины"
+        constraints = [
+            models.UniqueConstraint(fields=['car', 'rank'], name='similar_car_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.car_id} -> {self.similar_id} ({self.score:.3f})"
+
+# 9. "С этим также покупают" (store/copurchases.py): сколько раз модели
+# (марка + модель) покупали вместе в одном заказе. Каждая машина уникальна и
+# продается один раз, поэтому пары считаем по моделям, а не по конкретным машинам.
+# На модель хранится не больше COPURCHASES_PER_LINE самых частых пар
+class CoPurchase(models.Model):
+    brand = models.CharField("Марка", max_length=50)
+    model = models.CharField("Модель", max_length=50)
+    other_brand = models.CharField("Вместе с маркой", max_length=50)
+    other_model = models.CharField("Вместе с моделью", max_length=50)
+    count = models.PositiveIntegerField("Покупок вместе")
+
+    class Meta:
+        verbose_name = "Совместная покупка"
+        verbose_name_plural = "Совместные покупки"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['brand', 'model', 'other_brand', 'other_model'], name='copurchase_pair_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['brand', 'model', '-count'], name='copurchase_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.brand} {self.model} + {self.other_brand} {self.other_model}: {self.count}"
+
+# 10. Сводка продаж по дням (store/sales.py): проданные машины и выручка
+# в разрезе марки, категории, тюнинга и статуса заказа. Отчеты в админке
+# читают только ее, а не миллионы OrderItem
+class DailySales(models.Model):
+    date = models.DateField("Дата")
+    brand = models.CharField("Марка", max_length=50)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name="Категория", db_index=False)
+    tuning_type = models.CharField("Тюнинг", max_length=10, choices=TUNING_CHOICES)
+    status = models.CharField("Статус заказа", max_length=20, choices=Order.STATUS_CHOICES)
+    count = models.PositiveIntegerField("Продано машин")
+    revenue = models.DecimalField("Выручка", max_digits=16, decimal_places=2)
+
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+        # Уникальность заодно дает индекс по дате для отчетов за период
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'brand', 'category', 'tuning_type', 'status'], name='daily_sales_key_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.brand} {self.tuning_type} ({self.status}): {self.count}"
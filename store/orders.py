@@ -0,0 +1,88 @@
+from django.db import transaction
+
+from .cache import bump_catalog_version
+from .copurchases import record_purchase
+from .models import Car, CartItem, Order, OrderItem, Reservation
+from .pricing import PricedCart
+from .reservations import reserve_cars
+from .transactions import on_commit_logged, write_transaction
+from .sales import add_sales, order_sales
+
+
+class EmptyCartError(Exception):
+    """Оформлять нечего: корзина пуста (или уже оформлена параллельным запросом)."""
+
+
+class CarUnavailableError(Exception):
+    """Часть машин из корзины уже продана или зарезервирована другим покупателем."""
+
+
+def place_order(user):
+    """
+    Оформляет заказ из корзины пользователя одной транзакцией.
+
+    1. Берет блокировку записи сразу (в SQLite транзакция начинается с BEGIN IMMEDIATE,
+       см. store.transactions.write_transaction), поэтому параллельные оформления
+       выстраиваются в очередь, а не читают одну и ту же корзину.
+       Старые позиции с количеством больше 1 сводятся к одной машине.
+    2. Считает цены всех позиций одним запросом (store.pricing).
+    3. Резервирует машины за покупателем и превращает резервы в продажу:
+       is_available=False одним UPDATE только для машин, которые еще в продаже.
+       Если хотя бы одну машину уже купили - CarUnavailableError.
+    4. Создает Order и все OrderItem одним bulk_create: по строке на позицию,
+       OrderItem - это одна машина.
+    5. Очищает корзину.
+
+    Если что-то упадет посередине, транзакция откатится целиком:
+    полузаписанных заказов не бывает.
+    """
+    with write_transaction():
+        # select_for_update() здесь не нужен: SQLite его не поддерживает,
+        # от параллельных оформлений защищает BEGIN IMMEDIATE
+        items = CartItem.objects.filter(cart__user=user)
+        # Каждая машина - в единственном экземпляре: старая позиция x2
+        # не должна продать одну машину дважды
+        items.filter(quantity__gt=1).update(quantity=1)
+        priced_cart = PricedCart(items)
+        if not priced_cart:
+            raise EmptyCartError
+
+        # Резерв -> продажа. Проданные машины больше не видны в каталоге
+        car_ids = {item.car_id for item in priced_cart}
+        if not reserve_cars(user, car_ids):
+            raise CarUnavailableError
+        sold = Car.objects.filter(id__in=car_ids, is_available=True).update(is_available=False)
+        if sold != len(car_ids):
+            raise CarUnavailableError
+        Reservation.objects.filter(car_id__in=car_ids).delete()
+        # update() не шлет сигналов, поэтому кэши каталога сбрасываем сами
+        transaction.on_commit(bump_catalog_version)
+
+        order = Order.objects.create(
+            user=user,
+            total_price=priced_cart.total_price,
+            status='new'
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                car_id=item.car_id,
+                price=item.unit_price, # Цена с тюнингом, посчитанная в SQL
+                tuning_type=item.tuning_type,
+            )
+            for item in priced_cart
+        ])
+
+        CartItem.objects.filter(id__in=[item.id for item in priced_cart]).delete()
+
+        # "С этим также покупают": счетчики пар моделей - после коммита,
+        # чтобы не удлинять транзакцию оформления. Заказ к этому времени уже сохранен:
+        # сбой счетчиков только пишется в лог (пропуски исправит rebuild_copurchases)
+        lines = {(item.car.brand, item.car.model) for item in priced_cart}
+        on_commit_logged(
+            lambda: record_purchase(lines), f'счетчики "С этим также покупают" для заказа #{order.pk} (rebuild_copurchases)'
+        )
+        # Сводка продаж для отчетов - тоже после коммита, по уже посчитанным ценам (расхождения исправит rebuild_sales)
+        sales = order_sales(order, priced_cart)
+        on_commit_logged(lambda: add_sales(sales), f'сводка продаж для заказа #{order.pk} (rebuild_sales)')
+    return order
@@ -0,0 +1,151 @@
+import hashlib
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .cache import asingle_flight, cache_key, get_catalog_version, single_flight
+from .carts import CART_SESSION_KEY
+
+PAGE_CACHE_TIMEOUT = 60 * 10
+
+
+def is_anonymous(request):
+    # Без cookie сессии пользователь точно аноним - проверяем без обращения к базе
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return True
+    return not request.user.is_authenticated
+
+
+async def ais_anonymous(request):
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return True
+    user = await request.auser()
+    return not user.is_authenticated
+
+
+def normalized_query(request, params):
+    """Только известные параметры, без пустых значений и в одном порядке."""
+    return urlencode(sorted(
+        (key, value) for key in params for value in request.GET.getlist(key) if value != ''
+    ))
+
+
+def _is_cacheable(request, response):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    # Страница с CSRF-токеном или изменившейся сессией персональна
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    session = getattr(request, 'session', None)
+    return not (session is not None and session.modified)
+
+
+def _bypasses_cache(request):
+    # флеш-сообщения персональны
+    return request.method not in ('GET', 'HEAD') or 'messages' in request.COOKIES
+
+
+def has_session_cart(request):
+    # У анонима с корзиной в шапке ее бейдж (корзина - в сессии, см. store/carts.py)
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return False
+    return bool((request.session.get(CART_SESSION_KEY) or {}).get('lines'))
+
+
+async def ahas_session_cart(request):
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return False
+    return bool((await request.session.aget(CART_SESSION_KEY) or {}).get('lines'))
+
+
+def _page_key(request, params):
+    # Версия каталога - в самой записи: после ее смены страница устарела, но еще
+    # отдается, пока новую строит один запрос (store.cache.single_flight)
+    return cache_key('page', request.path, normalized_query(request, params))
+
+
+def _make_entry(response):
+    return {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'etag': quote_etag(hashlib.md5(response.content).hexdigest()),
+        'last_modified': int(time.time()),
+    }
+
+
+def _cached_response(request, entry, response=None):
+    if response is None:
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    response['Cache-Control'] = 'max-age=0, must-revalidate'
+    patch_vary_headers(response, ('Cookie',))
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified'], response=response
+    )
+
+
+def _respond(request, entry, produced):
+    # produced - ответ, если страницу построил этот запрос (в нем могут быть свои заголовки)
+    if not produced:
+        return _cached_response(request, entry)
+    if entry is None:
+        return produced[0]
+    return _cached_response(request, entry, produced[0])
+
+
+def anonymous_page_cache(params=(), timeout=PAGE_CACHE_TIMEOUT):
+    """
+    Кэш целых страниц для анонимных посетителей.
+
+    Ключ: путь + нормализованные GET-параметры из params + версия каталога
+    (ее поднимают сигналы Car/Category, см. store/signals.py).
+    На If-None-Match / If-Modified-Since отвечает 304 прямо из кэша, без базы.
+    Одновременные промахи по одной странице строит один запрос (single_flight).
+    Авторизованные пользователи и анонимы с корзиной кэш не используют:
+    у них в шапке имя и корзина. Подходит и для обычных, и для async-представлений.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if (
+                    _bypasses_cache(request)
+                    or not await ais_anonymous(request)
+                    or await ahas_session_cart(request)
+                ):
+                    return await view(request, *args, **kwargs)
+
+                produced = []
+
+                async def produce():
+                    response = await view(request, *args, **kwargs)
+                    produced.append(response)
+                    return _make_entry(response) if _is_cacheable(request, response) else None
+
+                entry = await asingle_flight(_page_key(request, params), produce, timeout, get_catalog_version())
+                return _respond(request, entry, produced)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if _bypasses_cache(request) or not is_anonymous(request) or has_session_cart(request):
+                return view(request, *args, **kwargs)
+
+            produced = []
+
+            def produce():
+                response = view(request, *args, **kwargs)
+                produced.append(response)
+                return _make_entry(response) if _is_cacheable(request, response) else None
+
+            entry = single_flight(_page_key(request, params), produce, timeout, get_catalog_version())
+            return _respond(request, entry, produced)
+        return wrapper
+    return decorator
@@ -0,0 +1,160 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+from .cache import single_flight
+
+# Сколько секунд живет посчитанное число строк для отфильтрованных списков
+COUNT_CACHE_TIMEOUT = 60
+
+
+class KeysetPage:
+    """Одна страница курсорной пагинации (аналог django.core.paginator.Page)."""
+
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """
+    Курсорная (keyset) пагинация по паре (поле сортировки, id).
+
+    Вместо OFFSET, который заставляет базу пролистать все предыдущие строки,
+    следующая страница выбирается условием "(поле, id) после последней строки".
+    При наличии индекса (..., поле, id) стоимость любой страницы одинакова.
+    """
+
+    def __init__(self, queryset, ordering, per_page=12):
+        self.queryset = queryset
+        self.descending = ordering.startswith('-')
+        self.field_name = ordering.lstrip('-')
+        # Сортировать можно и по аннотации (например, по рангу поиска)
+        annotation = queryset.query.annotations.get(self.field_name)
+        if annotation is not None:
+            self.field = annotation.output_field
+        else:
+            self.field = queryset.model._meta.get_field(self.field_name)
+        self.per_page = per_page
+
+    # --- Кодирование курсора ---
+
+    def encode_cursor(self, direction, row):
+        value = self._get(row, self.field_name)
+        value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        payload = json.dumps([direction, value, self._get(row, 'id')], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, значение, id) или None, если курсор битый."""
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, raw_value, pk = json.loads(base64.urlsafe_b64decode(padded))
+            if direction not in ('n', 'p'):
+                return None
+            return direction, self.field.to_python(raw_value), int(pk)
+        except (ValueError, TypeError, ValidationError, binascii.Error):
+            return None
+
+    # --- Выборка страницы ---
+
+    def get_page(self, cursor=None):
+        queryset, position = self._page_queryset(cursor)
+        return self._build_page(list(queryset[:self.per_page + 1]), position)
+
+    async def aget_page(self, cursor=None):
+        """То же для async-представлений (async ORM)."""
+        queryset, position = self._page_queryset(cursor)
+        return self._build_page([row async for row in queryset[:self.per_page + 1]], position)
+
+    def _page_queryset(self, cursor):
+        position = self.decode_cursor(cursor)
+        backwards = position is not None and position[0] == 'p'
+        # Назад идём в обратном порядке, а потом разворачиваем результат
+        descending = self.descending != backwards
+
+        queryset = self.queryset
+        if position is not None:
+            queryset = queryset.filter(self._seek(position[1], position[2], descending))
+
+        prefix = '-' if descending else ''
+        return queryset.order_by(f'{prefix}{self.field_name}', f'{prefix}id'), position
+
+    def _build_page(self, rows, position):
+        backwards = position is not None and position[0] == 'p'
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if backwards:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor('n', rows[-1]) if rows and has_next else None,
+            prev_cursor=self.encode_cursor('p', rows[0]) if rows and has_previous else None,
+        )
+
+    def _seek(self, value, pk, descending):
+        # (поле, id) < (значение, pk) для убывания и > для возрастания.
+        # Лишнее условие поле <= значение даёт SQLite границу диапазона по индексу.
+        op, op_or_equal = ('lt', 'lte') if descending else ('gt', 'gte')
+        return Q(**{f'{self.field_name}__{op_or_equal}': value}) & (
+            Q(**{f'{self.field_name}__{op}': value}) | Q(**{f'id__{op}': pk})
+        )
+
+    @staticmethod
+    def _get(row, name):
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для админки с оценкой числа строк вместо COUNT(*) на каждый показ.
+
+    Без фильтров число строк оценивается по MAX(id) (один переход по индексу),
+    для отфильтрованного списка точный COUNT кэшируется на COUNT_CACHE_TIMEOUT секунд.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        if not queryset.query.where:
+            return queryset.aggregate(estimate=Max('id'))['estimate'] or 0
+        sql, params = queryset.query.sql_with_params()
+        digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+        # COUNT по миллиону заказов долгий: одновременные промахи считает один запрос
+        return single_flight(f'store:count:{digest}', queryset.count, COUNT_CACHE_TIMEOUT)
@@ -0,0 +1,58 @@
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.db.models.functions import Coalesce
+
+from .models import TUNING_PRICE_FIELDS
+
+
+def unit_price_expression(car='car', tuning='tuning_type'):
+    """
+    Цена за 1 шт. с учетом тюнинга: готовая колонка машины
+    (price, price_standard или price_premium - их считает сама база, см. Car).
+    """
+    return Case(
+        *[When(**{tuning: code}, then=F(f'{car}__{field}')) for code, field in TUNING_PRICE_FIELDS.items()],
+        default=F(f'{car}__price'),
+        output_field=IntegerField(),
+    )
+
+
+def line_total_expression(car='car', tuning='tuning_type', quantity='quantity'):
+    """Стоимость позиции: цена с тюнингом * количество."""
+    return unit_price_expression(car, tuning) * F(quantity)
+
+
+def price_items(items):
+    """Аннотирует queryset CartItem ценами (unit_price, line_total) и подтягивает машины."""
+    return items.select_related('car').annotate(
+        unit_price=unit_price_expression(),
+        line_total=line_total_expression(),
+    ).order_by('id')
+
+
+def cart_totals(items):
+    """Итоги корзины одним агрегатным запросом, без выборки строк (для бейджа в шапке)."""
+    return items.aggregate(
+        total_price=Coalesce(Sum(line_total_expression()), 0),
+        total_items=Coalesce(Sum('quantity'), 0),
+    )
+
+
+class PricedCart:
+    """
+    Позиции корзины с ценами и итоги - всё из одного запроса.
+    Можно передать и готовый список позиций с unit_price/line_total (корзина из сессии).
+    """
+
+    def __init__(self, items):
+        self.items = items if isinstance(items, list) else list(price_items(items))
+        self.total_price = sum(item.line_total for item in self.items)
+        self.total_items = sum(item.quantity for item in self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Car, Reservation
+from .transactions import write_transaction
+
+# Сколько держится резерв после добавления в корзину / начала оформления
+RESERVATION_TTL = timedelta(minutes=15)
+
+
+def reserve_cars(user, car_ids, ttl=RESERVATION_TTL):
+    """
+    Резервирует машины за пользователем (или продлевает его резерв).
+
+    Чужой действующий резерв не трогаем, просроченный - перехватываем.
+    Блокировки на весь каталог нет: каждая машина - своя строка
+    с уникальным car_id, которая и служит compare-and-set.
+    Возвращает True, если после вызова все машины зарезервированы за user.
+    """
+    car_ids = set(car_ids)
+    if not car_ids:
+        return True
+    now = timezone.now()
+    expires_at = now + ttl
+    with write_transaction():
+        # 1. Продлеваем свои резервы и перехватываем просроченные одним UPDATE
+        Reservation.objects.filter(car_id__in=car_ids).filter(
+            Q(user=user) | Q(expires_at__lte=now)
+        ).update(user=user, expires_at=expires_at)
+
+        # 2. Создаем резервы для свободных машин (только тех, что еще в продаже)
+        available = Car.objects.filter(id__in=car_ids, is_available=True).values_list('id', flat=True)
+        Reservation.objects.bulk_create(
+            [Reservation(car_id=car_id, user=user, expires_at=expires_at) for car_id in available],
+            ignore_conflicts=True, # уже зарезервированные (кем угодно) пропускаем
+        )
+
+        # 3. Проверяем, что все машины теперь наши
+        held = Reservation.objects.filter(car_id__in=car_ids, user=user, car__is_available=True).count()
+    return held == len(car_ids)
+
+
+def release_cars(user, car_ids):
+    """Снимает резервы пользователя (например, машину удалили из корзины)."""
+    return Reservation.objects.filter(user=user, car_id__in=car_ids).delete()[0]
+
+
+def release_expired(now=None):
+    """Снимает все просроченные резервы одним DELETE. Возвращает их количество."""
+    return Reservation.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
@@ -0,0 +1,45 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA = 'replica'
+
+# С реплики читается только каталог. Заказы (личный кабинет, админка, где по ним
+# меняют статусы), корзина, резервы, сессии и пользователи - только с основной базы:
+# реплика отстает на интервал sync_replica
+REPLICA_MODELS = {'store.car', 'store.category', 'store.profile'}
+
+# Читать с основной базы: запрос уже что-то записал или недавно писал (см. store/middleware.py)
+_wrote = ContextVar('wrote_to_primary', default=False)
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+
+class PrimaryReplicaRouter:
+    """
+    Запись - в основную базу (default), чтение каталога - с реплики.
+
+    Реплика догоняет основную базу с задержкой (manage.py sync_replica),
+    поэтому после записи чтение идет с основной базы, чтобы сотрудник
+    сразу видел свою правку. Внутри транзакции тоже читаем с основной.
+    """
+
+    def db_for_read(self, model, **hints):
+        if REPLICA not in settings.DATABASES or model._meta.label_lower not in REPLICA_MODELS:
+            return None
+        if _wrote.get() or _pinned.get() or connections['default'].in_atomic_block:
+            return 'default'
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in REPLICA_MODELS:
+            _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплику вместе с данными
+        return db != REPLICA
@@ -0,0 +1,166 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import TUNING_CHOICES, DailySales, Order, OrderItem
+from .transactions import write_transaction
+
+# Сводка продаж по дням (DailySales): число проданных машин и выручка
+# в разрезе дата / марка / категория / тюнинг / статус заказа.
+# Обновляется приращениями: оформление заказа (store/orders.py, после коммита)
+# и смена статуса (change_status, действия OrderAdmin). Другие правки заказов
+# в админке (позиции, удаление) сводку не трогают - их выравнивает rebuild_sales.
+
+SALES_KEY = ('date', 'brand', 'category_id', 'tuning_type', 'status')
+REBUILD_CHUNK_DAYS = 31
+REPORT_PERIODS = {'day': F('date'), 'week': TruncWeek('date'), 'month': TruncMonth('date')}
+
+
+def aggregate_items(items):
+    """Позиции заказов -> {(date, brand, category_id, tuning_type, status): [count, revenue]} одним GROUP BY."""
+    rows = (
+        items.order_by()
+        .values(
+            'tuning_type',
+            date=TruncDate('order__created_at'),
+            brand=F('car__brand'),
+            category_id=F('car__category_id'),
+            status=F('order__status'),
+        )
+        .annotate(count=Count('id'), revenue=Sum('price'))
+    )
+    return {tuple(row[field] for field in SALES_KEY): [row['count'], row['revenue']] for row in rows}
+
+
+@write_transaction()
+def add_sales(deltas):
+    """
+    Прибавляет к сводке {ключ: [count, revenue]} (значения могут быть отрицательными).
+    Существующие строки - UPDATE с F(), новые - одним bulk_create, опустевшие удаляются.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+    # Строки тех же дней (индекс по дате), лишние отсеиваются в Python
+    stored = DailySales.objects.filter(date__in={key[0] for key in deltas}).values('pk', *SALES_KEY)
+    existing = {tuple(row[field] for field in SALES_KEY): row['pk'] for row in stored}
+    for key, (count, revenue) in deltas.items():
+        if key in existing:
+            DailySales.objects.filter(pk=existing[key]).update(count=F('count') + count, revenue=F('revenue') + revenue)
+    DailySales.objects.bulk_create([
+        DailySales(**dict(zip(SALES_KEY, key)), count=count, revenue=revenue)
+        for key, (count, revenue) in deltas.items()
+        if key not in existing
+    ])
+    DailySales.objects.filter(pk__in=existing.values(), count__lte=0).delete()
+
+
+def order_sales(order, priced_cart):
+    """Приращение сводки от только что оформленного заказа - по уже посчитанной корзине, без запросов."""
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    date = timezone.localdate(order.created_at)
+    for item in priced_cart:
+        delta = deltas[(date, item.car.brand, item.car.category_id, item.tuning_type, order.status)]
+        delta[0] += item.quantity
+        delta[1] += item.unit_price * item.quantity
+    return dict(deltas)
+
+
+@write_transaction()
+def change_status(orders, status):
+    """
+    Переводит заказы в статус status и переносит их продажи в сводке
+    из строк старого статуса в строки нового. Возвращает число измененных заказов.
+    """
+    orders = orders.exclude(status=status)
+    moved = aggregate_items(OrderItem.objects.filter(order__in=orders.values('id')))
+    updated = orders.update(status=status)
+
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for (*key, old_status), (count, revenue) in moved.items():
+        for target, sign in ((old_status, -1), (status, 1)):
+            delta = deltas[(*key, target)]
+            delta[0] += sign * count
+            delta[1] += sign * revenue
+    add_sales(deltas)
+    return updated
+
+
+def rebuild_sales(chunk_days=REBUILD_CHUNK_DAYS, since=None, until=None):
+    """
+    Пересчитывает сводку по истории заказов кусками по chunk_days дней.
+    Каждый кусок - своя транзакция (удалить строки периода, вставить агрегаты),
+    поэтому оформление заказов ждет не дольше одного куска.
+    Возвращает (число дней, число строк сводки).
+    """
+    bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+    if bounds['first'] is None:
+        DailySales.objects.all().delete()
+        return 0, 0
+    since = since or timezone.localdate(bounds['first'])
+    until = until or timezone.localdate(bounds['last'])
+
+    saved = 0
+    start = since
+    while start <= until:
+        end = min(start + timedelta(days=chunk_days - 1), until)
+        with transaction.atomic():
+            DailySales.objects.filter(date__range=(start, end)).delete()
+            # Граница по created_at, а не TruncDate: так работает индекс order_created_idx
+            started_at = timezone.make_aware(datetime.combine(start, time.min))
+            ended_at = started_at + timedelta(days=(end - start).days + 1)
+            items = OrderItem.objects.filter(order__created_at__gte=started_at, order__created_at__lt=ended_at)
+            rows = DailySales.objects.bulk_create([
+                DailySales(**dict(zip(SALES_KEY, key)), count=count, revenue=revenue)
+                for key, (count, revenue) in aggregate_items(items).items()
+            ])
+        saved += len(rows)
+        start = end + timedelta(days=1)
+    return (until - since).days + 1, saved
+
+
+def sales_report(since=None, until=None, statuses=None, period='day'):
+    """
+    Отчет для админки - только по сводке: итоги, динамика по шагам period
+    и разрезы по марке, категории, тюнингу и статусу. У каждой строки share -
+    доля от максимума выручки в своем списке (ширина полосы на графике).
+    """
+    rows = DailySales.objects.all()
+    if since:
+        rows = rows.filter(date__gte=since)
+    if until:
+        rows = rows.filter(date__lte=until)
+    if statuses:
+        rows = rows.filter(status__in=statuses)
+
+    def breakdown(group, order_by='-revenue'):
+        result = list(
+            rows.order_by().values(label=group)
+            .annotate(count=Sum('count'), revenue=Sum('revenue'))
+            .order_by(order_by)
+        )
+        top = max((row['revenue'] for row in result), default=0) or 1
+        for row in result:
+            row['share'] = round(100 * row['revenue'] / top, 1)
+        return result
+
+    def labelled(result, choices):
+        for row in result:
+            row['label'] = dict(choices).get(row['label'], row['label'])
+        return result
+
+    totals = rows.aggregate(count=Sum('count'), revenue=Sum('revenue'))
+    return {
+        'count': totals['count'] or 0,
+        'revenue': totals['revenue'] or 0,
+        'timeline': breakdown(REPORT_PERIODS[period], order_by='label'),
+        'brands': breakdown(F('brand')),
+        'categories': breakdown(F('category__name')),
+        'tuning': labelled(breakdown(F('tuning_type')), TUNING_CHOICES),
+        'statuses': labelled(breakdown(F('status')), Order.STATUS_CHOICES),
+    }
@@ -0,0 +1,102 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Func, Lookup, Value
+
+from .models import Car, FtsDocumentField
+
+# Виртуальная таблица FTS5 (см. миграцию 0008_car_search_index)
+FTS_TABLE = 'store_car_fts'
+FTS_COLUMNS = ('brand', 'model', 'tuning_details', 'description')
+# Веса колонок для BM25: совпадение в марке/модели важнее, чем в описании
+BM25_WEIGHTS = (10.0, 10.0, 3.0, 1.0)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(text):
+    """
+    Превращает пользовательский ввод в безопасный запрос MATCH.
+
+    Каждое слово берется в кавычки (чтобы операторы FTS5 из ввода не работали)
+    и ищется по префиксу: "twin turbo" -> "twin"* "turbo"* (все слова обязательны).
+    """
+    words = WORD_RE.findall(text or '')
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+@FtsDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+def search_queryset(queryset, text):
+    """
+    Оставляет в queryset машины, подходящие под поисковую строку,
+    и добавляет аннотацию search_rank (BM25, меньше - релевантнее).
+
+    Таблица FTS присоединяется к машинам (rowid = id), MATCH выполняется
+    один раз на запрос, а bm25() считается по уже найденной строке -
+    в том числе в условии курсора пагинации.
+    """
+    match = build_match_query(text)
+    if not match:
+        return queryset
+    return queryset.filter(search_entry__document__match=match).annotate(
+        search_rank=Func(
+            F('search_entry__document'), *[Value(weight) for weight in BM25_WEIGHTS],
+            function='bm25', output_field=FloatField(),
+        ),
+    )
+
+
+# --- Синхронизация индекса ---
+
+def index_car(car):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [car.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)',
+            [car.pk] + [getattr(car, column) for column in FTS_COLUMNS],
+        )
+
+
+def index_cars(car_ids):
+    """Переиндексирует набор машин двумя запросами (для массовых операций без сигналов)."""
+    car_ids = list(car_ids)
+    if not car_ids:
+        return
+    columns = ', '.join(FTS_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(car_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', car_ids)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {columns}) '
+            f'SELECT id, {columns} FROM {Car._meta.db_table} WHERE id IN ({placeholders})',
+            car_ids,
+        )
+
+
+def remove_car(car_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [car_id])
+
+
+def rebuild_index():
+    """Полностью пересобирает индекс одним INSERT ... SELECT. Возвращает число машин."""
+    columns = ', '.join(FTS_COLUMNS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, {columns}) '
+            f'SELECT id, {columns} FROM {Car._meta.db_table}'
+        )
+        count = cursor.rowcount
+        # Сливаем сегменты индекса в один - быстрее последующий поиск
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return count
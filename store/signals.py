@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .cards import delete_car_cards
+from .carts import SessionCart, merge_on_login
+from .images import generate_derivatives_for
+from .instrumentation import record_query
+from .models import Car, Category, SimilarCar
+from .routers import REPLICA
+from .search import index_car, remove_car
+from .similar import update_similar_cars
+from .transactions import on_commit_logged
+
+
+# Любое изменение машины или категории делает устаревшими фасеты и кэши витрины
+@receiver([post_save, post_delete], sender=Car)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+# Полнотекстовый индекс (FTS5) держим в синхронизации с таблицей машин
+@receiver(post_save, sender=Car)
+def update_search_index(sender, instance, **kwargs):
+    index_car(instance)
+
+
+@receiver(post_delete, sender=Car)
+def delete_from_search_index(sender, instance, **kwargs):
+    remove_car(instance.pk)
+
+
+# Похожие машины: пересчитываем только затронутые строки, после коммита.
+# Машина к этому времени уже сохранена: сбой пересчета только пишется в лог
+@receiver(post_save, sender=Car)
+def update_similar_after_save(sender, instance, **kwargs):
+    on_commit_logged(
+        lambda: update_similar_cars([instance.pk]), f'похожие машины для #{instance.pk} (rebuild_similar_cars)'
+    )
+
+
+@receiver(pre_delete, sender=Car)
+def update_similar_after_delete(sender, instance, **kwargs):
+    # Кто ссылался на машину - узнаем до удаления (строки удалятся каскадом)
+    # и id запоминаем сейчас: после удаления у instance pk уже None
+    car_id = instance.pk
+    affected = list(SimilarCar.objects.filter(similar=instance).values_list('car_id', flat=True))
+    on_commit_logged(
+        lambda: update_similar_cars([car_id], affected), f'похожие машины после удаления #{car_id} (rebuild_similar_cars)'
+    )
+
+
+# Уменьшенные копии фото для srcset. После коммита, чтобы не держать
+# блокировку записи SQLite, пока Pillow пережимает фото
+@receiver(post_save, sender=Car)
+def generate_car_image_derivatives(sender, instance, **kwargs):
+    def generate():
+        # Карточка могла закэшироваться до появления копий - пусть перерисуется с srcset
+        if generate_derivatives_for(instance.main_image):
+            delete_car_cards([instance])
+    transaction.on_commit(generate)
+
+
+@receiver(post_save, sender=Category)
+def generate_category_image_derivatives(sender, instance, **kwargs):
+    transaction.on_commit(lambda: generate_derivatives_for(instance.image))
+
+
+# Корзина в сессии (store/carts.py): при входе анонимная корзина сливается с сохраненной,
+# при выходе (сессия будет очищена) несохраненные изменения переносятся в базу
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is None or not hasattr(request, 'session'):
+        return
+    dropped = merge_on_login(request, user)
+    if dropped:
+        messages.warning(
+            request,
+            f'Машин, которые уже продали или зарезервировали другие покупатели: {dropped}. Они убраны из корзины.',
+            fail_silently=True, # вход без MessageMiddleware (Client.force_login)
+        )
+
+
+@receiver(user_logged_out)
+def flush_cart_on_logout(sender, request, user, **kwargs):
+    if request is None or user is None or not hasattr(request, 'session'):
+        return
+    SessionCart(request, user).flush()
+
+
+# Настройки соединения SQLite (WAL, synchronous и т.п.) из settings.SQLITE_PRAGMAS,
+# выполняются один раз на каждое новое соединение
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if connection.alias == REPLICA:
+        # Реплику sync_replica подменяет целиком, в режиме DELETE: переключение в WAL было бы записью
+        pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+# Замеры SQL для PerformanceMiddleware: обертка на каждом новом соединении
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -0,0 +1,290 @@
+import threading
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import _fresh_version
+from .models import Car, SimilarCar
+
+# Сколько соседей хранить на машину (карточка показывает первые 3 из тех, что в наличии)
+NEIGHBOURS = 8
+# Сколько строк матрицы сходства считать за раз: batch x все машины float32
+BATCH_CELLS = 20_000_000
+WRITE_BATCH = 5000
+# Матрица векторов с нормировкой (EmbeddingSpace) живет в памяти процесса вместе с номером версии.
+# В кэше - только общий счетчик версий и журнал: какие машины изменила каждая версия.
+# Процесс, отставший на несколько версий, дочитывает из базы только эти машины,
+# отставший сильнее (или после forget_space) - загружает пространство целиком.
+SPACE_VERSION_KEY = 'store:similar:version'
+SPACE_CHANGES_KEY = 'store:similar:changes:{}'
+SPACE_CHANGES_KEEP = 100 # на сколько версий можно отстать, чтобы догнать по журналу
+SPACE_CHANGES_TIMEOUT = 24 * 60 * 60
+
+# (версия, EmbeddingSpace) этого процесса; RLock - update_similar_cars вызывает load_space
+_space_lock = threading.RLock()
+_local_space = None
+
+# Вес групп признаков: числовые характеристики и one-hot категориальных полей
+NUMERIC_WEIGHT = 1.0
+CATEGORICAL_WEIGHTS = {
+    'brand': 1.0,
+    'body_type': 1.0,
+    'category_id': 1.0,
+    'country': 0.5,
+}
+FEATURE_FIELDS = ('id', 'year', 'engine_power', 'price', 'mileage', *CATEGORICAL_WEIGHTS)
+
+
+def _numeric_features(columns):
+    return np.column_stack([
+        np.array(columns[1], dtype=np.float64),
+        np.array(columns[2], dtype=np.float64),
+        np.log1p(np.array(columns[3], dtype=np.float64)),
+        np.log1p(np.array(columns[4], dtype=np.float64)),
+    ])
+
+
+class EmbeddingSpace:
+    """
+    Векторы машин в наличии вместе с нормировкой, по которой они посчитаны:
+    среднее и разброс числовых признаков, словари значений категориальных.
+
+    Векторы - стандартизованные год, мощность, log цены, log пробега и one-hot
+    марки, кузова, категории и страны. Строки нормированы, поэтому сходство
+    двух машин - скалярное произведение (косинус). ids отсортированы,
+    thresholds - сходство каждой машины с ее последним соседом.
+
+    Хранится в памяти процесса (load_space): после сохранения одной машины
+    пересчитывается только ее вектор, нормировка остается от последнего
+    rebuild_similar_cars или полной загрузки.
+    """
+
+    def __init__(self, rows):
+        # rows: кортежи FEATURE_FIELDS в порядке id
+        columns = list(zip(*rows)) or [()] * len(FEATURE_FIELDS)
+        if rows:
+            numeric = _numeric_features(columns)
+            std = numeric.std(axis=0)
+            self.mean, self.std = numeric.mean(axis=0), np.where(std > 0, std, 1)
+        else:
+            self.mean, self.std = np.zeros(4), np.ones(4)
+        self.vocabularies = [
+            {value: code for code, value in enumerate(sorted({str(value) for value in values}))}
+            for values in columns[5:]
+        ]
+        self.ids = np.array(columns[0], dtype=np.int64)
+        self.vectors = self.embed(rows)
+        self.thresholds = np.full(len(self.ids), -np.inf, dtype=np.float32)
+
+    def embed(self, rows):
+        """Векторы машин rows (кортежи FEATURE_FIELDS) в этой нормировке, float32."""
+        if not rows:
+            return np.zeros((0, 4 + sum(map(len, self.vocabularies))), dtype=np.float32)
+        columns = list(zip(*rows))
+        numeric = (_numeric_features(columns) - self.mean) / self.std
+        parts = [numeric * NUMERIC_WEIGHT / np.sqrt(numeric.shape[1])]
+        # Значения, которых не было при расчете нормировки (новая марка): своего столбца
+        # у них нет - в скалярные произведения он дал бы ноль, - но в норму вектора они входят
+        unseen = np.zeros(len(rows))
+        for vocabulary, weight, values in zip(self.vocabularies, CATEGORICAL_WEIGHTS.values(), columns[5:]):
+            one_hot = np.zeros((len(rows), len(vocabulary)))
+            for row, value in enumerate(values):
+                code = vocabulary.get(str(value))
+                if code is None:
+                    unseen[row] += weight ** 2
+                else:
+                    one_hot[row, code] = weight
+            parts.append(one_hot)
+
+        vectors = np.hstack(parts)
+        norms = np.sqrt((vectors ** 2).sum(axis=1) + unseen)
+        return (vectors / np.where(norms > 0, norms, 1)[:, None]).astype(np.float32)
+
+    def positions(self, car_ids):
+        """Позиции машин car_ids в матрице (тех, что в ней есть), по возрастанию."""
+        car_ids = np.unique(np.asarray(list(car_ids), dtype=np.int64))
+        positions = np.searchsorted(self.ids, car_ids)
+        found = positions < len(self.ids)
+        found[found] = self.ids[positions[found]] == car_ids[found]
+        return positions[found]
+
+    def replace(self, car_ids, rows):
+        """Убирает машины car_ids и добавляет строки rows (те из них, что в наличии)."""
+        keep = ~np.isin(self.ids, np.asarray(list(car_ids), dtype=np.int64))
+        ids = np.concatenate([self.ids[keep], np.array([row[0] for row in rows], dtype=np.int64)])
+        order = np.argsort(ids, kind='stable')
+        self.ids = ids[order]
+        self.vectors = np.concatenate([self.vectors[keep], self.embed(rows)])[order]
+        self.thresholds = np.concatenate([
+            self.thresholds[keep], np.full(len(rows), -np.inf, dtype=np.float32),
+        ])[order]
+
+    def set_thresholds(self, positions, neighbour_rows):
+        """Пороги для машин positions по их только что посчитанным соседям (SimilarCar)."""
+        self.thresholds[positions] = -np.inf
+        last = {row.car_id: row.score for row in neighbour_rows if row.rank == NEIGHBOURS - 1}
+        found = self.positions(last)
+        self.thresholds[found] = [last[car_id] for car_id in self.ids[found].tolist()]
+
+
+    def apply_changes(self, changed_ids, recomputed_ids):
+        """Догоняет чужие изменения: заново читает машины changed_ids и пороги машин recomputed_ids."""
+        self.replace(changed_ids, list(Car.objects.filter(id__in=changed_ids, is_available=True).values_list(*FEATURE_FIELDS)))
+        last = SimilarCar.objects.filter(car_id__in=recomputed_ids, rank=NEIGHBOURS - 1).only('car_id', 'rank', 'score')
+        self.set_thresholds(self.positions(recomputed_ids), last)
+
+
+def _space_version():
+    version = cache.get(SPACE_VERSION_KEY)
+    if version is None:
+        cache.add(SPACE_VERSION_KEY, _fresh_version(), None)
+        version = cache.get(SPACE_VERSION_KEY)
+    return version
+
+
+def _bump_space_version():
+    try:
+        return cache.incr(SPACE_VERSION_KEY)
+    except ValueError:
+        # Ключа нет (еще не создан или вытеснен): новая версия не совпадет ни с одной старой
+        version = _fresh_version()
+        cache.set(SPACE_VERSION_KEY, version, None)
+        return version
+
+
+def _catch_up(local_version, space, version):
+    """Пространство версии local_version, доведенное по журналу до version, или None."""
+    if local_version == version:
+        return space
+    if not 0 < version - local_version <= SPACE_CHANGES_KEEP:
+        return None
+    keys = [SPACE_CHANGES_KEY.format(number) for number in range(local_version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        # Записи вытеснены или версия без записи (forget_space, rebuild_similar_cars)
+        return None
+    changed, recomputed = set(), set()
+    for changed_ids, recomputed_ids in changes.values():
+        changed.update(changed_ids)
+        recomputed.update(recomputed_ids)
+    space.apply_changes(changed, recomputed)
+    return space
+
+
+def load_space():
+    """
+    Пространство векторов текущей версии. Если процесс отстал, он догоняет
+    чужие изменения по журналу - два запроса только по измененным машинам.
+    При первом вызове, после forget_space или большом отставании -
+    все машины в наличии и пороги из таблицы соседей.
+    """
+    global _local_space
+    with _space_lock:
+        version = _space_version()
+        # Пока догоняет журнал, пространство не соответствует ни одной версии
+        local, _local_space = _local_space, None
+        space = _catch_up(*local, version) if local else None
+        if space is None:
+            space = EmbeddingSpace(list(Car.objects.filter(is_available=True).order_by('id').values_list(*FEATURE_FIELDS)))
+            last = SimilarCar.objects.filter(rank=NEIGHBOURS - 1).only('car_id', 'rank', 'score')
+            space.set_thresholds([], last)
+        _local_space = (version, space)
+        return space
+
+
+def forget_space():
+    """Сбросить векторы во всех процессах: машины менялись без сигналов (импорт, массовые изменения)."""
+    # Версия без записи в журнале: догнать ее нельзя, все загрузят пространство заново
+    cache.delete(SPACE_CHANGES_KEY.format(_bump_space_version()))
+
+
+def nearest_neighbours(vectors, positions, k=NEIGHBOURS):
+    """
+    Top-k соседей для строк positions пакетами (матрица batch x N, без циклов по машинам).
+    Возвращает пары (позиция, позиции соседей, сходство), соседи по убыванию сходства.
+    """
+    count = len(vectors)
+    k = min(k, count - 1)
+    if k <= 0:
+        return
+    batch = max(1, BATCH_CELLS // count)
+    for start in range(0, len(positions), batch):
+        rows = np.asarray(positions[start:start + batch])
+        scores = vectors[rows] @ vectors.T
+        scores[np.arange(len(rows)), rows] = -np.inf # сама себе не соседка
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        yield from zip(rows, top, top_scores)
+
+
+def _neighbour_rows(ids, vectors, positions):
+    for position, neighbours, scores in nearest_neighbours(vectors, positions):
+        for rank, (neighbour, score) in enumerate(zip(neighbours, scores)):
+            yield SimilarCar(car_id=int(ids[position]), similar_id=int(ids[neighbour]), rank=rank, score=float(score))
+
+
+def rebuild_similar_cars():
+    """Полный пересчет таблицы соседей и нормировки признаков. Возвращает число машин."""
+    space = EmbeddingSpace(list(Car.objects.filter(is_available=True).order_by('id').values_list(*FEATURE_FIELDS)))
+    with transaction.atomic():
+        SimilarCar.objects.all().delete()
+        rows = _neighbour_rows(space.ids, space.vectors, np.arange(len(space.ids)))
+        while batch := [row for _, row in zip(range(WRITE_BATCH), rows)]:
+            SimilarCar.objects.bulk_create(batch)
+            space.set_thresholds([], batch)
+    # Новая нормировка: остальные процессы загрузят пространство заново, этот - берет готовое
+    global _local_space
+    with _space_lock:
+        version = _bump_space_version()
+        cache.delete(SPACE_CHANGES_KEY.format(version))
+        _local_space = (version, space)
+    return len(space.ids)
+
+
+def update_similar_cars(changed_ids, affected_ids=()):
+    """
+    Пересчет после изменения машин changed_ids (сохранены, сняты с продажи или удалены).
+
+    Из базы читаются только сами измененные машины: векторы остальных и пороги
+    их списков берутся из памяти процесса (load_space), так что сохранение машины -
+    это одно умножение матрицы на ее вектор, а не загрузка и нормировка всего каталога.
+    Пересчитываются только строки самих машин и тех, на чьи списки они влияют:
+    у кого они уже были в соседях, и у кого они теперь ближе последнего соседа.
+    Что изменилось, записывается в журнал версий - другие процессы дочитают
+    эти машины при следующем load_space.
+    """
+    global _local_space
+    with _space_lock:
+        space = load_space()
+        version, _local_space = _local_space[0], None # пока меняется, пространство не соответствует версии
+        space.replace(changed_ids, list(Car.objects.filter(id__in=changed_ids, is_available=True).values_list(*FEATURE_FIELDS)))
+        ids, vectors = space.ids, space.vectors
+        changed = space.positions(changed_ids)
+
+        affected = set(affected_ids)
+        affected.update(SimilarCar.objects.filter(similar_id__in=changed_ids).values_list('car_id', flat=True))
+        if len(changed):
+            # Порог попадания в список каждой машины - сходство с ее последним соседом
+            scores = vectors @ vectors[changed].T
+            closer = (scores > space.thresholds[:, None]).any(axis=1)
+            affected.update(ids[closer].tolist())
+            affected.update(ids[changed].tolist())
+
+        positions = space.positions(affected)
+        rows = list(_neighbour_rows(ids, vectors, positions))
+        with transaction.atomic():
+            # Машины не в наличии своих соседей не имеют
+            SimilarCar.objects.filter(car_id__in=[*affected, *changed_ids]).delete()
+            SimilarCar.objects.bulk_create(rows, batch_size=WRITE_BATCH)
+        space.set_thresholds(positions, rows)
+
+        published = _bump_space_version()
+        cache.set(SPACE_CHANGES_KEY.format(published), (list(changed_ids), ids[positions].tolist()), SPACE_CHANGES_TIMEOUT)
+        # Если между чтением и записью версию сменил другой процесс, его правки здесь не учтены:
+        # пространство остается со старой версией и догонит журнал (свою запись в том числе)
+        _local_space = (published if published == version + 1 else version, space)
+        return len(positions)
@@ -0,0 +1,11 @@
+from django import template
+
+from store.cards import render_car_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def car_cards(cars, variant='catalog'):
+    """Карточки машин из кэша фрагментов: {% car_cards cars 'home' %}."""
+    return render_car_cards(cars, variant)
@@ -0,0 +1,26 @@
+from django import template
+
+from store.images import FALLBACK_WIDTH, derivative_name, derivative_srcset, has_derivatives
+
+register = template.Library()
+
+# Карточка в сетке каталога: на узком экране во всю ширину, иначе ~400px
+CARD_SIZES = '(max-width: 700px) 100vw, 400px'
+
+
+@register.inclusion_tag('store/includes/picture.html')
+def responsive_image(image, alt='', css_class='', style='', sizes=CARD_SIZES, lazy=True):
+    """
+    <picture> с WebP/JPEG копиями разной ширины (см. store/images.py).
+    Пока копий нет (не прогнана generate_image_derivatives), отдает оригинал.
+    """
+    context = {'alt': alt, 'css_class': css_class, 'style': style, 'sizes': sizes, 'lazy': lazy}
+    if image and has_derivatives(image.name):
+        context.update({
+            'src': image.storage.url(derivative_name(image.name, FALLBACK_WIDTH, 'jpeg')),
+            'webp_srcset': derivative_srcset(image.name, 'webp'),
+            'jpeg_srcset': derivative_srcset(image.name, 'jpeg'),
+        })
+    else:
+        context['src'] = image.url if image else ''
+    return context
@@ -1,3 +1,1588 @@
-from django.test import TestCase
+import asyncio
+import copy
+import importlib
+import csv
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.template.backends.django import Template as BackendTemplate
+from django.template.loader import render_to_string
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from .api import DEFAULT_LIST_FIELDS
+from .benchmarks import check_budgets, fake_cars, fake_categories, load_budgets, run_benchmarks
+from .bulk_updates import apply_price_change, preview_price_change, set_availability
+from .cache import CachedValue, asingle_flight, bump_catalog_version, single_flight
+from .cards import CARD_VARIANTS, delete_car_cards, render_car_cards
+from .carts import CART_SESSION_KEY
+from .copurchases import rebuild_copurchases, record_purchase
+from .exports import EXPORT_COLUMNS, export_items, iter_export_rows
+from .facets import FacetIndex, get_facet_index
+from .images import (
+    DERIVATIVE_FORMATS, DERIVATIVE_WIDTHS, derivative_name, generate_derivatives, generate_derivatives_for, has_derivatives,
+)
+from .instrumentation import RequestStats
+from .middleware import PRIMARY_PIN_COOKIE, PrimaryAfterWriteMiddleware
+from .models import (
+    TUNING_MARKUPS, Car, Cart, CartItem, Category, CoPurchase, DailySales, Order, OrderItem, Reservation, SimilarCar,
+)
+from .orders import CarUnavailableError, EmptyCartError, place_order
+from .pagination import KeysetPaginator
+from .pricing import PricedCart, cart_totals
+from .reservations import release_expired, reserve_cars
+from .routers import REPLICA, PrimaryReplicaRouter, _pinned, _wrote
+from .sales import change_status, rebuild_sales, sales_report
+from .search import search_queryset
+from . import similar as similar_module
+from .similar import forget_space, load_space, nearest_neighbours, rebuild_similar_cars, update_similar_cars
+from .transactions import write_transaction
+
+
+def create_car(category, number, price=1000000):
+    return Car.objects.create(
+        category=category,
+        brand='Nissan',
+        model=f'Skyline R{number}',
+        country='Япония',
+        slug=f'nissan-skyline-r{number}',
+        year=1999,
+        color='Синий',
+        body_type='Купе',
+        engine_power=280,
+        tuning_details='Twin turbo, widebody',
+        price=Decimal(price),
+        description='Тестовый автомобиль',
+        main_image='cars/test.jpg',
+    )
+
+
+def fill_cart(user, cars, legacy_quantities=False):
+    """Корзина с разным тюнингом; legacy_quantities - позиции x2 и x3, как в старых корзинах."""
+    cart = Cart.objects.create(user=user)
+    for number, car in enumerate(cars):
+        CartItem.objects.create(
+            cart=cart,
+            car=car,
+            quantity=1 + number % 3 if legacy_quantities else 1,
+            tuning_type=['base', 'standard', 'premium'][number % 3],
+        )
+    return cart
+
+
+def run_in_threads(target, args_list):
+    """Запускает target(*args) в отдельных потоках одновременно и ждет их завершения."""
+    barrier = threading.Barrier(len(args_list))
+    errors = []
+
+    def worker(*args):
+        try:
+            barrier.wait()
+            target(*args)
+        except Exception as error:  # noqa: BLE001 - собираем, чтобы проверить в тесте
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class CatalogPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='JDM', slug='jdm')
+        # Повторяющиеся цены: порядок внутри одинаковой цены держится на id
+        self.cars = [create_car(category, number, price=1000000 + number % 4 * 100000) for number in range(30)]
+
+    def walk(self, query=''):
+        ids, response = [], self.client.get(f'/catalog/?{query}')
+        ids += [car.id for car in response.context['page']]
+        while response.context['page'].has_next:
+            response = self.client.get(f'/catalog/?{query}&cursor={response.context["page"].next_cursor}')
+            ids += [car.id for car in response.context['page']]
+        return ids, response
+
+    def test_pages_cover_catalog_without_overlap(self):
+        for sort in ('new', 'price_asc', 'price_desc'):
+            ids, last = self.walk(f'sort={sort}')
+            self.assertEqual(len(ids), 30)
+            self.assertEqual(set(ids), {car.id for car in self.cars})
+            if sort != 'new':
+                ordered = [Car.objects.get(id=car_id).price for car_id in ids]
+                self.assertEqual(ordered, sorted(ordered, reverse=sort == 'price_desc'))
+
+            # Назад с последней страницы - та же предпоследняя страница
+            previous = self.client.get(f'/catalog/?sort={sort}&cursor={last.context["page"].prev_cursor}')
+            self.assertEqual([car.id for car in previous.context['page']], ids[12:24])
+
+    def test_new_car_does_not_shift_next_page(self):
+        first = self.client.get('/catalog/')
+        first_ids = [car.id for car in first.context['page']]
+        create_car(Category.objects.get(), 99) # новинка встает в начало каталога
+        second = self.client.get(f'/catalog/?cursor={first.context["page"].next_cursor}')
+        second_ids = [car.id for car in second.context['page']]
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertEqual(second_ids, [car.id for car in sorted(self.cars, key=lambda car: (car.created_at, car.id), reverse=True)][12:24])
+
+    def test_bad_cursor_shows_first_page(self):
+        response = self.client.get('/catalog/?cursor=garbage')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page']), 12)
+        self.assertFalse(response.context['page'].has_previous)
+
+    def test_page_query_reads_partial_index_in_order(self):
+        paginator = KeysetPaginator(Car.objects.filter(is_available=True), 'price', per_page=12)
+        queryset, _ = paginator._page_queryset(None)
+        plan = queryset[:13].explain()
+        self.assertIn('car_avail_price_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class FacetTests(TestCase):
+    def test_counts_ignore_own_filter(self):
+        index = FacetIndex([
+            ('Nissan', 'Япония', 1, 'JDM', 1999, 3),
+            ('Toyota', 'Япония', 1, 'JDM', 1998, 2),
+            ('BMW', 'Германия', 2, 'EURO', 1999, 4),
+        ])
+        counts, total = index.counts({'brand': 'Nissan', 'year': 1999})
+        self.assertEqual(total, 3)
+        # Список марок - с учетом года, но не выбранной марки
+        self.assertEqual(counts['brand'], {'Nissan': 3, 'BMW': 4})
+        # Список годов - с учетом марки, но не выбранного года
+        self.assertEqual(counts['year'], {1999: 3})
+        self.assertEqual(counts['country'], {'Япония': 3})
+        self.assertEqual(index.choices('category'), [(2, 'EURO'), (1, 'JDM')])
+
+    def test_catalog_change_invalidates_cached_index(self):
+        cache.clear()
+        category = Category.objects.create(name='JDM', slug='jdm')
+        create_car(category, 1)
+        self.assertEqual(get_facet_index().counts({})[1], 1)
+        with self.assertNumQueries(0):
+            get_facet_index() # из кэша
+
+        create_car(category, 2) # сигнал поднимает версию каталога
+        self.assertEqual(get_facet_index().counts({})[1], 2)
+        Car.objects.filter(slug='nissan-skyline-r1').update(is_available=False)
+        bump_catalog_version() # update() без сигналов - так делают bulk_updates и orders
+        self.assertEqual(get_facet_index().counts({})[1], 1)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number) for number in range(3)]
+        self.supra = self.cars[0]
+        self.supra.brand, self.supra.model, self.supra.slug = 'Toyota', 'Supra', 'toyota-supra'
+        self.supra.save()
+        # Слово только в описании - ниже совпадения в модели (веса BM25)
+        self.cars[1].description = 'Обгоняет любую Supra'
+        self.cars[1].save()
+
+    def search(self, text):
+        return list(search_queryset(Car.objects.all(), text).order_by('search_rank', 'id').values_list('id', flat=True))
+
+    def test_prefix_words_and_rank(self):
+        self.assertEqual(self.search('supr'), [self.supra.id, self.cars[1].id])
+        self.assertEqual(set(self.search('twin turb')), {car.id for car in self.cars})
+        self.assertEqual(self.search('twin supra'), [self.supra.id, self.cars[1].id])
+        self.assertEqual(self.search('skyline r2'), [self.cars[2].id])
+        # Операторы FTS5 из ввода - просто слова
+        self.assertEqual(self.search('supra" (*:'), [self.supra.id, self.cars[1].id])
+        self.assertEqual(search_queryset(Car.objects.all(), '  ').count(), 3)
+
+    def test_index_follows_save_and_delete(self):
+        self.cars[2].tuning_details = 'Swap 2JZ'
+        self.cars[2].save()
+        self.assertEqual(self.search('2jz'), [self.cars[2].id])
+        self.assertEqual(self.search('widebody'), [self.supra.id, self.cars[1].id])
+
+        self.supra.delete()
+        self.assertEqual(self.search('supra'), [self.cars[1].id])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search('supra'), [self.cars[1].id])
+
+    def test_match_runs_once_per_query(self):
+        cars = search_queryset(Car.objects.filter(is_available=True), 'twin')
+        paginator = KeysetPaginator(cars, 'search_rank', per_page=1)
+        page = paginator.get_page()
+        with CaptureQueriesContext(connection) as queries:
+            paginator.get_page(page.next_cursor)
+            set_availability(cars, False) # UPDATE с поиском - подзапрос с псевдонимами таблиц
+        for query in queries.captured_queries:
+            self.assertLessEqual(query['sql'].count(' MATCH '), 1)
+        self.assertFalse(Car.objects.filter(is_available=True).exists())
+
+    def test_catalog_and_admin_search(self):
+        response = self.client.get('/catalog/', {'q': 'supra'})
+        self.assertEqual(response.context['total'], 2)
+        self.assertEqual([car.id for car in response.context['page']], [self.supra.id, self.cars[1].id])
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', None))
+        response = self.client.get('/admin/store/car/', {'q': 'supra'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+
+class CartPricingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        category = Category.objects.create(name='JDM', slug='jdm')
+        # Цены, на которых округление наценки заметно: 1234567 * 1.15 = 1419752.05
+        self.cars = [create_car(category, number, price=1234567 + number * 7) for number in range(12)]
+        self.cart = fill_cart(self.user, self.cars, legacy_quantities=True)
+
+    def expected_total(self):
+        return sum(
+            int(item.car.price) * TUNING_MARKUPS[item.tuning_type] // 100 * item.quantity
+            for item in CartItem.objects.select_related('car')
+        )
+
+    def test_priced_cart_is_one_query(self):
+        with self.assertNumQueries(1):
+            priced_cart = PricedCart(self.cart.items.all())
+            lines = [(item.car.model, item.unit_price, item.line_total) for item in priced_cart]
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(priced_cart.total_price, self.expected_total())
+        self.assertEqual(priced_cart.total_items, sum(1 + number % 3 for number in range(12)))
+        for item in priced_cart:
+            self.assertEqual(item.line_total, item.unit_price * item.quantity)
+            self.assertEqual(item.unit_price, CartItem.objects.get(pk=item.pk).get_cost())
+
+    def test_totals_are_one_aggregate(self):
+        with self.assertNumQueries(1):
+            totals = cart_totals(self.cart.items.all())
+        self.assertEqual(totals['total_price'], self.expected_total())
+        self.assertEqual(self.cart.get_total_price(), self.expected_total())
+        self.assertEqual(cart_totals(CartItem.objects.none()), {'total_price': 0, 'total_items': 0})
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number, price=1000000 + number) for number in range(5)]
+
+    def test_order_matches_cart(self):
+        cart = fill_cart(self.user, self.cars)
+        expected_total = cart.get_total_price()
+
+        order = place_order(self.user)
+
+        self.assertEqual(order.total_price, expected_total)
+        self.assertEqual(order.items.count(), len(self.cars))
+        self.assertEqual(sum(item.price for item in order.items.all()), expected_total)
+        self.assertFalse(CartItem.objects.filter(cart=cart).exists())
+
+    def test_legacy_quantity_sells_each_car_once(self):
+        cart = fill_cart(self.user, self.cars, legacy_quantities=True)
+        expected_total = sum(item.get_cost() for item in cart.items.select_related('car'))
+
+        order = place_order(self.user)
+
+        self.assertEqual(order.total_price, expected_total)
+        self.assertEqual(sorted(order.items.values_list('car_id', flat=True)), [car.id for car in self.cars])
+
+    def test_query_count_does_not_grow_with_cart(self):
+        fill_cart(self.user, self.cars)
+        # Число запросов не зависит от размера корзины: позиции с ценами,
+        # резерв (6 с savepoint), продажа, снятие резервов, заказ, bulk_create, очистка
+        # и UPDATE, сводящий старые позиции x2 к одной машине
+        with self.assertNumQueries(15):
+            place_order(self.user)
+
+    def test_empty_cart(self):
+        with self.assertRaises(EmptyCartError):
+            place_order(self.user)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failure_leaves_no_partial_order(self):
+        cart = fill_cart(self.user, self.cars)
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=RuntimeError('worker died')):
+            with self.assertRaises(RuntimeError):
+                place_order(self.user)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(cart=cart).count(), len(self.cars))
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.car = create_car(Category.objects.create(name='JDM', slug='jdm'), 34)
+
+    def test_reserved_car_cannot_be_taken(self):
+        self.assertTrue(reserve_cars(self.alice, [self.car.id]))
+        self.assertTrue(reserve_cars(self.alice, [self.car.id])) # продление своего резерва
+        self.assertFalse(reserve_cars(self.bob, [self.car.id]))
+
+    def test_expired_reservation_is_taken_over_and_swept(self):
+        reserve_cars(self.alice, [self.car.id], ttl=timedelta(seconds=-1))
+        self.assertTrue(reserve_cars(self.bob, [self.car.id]))
+        self.assertEqual(release_expired(), 0)
+        self.assertEqual(release_expired(now=timezone.now() + timedelta(days=1)), 1)
+
+    def test_checkout_sells_car_once(self):
+        fill_cart(self.alice, [self.car])
+        fill_cart(self.bob, [self.car])
+        place_order(self.alice)
+        self.car.refresh_from_db()
+        self.assertFalse(self.car.is_available)
+        with self.assertRaises(CarUnavailableError):
+            place_order(self.bob)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class ParallelCheckoutTests(TransactionTestCase):
+    """Стресс-тест: параллельные оформления заказов не оставляют частичных заказов."""
+
+    def setUp(self):
+        # Машины коммитятся сразу, и похожие обновляются по векторам в памяти процесса (store/similar.py) -
+        # они не должны остаться от машин прошлых тестов: сброс кэша сбрасывает и их версию
+        cache.clear()
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number, price=1000000 + number) for number in range(10)]
+
+    def test_parallel_checkouts_of_different_users(self):
+        users = [User.objects.create_user(f'buyer{number}') for number in range(5)]
+        expected = {}
+        for number, user in enumerate(users):
+            # Машины уникальны, поэтому у каждого покупателя свои
+            cart = fill_cart(user, self.cars[number * 2:number * 2 + 2])
+            expected[user.id] = (cart.get_total_price(), cart.get_total_items())
+
+        errors = run_in_threads(place_order, [(user,) for user in users])
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Order.objects.count(), len(users))
+        for order in Order.objects.all():
+            total_price, total_items = expected[order.user_id]
+            self.assertEqual(order.total_price, total_price)
+            self.assertEqual(order.items.count(), total_items)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertFalse(Car.objects.filter(is_available=True).exists())
+
+    def test_parallel_checkouts_of_one_cart(self):
+        # Двойной клик/несколько вкладок: заказ должен получиться ровно один
+        user = User.objects.create_user('buyer')
+        cart = fill_cart(user, self.cars)
+        total_price, total_items = cart.get_total_price(), cart.get_total_items()
+
+        errors = run_in_threads(place_order, [(user,)] * 8)
+
+        self.assertTrue(all(isinstance(error, EmptyCartError) for error in errors))
+        self.assertEqual(len(errors), 7)
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, total_price)
+        self.assertEqual(order.items.count(), total_items)
+
+
+class WriteTransactionTests(TransactionTestCase):
+    def begin_statement(self, atomic):
+        with CaptureQueriesContext(connection) as queries:
+            with atomic():
+                Car.objects.exists()
+        return queries.captured_queries[0]['sql']
+
+    def test_only_write_transactions_take_the_write_lock_upfront(self):
+        self.assertEqual(self.begin_statement(write_transaction), 'BEGIN IMMEDIATE')
+        # Только читающие транзакции (например, админка) - обычный BEGIN
+        self.assertEqual(self.begin_statement(transaction.atomic), 'BEGIN')
+        self.assertEqual(self.begin_statement(write_transaction), 'BEGIN IMMEDIATE')
+
+    def test_nested_write_transaction_is_a_savepoint(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                with write_transaction():
+                    Car.objects.exists()
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN')
+        self.assertTrue(queries.captured_queries[1]['sql'].startswith('SAVEPOINT'))
+
+
+class CarRaceTests(TransactionTestCase):
+    """Конкуренция: N покупателей одновременно бьются за одну машину."""
+
+    CLIENTS = 16
+
+    def setUp(self):
+        cache.clear()
+        self.car = create_car(Category.objects.create(name='JDM', slug='jdm'), 34)
+        self.users = [User.objects.create_user(f'racer{number}') for number in range(self.CLIENTS)]
+
+    def test_only_one_client_reserves_the_car(self):
+        winners = []
+
+        def race(user):
+            if reserve_cars(user, [self.car.id]):
+                winners.append(user.id)
+
+        errors = run_in_threads(race, [(user,) for user in self.users])
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(winners), 1)
+
+    def test_only_one_client_buys_the_car(self):
+        for user in self.users:
+            fill_cart(user, [self.car])
+
+        errors = run_in_threads(place_order, [(user,) for user in self.users])
+
+        self.assertEqual(len(errors), self.CLIENTS - 1)
+        self.assertTrue(all(isinstance(error, CarUnavailableError) for error in errors))
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+
+class ProfileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number) for number in range(3)]
+
+    def add_orders(self, count, status, items=0):
+        orders = []
+        for number in range(count):
+            order = Order.objects.create(user=self.user, status=status, total_price=Decimal(1000000))
+            for car in self.cars[:items]:
+                OrderItem.objects.create(order=order, car=car, price=car.price, tuning_type='standard')
+            orders.append(order)
+        # Одинаковое время у пар заказов: порядок внутри держится на id
+        for number, order in enumerate(orders):
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=number // 2))
+        return orders
+
+    def profile_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/profile/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.add_orders(1, 'new', items=1)
+        self.add_orders(1, 'shipped')
+        few = self.profile_queries()
+        self.add_orders(8, 'processing', items=3)
+        self.add_orders(30, 'cancelled')
+        self.assertEqual(self.profile_queries(), few)
+
+    def test_active_order_items_are_listed_once(self):
+        self.add_orders(1, 'new', items=3)
+        response = self.client.get('/profile/')
+        for car in self.cars:
+            self.assertContains(response, f'{car.brand} {car.model} ', count=1)
+
+    def test_history_pages_cover_orders_without_overlap(self):
+        history = self.add_orders(25, 'shipped') + self.add_orders(3, 'cancelled')
+        self.add_orders(2, 'new')
+        ids, response = [], self.client.get('/profile/')
+        ids += [order.id for order in response.context['history_orders']]
+        while response.context['history_orders'].has_next:
+            cursor = response.context['history_orders'].next_cursor
+            response = self.client.get('/profile/', {'cursor': cursor})
+            ids += [order.id for order in response.context['history_orders']]
+
+        expected = Order.objects.filter(status__in=Order.HISTORY_STATUSES).order_by('-created_at', '-id')
+        self.assertEqual(len(history), 28)
+        self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+        # Назад с последней страницы - предпоследняя
+        previous = self.client.get('/profile/', {'cursor': response.context['history_orders'].prev_cursor})
+        self.assertEqual([order.id for order in previous.context['history_orders']], ids[10:20])
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        media = override_settings(MEDIA_ROOT=self.tmp.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        os.makedirs(os.path.join(self.tmp.name, 'cars'))
+        self.save_photo('cars/test.jpg', (2000, 1000))
+
+    def save_photo(self, name, size):
+        Image.new('RGB', size, 'navy').save(os.path.join(self.tmp.name, name), 'JPEG')
+
+    def render(self, car):
+        return Template('{% load store_images %}{% responsive_image car.main_image alt="R34" %}').render(
+            Context({'car': car})
+        )
+
+    def test_derivatives_in_every_width_and_format(self):
+        self.assertEqual(generate_derivatives('cars/test.jpg'), len(DERIVATIVE_WIDTHS) * len(DERIVATIVE_FORMATS))
+        for width in DERIVATIVE_WIDTHS:
+            for ext, options in DERIVATIVE_FORMATS.items():
+                with Image.open(os.path.join(self.tmp.name, derivative_name('cars/test.jpg', width, ext))) as copy:
+                    self.assertEqual(copy.format, options['format'])
+                    self.assertEqual(copy.size, (width, width // 2))
+        # Актуальные копии не переписываются, force - переписывает все
+        self.assertEqual(generate_derivatives('cars/test.jpg'), 0)
+        self.assertEqual(generate_derivatives('cars/test.jpg', force=True), 8)
+
+    def test_small_original_is_not_upscaled(self):
+        self.save_photo('cars/small.jpg', (500, 300))
+        generate_derivatives('cars/small.jpg')
+        for width in DERIVATIVE_WIDTHS:
+            with Image.open(os.path.join(self.tmp.name, derivative_name('cars/small.jpg', width, 'webp'))) as copy:
+                self.assertEqual(copy.size, (min(width, 500), 300 if width >= 500 else round(300 * width / 500)))
+
+    def test_saving_car_generates_copies_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            car = create_car(Category.objects.create(name='JDM', slug='jdm'), 34)
+        self.assertFalse(has_derivatives('cars/test.jpg'))
+        self.assertIn('src="/media/cars/test.jpg"', self.render(car))
+        self.assertNotIn('<picture>', self.render(car))
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(has_derivatives('cars/test.jpg'))
+        html = self.render(car)
+        self.assertIn('<picture>', html)
+        self.assertIn('/media/derivatives/cars/test-320w.webp 320w', html)
+        self.assertIn('/media/derivatives/cars/test-1440w.jpeg 1440w', html)
+        self.assertIn('src="/media/derivatives/cars/test-640w.jpeg"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_missing_original_is_skipped(self):
+        car = create_car(Category.objects.create(name='JDM', slug='jdm'), 34)
+        car.main_image.name = 'cars/missing.jpg'
+        self.assertEqual(generate_derivatives_for(car.main_image), 0)
+
+
+class CarCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number) for number in range(3)]
+
+    def render(self, variant='catalog'):
+        with mock.patch('store.cards.render_to_string', wraps=render_to_string) as rendered:
+            html = render_car_cards(Car.objects.order_by('id'), variant)
+        return html, rendered.call_count
+
+    def test_second_render_comes_from_cache(self):
+        html, rendered = self.render()
+        self.assertEqual(rendered, 3)
+        cached_html, rendered = self.render()
+        self.assertEqual(rendered, 0)
+        self.assertEqual(cached_html, html)
+        # Другой вариант карточки - свои ключи
+        self.assertEqual(self.render('home')[1], 3)
+
+    def test_saved_car_is_rerendered(self):
+        self.render()
+        car = self.cars[1]
+        car.model = 'Skyline GT-R'
+        car.save()
+        html, rendered = self.render()
+        self.assertEqual(rendered, 1)
+        self.assertIn('Skyline GT-R', html)
+
+    def test_variant_shows_tuned_price(self):
+        html, _ = self.render('catalog_premium')
+        car = Car.objects.get(pk=self.cars[0].pk)
+        self.assertIn(f'{car.price_premium} ₽', html)
+        self.assertIn('с Premium Tuning', html)
+
+    def test_delete_car_cards_drops_every_variant(self):
+        for variant in CARD_VARIANTS:
+            self.render(variant)
+        delete_car_cards(self.cars[:1])
+        for variant in CARD_VARIANTS:
+            self.assertEqual(self.render(variant)[1], 1)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='JDM', slug='jdm')
+        self.car = create_car(self.category, 34)
+
+    def assertCached(self, response, cached=True):
+        self.assertEqual(response.status_code, 200)
+        # Ответ из кэша шаблоны не рендерит
+        self.assertEqual(response.context is None, cached)
+
+    def test_anonymous_pages_are_cached(self):
+        for url in ('/', '/catalog/', f'/car/{self.car.slug}/'):
+            first = self.client.get(url)
+            self.assertCached(first, cached=False)
+            second = self.client.get(url)
+            self.assertCached(second)
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(second['ETag'], first['ETag'])
+            self.assertIn('Cookie', second['Vary'])
+
+    def test_conditional_request_gets_304_without_queries(self):
+        etag = self.client.get('/catalog/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/catalog/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_query_is_normalized(self):
+        self.client.get('/catalog/?sort=price_asc&brand=Nissan')
+        self.assertCached(self.client.get('/catalog/?brand=Nissan&utm_source=ad&sort=price_asc&q='))
+        self.assertCached(self.client.get('/catalog/?sort=price_desc'), cached=False)
+
+    def test_catalog_change_rebuilds_page(self):
+        self.client.get('/catalog/')
+        create_car(self.category, 35)
+        response = self.client.get('/catalog/')
+        self.assertCached(response, cached=False)
+        self.assertContains(response, 'Skyline R35')
+
+    def test_personal_requests_bypass_cache(self):
+        self.client.get('/catalog/')
+
+        # Флеш-сообщения
+        self.client.cookies['messages'] = 'pending'
+        self.assertCached(self.client.get('/catalog/'), cached=False)
+        del self.client.cookies['messages']
+
+        # Аноним с корзиной в сессии
+        self.client.post(f'/cart/add/{self.car.id}/')
+        self.assertCached(self.client.get('/catalog/'), cached=False)
+
+        # Вошедший пользователь
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.assertCached(self.client.get('/catalog/'), cached=False)
+        self.assertCached(self.client.get('/catalog/'), cached=False)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(self.category, number, price=1000000 + number * 1000) for number in range(7)]
+        hidden = create_car(self.category, 99)
+        Car.objects.filter(pk=hidden.pk).update(is_available=False) # нет в наличии - в API не видна
+
+    def test_list_fields(self):
+        results = self.client.get('/api/cars/').json()['results']
+        self.assertEqual(len(results), 7)
+        self.assertEqual(list(results[0]), DEFAULT_LIST_FIELDS)
+        self.assertNotIn('description', results[0])
+
+        results = self.client.get('/api/cars/', {'fields': 'brand, price,description', 'sort': 'price_asc'}).json()['results']
+        self.assertEqual(results[0], {'id': self.cars[0].id, 'brand': 'Nissan', 'price': 1000000, 'description': 'Тестовый автомобиль'})
+
+        response = self.client.get('/api/cars/', {'fields': 'brand,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error']['fields'])
+
+    def test_list_filters_and_pages(self):
+        ids, cursor = [], ''
+        while True:
+            data = self.client.get('/api/cars/', {'limit': 3, 'sort': 'price_desc', 'price_min': 1002000, 'cursor': cursor}).json()
+            ids += [car['id'] for car in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(ids, [car.id for car in reversed(self.cars[2:])])
+        self.assertEqual(self.client.get('/api/cars/', {'limit': 'many'}).status_code, 400)
+
+    def test_detail_and_categories(self):
+        car = self.cars[0]
+        data = self.client.get(f'/api/cars/{car.slug}/', {'fields': 'slug,main_image'}).json()
+        self.assertEqual(data, {'id': car.id, 'slug': car.slug, 'main_image': '/media/cars/test.jpg'})
+        self.assertEqual(self.client.get('/api/cars/nissan-skyline-r99/').status_code, 404)
+        self.assertEqual(
+            self.client.get('/api/categories/').json(),
+            {'results': [{'id': self.category.id, 'name': 'JDM', 'slug': 'jdm', 'image': None}]},
+        )
+
+    def test_etag_follows_catalog_version(self):
+        etag = self.client.get('/api/cars/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.client.get('/api/cars/?limit=2')['ETag'], etag)
+
+        bump_catalog_version()
+        response = self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.post('/api/cars/').status_code, 405)
+
+    def test_ndjson_streams_whole_catalog(self):
+        with mock.patch('store.api.STREAM_CHUNK_SIZE', 2):
+            response = self.client.get('/api/cars/', {'format': 'ndjson', 'fields': 'price'})
+            self.assertTrue(response.streaming)
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual([json.loads(line) for line in lines], [{'id': car.id, 'price': int(car.price)} for car in self.cars])
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com')
+        category = Category.objects.create(name='JDM', slug='jdm')
+        cars = [create_car(category, number) for number in range(3)]
+        self.orders = []
+        for number, status in enumerate(['new', 'shipped', 'shipped', 'cancelled']):
+            order = Order.objects.create(user=self.user, status=status, total_price=Decimal(3000000))
+            OrderItem.objects.bulk_create(OrderItem(order=order, car=car, price=car.price) for car in cars)
+            self.orders.append(order)
+        self.item_ids = list(OrderItem.objects.order_by('id').values_list('id', flat=True))
+
+    def test_rows_come_in_keyset_chunks(self):
+        # 12 позиций кусками по 5: 5 + 5 + 2, на последнем неполном куске запросы кончаются
+        with self.assertNumQueries(3):
+            rows = list(iter_export_rows(export_items(), chunk_size=5))
+        self.assertEqual([row['item_id'] for row in rows], self.item_ids)
+        self.assertEqual(list(rows[0]), list(EXPORT_COLUMNS))
+        self.assertEqual(rows[3]['status_display'], 'Доставлен')
+        self.assertEqual(rows[0]['username'], 'buyer')
+        self.assertEqual(rows[0]['model'], 'Skyline R0')
+
+        with self.assertNumQueries(4): # ровно кратное число: еще один пустой кусок
+            self.assertEqual(len(list(iter_export_rows(export_items(), chunk_size=4))), 12)
+
+    def test_command_filters_and_resumes(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'orders.csv')
+        errors = io.StringIO()
+        call_command('export_orders', '--status', 'shipped', '--output', path, stderr=errors)
+        shipped = [item for order in self.orders[1:3] for item in order.items.order_by('id').values_list('id', flat=True)]
+        self.assertIn(f'--after {shipped[-1]}', errors.getvalue())
+
+        # Продолжение дописывает строки после курсора, без второго заголовка
+        call_command('export_orders', '--after', str(shipped[-1]), '--output', path, stderr=io.StringIO())
+        with open(path, encoding='utf-8', newline='') as exported:
+            rows = list(csv.DictReader(exported))
+        self.assertEqual([int(row['item_id']) for row in rows], shipped + self.item_ids[9:])
+
+        output = io.StringIO()
+        call_command('export_orders', '--format', 'jsonl', '--status', 'new', stdout=output, stderr=io.StringIO())
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([line['item_id'] for line in lines], self.item_ids[:3])
+        self.assertEqual(lines[0]['price'], '1000000.00')
+
+    def test_admin_action_streams_selected_orders(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', None))
+        response = self.client.post('/admin/store/order/', {
+            'action': 'export_csv', '_selected_action': [self.orders[0].id, self.orders[3].id],
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode()
+        self.assertTrue(content.startswith('\ufeff'))
+        rows = list(csv.DictReader(io.StringIO(content[1:])))
+        self.assertEqual([int(row['item_id']) for row in rows], self.item_ids[:3] + self.item_ids[9:])
+        self.assertEqual({row['status_display'] for row in rows}, {'Новый', 'Отменен'})
+
+
+class ImportCarsTests(TestCase):
+    def setUp(self):
+        Category.objects.create(name='JDM', slug='jdm')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        media = override_settings(MEDIA_ROOT=os.path.join(self.tmp.name, 'media'))
+        media.enable()
+        self.addCleanup(media.disable)
+        with open(os.path.join(self.tmp.name, 'r34.jpg'), 'wb') as image:
+            image.write(b'jpeg')
+
+    def run_import(self, rows):
+        path = os.path.join(self.tmp.name, 'cars.jsonl')
+        with open(path, 'w', encoding='utf-8') as source:
+            source.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+        errors = io.StringIO()
+        call_command('import_cars', path, images=self.tmp.name, batch_size=2, stdout=io.StringIO(), stderr=errors)
+        return errors.getvalue()
+
+    row = {
+        'category': 'jdm', 'brand': 'Nissan', 'model': 'Skyline R34', 'country': 'Япония',
+        'year': 1999, 'color': 'Синий', 'body_type': 'Купе', 'engine_power': 280,
+        'tuning_details': 'Twin turbo', 'price': '1000000', 'description': 'GT-R', 'image': 'r34.jpg',
+    }
+
+    def test_import_upserts_and_reports_bad_rows(self):
+        row = self.row
+        errors = self.run_import([row, row, {**row, 'category': 'euro'}, {**row, 'slug': 'stock-1'}])
+
+        self.assertIn('Строка 3', errors)
+        self.assertEqual(
+            sorted(Car.objects.values_list('slug', flat=True)),
+            ['nissan-skyline-r34-1999', 'nissan-skyline-r34-1999-2', 'stock-1'],
+        )
+        self.assertEqual(search_queryset(Car.objects.all(), 'skyline').count(), 3)
+
+        # Повторный импорт с тем же slug обновляет машину, а не создает новую
+        self.run_import([{**row, 'slug': 'stock-1', 'price': '900000'}])
+        self.assertEqual(Car.objects.count(), 3)
+        self.assertEqual(Car.objects.get(slug='stock-1').price, 900000)
+
+    def test_bad_explicit_slug_is_row_error(self):
+        errors = self.run_import([{**self.row, 'slug': 'Nissan Skyline!!'}, {**self.row, 'slug': 'r34'}])
+        self.assertIn('Строка 1: slug:', errors)
+        self.assertEqual(list(Car.objects.values_list('slug', flat=True)), ['r34'])
+        self.assertEqual(self.client.get('/catalog/').status_code, 200)
+
+    def test_explicit_and_generated_slugs_do_not_collide(self):
+        generated = 'nissan-skyline-r34-1999'
+        errors = self.run_import([
+            {**self.row, 'slug': f'{generated}-2'},
+            self.row,
+            self.row,
+            {**self.row, 'slug': generated, 'price': '1'},
+            {**self.row, 'slug': f'{generated}-2', 'price': '2'},
+        ])
+        self.assertNotIn('Строка 1', errors)
+        self.assertIn('Строка 4', errors)
+        self.assertIn('Строка 5', errors)
+        self.assertEqual(
+            sorted(Car.objects.values_list('slug', flat=True)),
+            [generated, f'{generated}-2', f'{generated}-3'],
+        )
+        self.assertFalse(Car.objects.filter(price__lt=1000).exists())
+
+    def test_non_object_json_line_is_row_error(self):
+        errors = self.run_import([[], 'x', self.row])
+        self.assertIn('Строка 1: ожидался объект JSON', errors)
+        self.assertIn('Строка 2: ожидался объект JSON', errors)
+        self.assertEqual(Car.objects.count(), 1)
+
+    def test_images_are_stored_by_content_and_only_for_accepted_rows(self):
+        dealer = os.path.join(self.tmp.name, 'dealer')
+        os.mkdir(dealer)
+        with open(os.path.join(dealer, 'r34.jpg'), 'wb') as image:
+            image.write(b'other jpeg')
+
+        self.run_import([{**self.row, 'slug': 'bad slug!'}, {**self.row, 'year': 'old'}])
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, 'cars')))
+
+        self.run_import([self.row, {**self.row, 'image': 'dealer/r34.jpg'}])
+        self.run_import([{**self.row, 'slug': 'r34-again'}])  # то же фото повторно
+        images = Car.objects.order_by('id').values_list('main_image', flat=True)
+        self.assertNotEqual(images[0], images[1])
+        self.assertEqual(images[0], images[2])
+        self.assertEqual(len(os.listdir(os.path.join(settings.MEDIA_ROOT, 'cars'))), 2)
+        with default_storage.open(images[1]) as image:
+            self.assertEqual(image.read(), b'other jpeg')
+
+    def test_database_error_skips_only_bad_row(self):
+        bulk_create = Car.objects.bulk_create
+
+        def failing_bulk_create(cars, **kwargs):
+            if any(car.slug == 'broken' for car in cars):
+                raise IntegrityError('CHECK constraint failed')
+            return bulk_create(cars, **kwargs)
+
+        with mock.patch.object(Car.objects, 'bulk_create', side_effect=failing_bulk_create):
+            errors = self.run_import([
+                {**self.row, 'slug': 'first'}, {**self.row, 'slug': 'broken'}, {**self.row, 'slug': 'last'},
+            ])
+        self.assertIn('Строка 2: ошибка базы', errors)
+        self.assertEqual(sorted(Car.objects.values_list('slug', flat=True)), ['first', 'last'])
+
+
+class OrderAdminTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        Order.objects.bulk_create(Order(user=admin, total_price=1000) for _ in range(60))
+        self.client.force_login(admin)
+
+    def get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        ids = re.findall(r'name="_selected_action" value="(\d+)"', content)
+        cursor = re.search(r'href="\?cursor=([^"]+)"', content)
+        return ids, cursor and cursor.group(1)
+
+    def test_keyset_navigation(self):
+        first, cursor = self.get_ids('/admin/store/order/')
+        second, _ = self.get_ids(f'/admin/store/order/?cursor={cursor}')
+        self.assertEqual(len(first), 50)
+        self.assertEqual(len(second), 10)
+        self.assertFalse(set(first) & set(second))
+
+
+class BulkUpdateTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(self.category, number, price=1000000) for number in range(4)]
+
+    def test_percent_change_is_one_update(self):
+        queryset = Car.objects.filter(category=self.category)
+        preview = preview_price_change(queryset, 'price_percent', -5)
+        self.assertEqual((preview['cars'], preview['total_before'], preview['total_after']), (4, 4000000, 3800000))
+
+        # Агрегаты, UPDATE, строка журнала (+ savepoint внутри тестовой транзакции)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertNumQueries(5):
+                batch = apply_price_change(queryset, 'price_percent', -5)
+        self.assertEqual(len(callbacks), 1) # одна инвалидация кэша на пакет
+        self.assertEqual(batch.total_after, 3800000)
+        self.assertEqual(set(Car.objects.values_list('price', flat=True)), {950000})
+
+    def test_availability_counts_only_changed_cars(self):
+        Car.objects.filter(pk=self.cars[0].pk).update(is_available=False)
+        batch = set_availability(Car.objects.all(), False)
+        self.assertEqual(batch.cars, 3)
+        self.assertFalse(Car.objects.filter(is_available=True).exists())
+
+
+class SqliteJournalTests(TransactionTestCase):
+    """Блокировки: открытые чтения каталога и оформление заказа одновременно."""
+
+    READERS = 4
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number) for number in range(3)]
+        self.user = User.objects.create_user('buyer')
+        fill_cart(self.user, self.cars)
+        self.addCleanup(self.set_journal_mode, 'delete')
+
+    def set_journal_mode(self, mode):
+        # PRAGMA выполняет обработчик connection_created при открытии соединения.
+        # Короткий busy_timeout: заблокированный коммит падает сразу, а не через 20 секунд
+        connection.close()
+        with override_settings(SQLITE_PRAGMAS={'journal_mode': mode, 'busy_timeout': 100}):
+            connection.ensure_connection()
+
+    def checkout_under_reads(self, mode):
+        """Оформляет заказ, пока READERS потоков держат недочитанный SELECT."""
+        self.set_journal_mode(mode)
+        reading = threading.Barrier(self.READERS + 1)
+        checked_out = threading.Event()
+
+        def read_catalog():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT id FROM store_car')
+                    cursor.fetchone() # запрос не дочитан - блокировка чтения держится
+                    reading.wait()
+                    checked_out.wait(10)
+            finally:
+                connection.close()
+
+        readers = [threading.Thread(target=read_catalog) for _ in range(self.READERS)]
+        for reader in readers:
+            reader.start()
+        try:
+            reading.wait(10)
+            place_order(self.user)
+        finally:
+            checked_out.set()
+            for reader in readers:
+                reader.join()
+
+    def test_readers_block_checkout_without_wal(self):
+        # Классический журнал: для коммита нужна монопольная блокировка, а читатели ее не отдают
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            self.checkout_under_reads('delete')
+        self.assertFalse(Order.objects.exists())
+
+    def test_readers_do_not_block_checkout_in_wal(self):
+        self.checkout_under_reads('wal')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class SyncReplicaTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.replica = os.path.join(self.tmp.name, 'replica.sqlite3')
+        databases = mock.patch.dict(settings.DATABASES, {REPLICA: {'NAME': self.replica}})
+        databases.start()
+        self.addCleanup(databases.stop)
+
+    def sync(self):
+        # Соединения с репликой в тестах нет - проверяем только, что команда его закрывает
+        with mock.patch('store.management.commands.sync_replica.connections') as connections:
+            call_command('sync_replica', pages=2, stdout=io.StringIO())
+        connections.__getitem__.assert_called_once_with(REPLICA)
+        connections.__getitem__.return_value.close.assert_called_once_with()
+
+    def test_replica_file_is_swapped_whole(self):
+        create_car(Category.objects.create(name='JDM', slug='jdm'), 34)
+        self.sync()
+
+        # Читатель старого снимка дочитывает его, хотя файл уже подменен
+        reader = sqlite3.connect(self.replica)
+        self.addCleanup(reader.close)
+        rows = reader.execute('SELECT slug FROM store_car')
+        self.assertEqual(rows.fetchone(), ('nissan-skyline-r34',))
+        create_car(Category.objects.get(), 35)
+        self.sync()
+        self.assertEqual(rows.fetchall(), [])
+        self.assertEqual(reader.execute('SELECT count(*) FROM store_car').fetchone(), (1,))
+
+        fresh = sqlite3.connect(self.replica)
+        self.addCleanup(fresh.close)
+        self.assertEqual(fresh.execute('SELECT count(*) FROM store_car').fetchone(), (2,))
+        self.assertEqual(fresh.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+        self.assertEqual(os.listdir(self.tmp.name), ['replica.sqlite3'])
+
+    def test_failed_copy_keeps_old_replica(self):
+        self.sync()
+        create_car(Category.objects.create(name='JDM', slug='jdm'), 34)
+        with mock.patch('store.management.commands.sync_replica.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                call_command('sync_replica', stdout=io.StringIO())
+        # Временный файл убран, реплика - прежний снимок
+        self.assertEqual(os.listdir(self.tmp.name), ['replica.sqlite3'])
+        replica = sqlite3.connect(self.replica)
+        self.addCleanup(replica.close)
+        self.assertEqual(replica.execute('SELECT count(*) FROM store_car').fetchone(), (0,))
+
+
+class AsyncStorefrontTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number) for number in range(3)]
+
+    async def test_car_detail_loads_car_and_related_cars(self):
+        response = await self.async_client.get(f'/car/{self.cars[0].slug}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['car'], self.cars[0])
+        self.assertEqual(len(response.context['related_cars']), 2)
+
+        response = await self.async_client.get('/car/missing/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_catalog_page_and_facets(self):
+        response = await self.async_client.get('/catalog/', {'brand': 'Nissan'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total'], 3)
+        self.assertEqual(len(response.context['page']), 3)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def producer(self, value='fresh'):
+        with self.calls_lock:
+            self.calls += 1
+        time.sleep(0.3) # пока считаем, остальные промахи должны ждать, а не считать
+        return value
+
+    def test_concurrent_misses_run_producer_once(self):
+        results = []
+        errors = run_in_threads(lambda: results.append(single_flight('test:page', self.producer, 60)), [()] * 200)
+        self.assertEqual(errors, [])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['fresh'] * 200)
+
+    async def test_concurrent_async_misses_run_producer_once(self):
+        async def producer():
+            self.calls += 1
+            await asyncio.sleep(0.3)
+            return 'fresh'
+
+        results = await asyncio.gather(*[asingle_flight('test:apage', producer, 60) for _ in range(200)])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['fresh'] * 200)
+
+    def test_stale_value_served_while_another_request_refreshes(self):
+        cache.set('test:facets', CachedValue('stale', 1, None, 0.1))
+        cache.add('test:facets:lock', 'other', 10) # пересчитывает другой запрос
+        self.assertEqual(single_flight('test:facets', self.producer, 60, version=2), 'stale')
+        self.assertEqual(self.calls, 0)
+
+        cache.delete('test:facets:lock')
+        self.assertEqual(single_flight('test:facets', self.producer, 60, version=2), 'fresh')
+        self.assertEqual(single_flight('test:facets', self.producer, 60, version=2), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    def test_probabilistic_early_expiry(self):
+        cache.set('test:count', CachedValue('old', None, time.time() + 10, 1.0))
+        with mock.patch('store.cache.random.random', return_value=0.5):
+            self.assertEqual(single_flight('test:count', self.producer, 60), 'old') # -ln(0.5) * 1 с < 10 с
+        with mock.patch('store.cache.random.random', return_value=1 - 1e-9):
+            self.assertEqual(single_flight('test:count', self.producer, 60), 'fresh') # -ln(1e-9) * 1 с > 10 с
+        self.assertEqual(self.calls, 1)
+
+    def test_uncacheable_value_is_not_stored(self):
+        self.assertIsNone(single_flight('test:none', lambda: None, 60))
+        self.assertIsNone(cache.get('test:none'))
+        self.assertIsNone(cache.get('test:none:lock'))
+
+
+class SimilarCarsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        jdm = Category.objects.create(name='JDM', slug='jdm')
+        euro = Category.objects.create(name='Euro', slug='euro')
+        self.skylines = [create_car(jdm, number, price=1000000 + number * 10000) for number in range(4)]
+        self.bmw = create_car(euro, 99, price=5000000)
+        Car.objects.filter(pk=self.bmw.pk).update(brand='BMW', country='Германия', body_type='Седан', year=2020)
+        rebuild_similar_cars()
+
+    def neighbours(self, car):
+        return list(SimilarCar.objects.filter(car=car).order_by('rank').values_list('similar_id', flat=True))
+
+    def test_closest_cars_come_first(self):
+        self.assertEqual(self.neighbours(self.skylines[0])[:3], [car.pk for car in self.skylines[1:]])
+        self.assertEqual(self.neighbours(self.skylines[0])[-1], self.bmw.pk)
+
+    def full_pass(self):
+        # Соседи всех машин полным перебором по тем же векторам, что в кэше
+        space = load_space()
+        return {
+            int(space.ids[position]): [int(space.ids[neighbour]) for neighbour in neighbours]
+            for position, neighbours, _ in nearest_neighbours(space.vectors, np.arange(len(space.ids)))
+        }
+
+    def test_incremental_update_matches_full_pass(self):
+        Car.objects.filter(pk=self.skylines[3].pk).update(price=5000000, year=2020)
+        update_similar_cars([self.skylines[3].pk])
+        self.assertEqual({car.pk: self.neighbours(car) for car in Car.objects.all()}, self.full_pass())
+
+        # Новая машина с маркой, которой не было при rebuild
+        mazda = create_car(Category.objects.get(slug='jdm'), 7)
+        Car.objects.filter(pk=mazda.pk).update(brand='Mazda')
+        update_similar_cars([mazda.pk])
+        self.assertEqual({car.pk: self.neighbours(car) for car in Car.objects.all()}, self.full_pass())
+        self.assertIn(mazda.pk, self.neighbours(self.skylines[0]))
+
+    def test_update_reads_only_changed_cars(self):
+        car = self.skylines[1]
+        # Матрица и пороги - из памяти процесса: число запросов не зависит от размера каталога
+        with CaptureQueriesContext(connection) as small:
+            update_similar_cars([car.pk])
+        for number in range(40):
+            create_car(Category.objects.get(slug='jdm'), 100 + number)
+        rebuild_similar_cars()
+        with CaptureQueriesContext(connection) as large:
+            update_similar_cars([car.pk])
+        self.assertEqual(len(large), len(small))
+        self.assertFalse([query for query in large if 'FROM "store_car"' in query['sql'] and 'IN (' not in query['sql']])
+
+    def test_unavailable_car_leaves_lists(self):
+        car = self.skylines[1]
+        car.is_available = False
+        with self.captureOnCommitCallbacks(execute=True):
+            car.save()
+        self.assertEqual(self.neighbours(car), [])
+        self.assertFalse(SimilarCar.objects.filter(similar=car).exists())
+        self.assertNotIn(car.pk, load_space().ids.tolist())
+
+    def test_deleted_car_leaves_lists(self):
+        car = self.skylines[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            car.delete()
+        self.assertFalse(SimilarCar.objects.filter(similar_id=self.skylines[1].pk).exists())
+        self.assertEqual(len(self.neighbours(self.skylines[0])), 3)
+
+    def test_failed_update_does_not_fail_save(self):
+        car = self.skylines[1]
+        car.price = 1
+        with mock.patch('store.signals.update_similar_cars', side_effect=RuntimeError('cache down')):
+            with self.assertLogs('store.transactions', 'ERROR') as logs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    car.save()
+        self.assertIn(f'похожие машины для #{car.pk}', logs.output[0])
+        self.assertEqual(Car.objects.get(pk=car.pk).price, 1)
+
+    def test_lagging_process_replays_changed_cars(self):
+        # Другой процесс: пространство версии до изменения
+        version, space = similar_module._local_space
+        stale = (version, copy.deepcopy(space))
+        Car.objects.filter(pk=self.skylines[3].pk).update(price=5000000, year=2020)
+        update_similar_cars([self.skylines[3].pk])
+        current = copy.deepcopy(load_space())
+
+        similar_module._local_space = stale
+        with self.assertNumQueries(2): # только измененная машина и пороги пересчитанных
+            space = load_space()
+        np.testing.assert_array_equal(space.ids, current.ids)
+        np.testing.assert_allclose(space.vectors, current.vectors)
+        np.testing.assert_array_equal(space.thresholds, current.thresholds)
+
+        # Отставание без журнала (forget_space) - полная загрузка
+        similar_module._local_space = stale
+        forget_space()
+        with self.assertNumQueries(2):
+            self.assertEqual(load_space().ids.tolist(), current.ids.tolist())
+
+    def test_bulk_changes_drop_cached_space(self):
+        load_space()
+        with self.captureOnCommitCallbacks(execute=True):
+            set_availability(Car.objects.filter(pk=self.bmw.pk), False)
+        with self.assertNumQueries(2): # промах кэша: машины и пороги заново из базы
+            space = load_space()
+        self.assertNotIn(self.bmw.pk, space.ids.tolist())
+
+    def test_car_detail_reads_precomputed_neighbours(self):
+        response = self.client.get(f'/car/{self.skylines[0].slug}/')
+        self.assertEqual(response.context['related_cars'], self.skylines[1:])
+
+
+class CoPurchaseTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number) for number in range(4)]
+
+    def buy(self, user, cars):
+        fill_cart(user, cars)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(user)
+
+    def test_checkout_updates_index_like_rebuild(self):
+        self.buy(self.user, self.cars[:3])
+        self.buy(User.objects.create_user('other'), [self.cars[3]])
+        incremental = set(CoPurchase.objects.values_list('model', 'other_model', 'count'))
+        self.assertEqual(len(incremental), 6) # 3 модели в заказе -> 6 упорядоченных пар
+
+        self.assertEqual(rebuild_copurchases(chunk_size=2), (2, 6))
+        self.assertEqual(set(CoPurchase.objects.values_list('model', 'other_model', 'count')), incremental)
+
+    def test_failed_counters_do_not_fail_checkout(self):
+        fill_cart(self.user, self.cars[:2])
+        with mock.patch('store.orders.record_purchase', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('store.transactions', 'ERROR') as logs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    order = place_order(self.user)
+        self.assertIn(f'заказа #{order.pk}', logs.output[0])
+        self.assertTrue(Order.objects.filter(pk=order.pk).exists())
+        # Следующие колбэки (сводка продаж) все равно выполнились
+        self.assertTrue(DailySales.objects.exists())
+
+    def test_top_k_pruning(self):
+        with mock.patch('store.copurchases.COPURCHASES_PER_LINE', 1):
+            record_purchase([('Nissan', 'Skyline'), ('Toyota', 'Supra')])
+            record_purchase([('Nissan', 'Skyline'), ('Honda', 'NSX')])
+            record_purchase([('Nissan', 'Skyline'), ('Honda', 'NSX')])
+        # Space-Saving: NSX вытеснила Supra и унаследовала ее счетчик
+        self.assertEqual(
+            list(CoPurchase.objects.filter(model='Skyline').values_list('other_model', 'count')), [('NSX', 3)]
+        )
+
+    def test_car_detail_shows_models_bought_together(self):
+        record_purchase([('Nissan', 'Skyline R0'), ('Nissan', 'Skyline R1')])
+        response = self.client.get(f'/car/{self.cars[0].slug}/')
+        self.assertEqual(response.context['also_bought'], [self.cars[1]])
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number, price=1000000 + number) for number in range(4)]
+
+    def buy(self, username, cars):
+        user = User.objects.create_user(username)
+        fill_cart(user, cars)
+        with self.captureOnCommitCallbacks(execute=True):
+            return place_order(user)
+
+    def rollup(self):
+        return set(DailySales.objects.values_list('date', 'brand', 'category', 'tuning_type', 'status', 'count', 'revenue'))
+
+    def test_incremental_updates_match_rebuild(self):
+        first = self.buy('first', self.cars[:2])
+        self.buy('second', self.cars[2:])
+        # Заказ "вчерашний": сводка по created_at, а не по дате пересчета
+        Order.objects.filter(pk=first.pk).update(created_at=first.created_at - timedelta(days=1))
+        rebuild_sales()
+        change_status(Order.objects.filter(pk=first.pk), 'shipped')
+        change_status(Order.objects.all(), 'processing')
+        incremental = self.rollup()
+
+        self.assertEqual(sum(row[5] for row in incremental), OrderItem.objects.count())
+        self.assertEqual({row[4] for row in incremental}, {'processing'})
+        DailySales.objects.all().delete()
+        self.assertEqual(rebuild_sales(chunk_days=1)[0], 2)
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_migration_backfills_existing_orders(self):
+        self.buy('first', self.cars[:2])
+        self.buy('second', self.cars[2:])
+        rebuild_sales()
+        rebuilt = self.rollup()
+        DailySales.objects.all().delete()
+
+        migration = importlib.import_module('store.migrations.0019_backfill_daily_sales')
+        migration.backfill_daily_sales(django_apps, None)
+        self.assertEqual(self.rollup(), rebuilt)
+        # Повторный прогон (сводка уже есть) ничего не удваивает
+        migration.backfill_daily_sales(django_apps, None)
+        self.assertEqual(self.rollup(), rebuilt)
+
+    def test_failed_rollup_does_not_fail_checkout(self):
+        user = User.objects.create_user('buyer')
+        fill_cart(user, self.cars)
+        with mock.patch('store.orders.add_sales', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('store.transactions', 'ERROR') as logs:
+                with self.captureOnCommitCallbacks(execute=True):
+                    order = place_order(user)
+        self.assertIn(f'сводка продаж для заказа #{order.pk}', logs.output[0])
+        self.assertFalse(DailySales.objects.exists())
+        rebuild_sales()
+        self.assertEqual(sales_report()['revenue'], order.total_price)
+
+    def test_checkout_feeds_report(self):
+        order = self.buy('buyer', self.cars)
+        report = sales_report(statuses=['new'])
+        self.assertEqual(report['count'], order.items.count())
+        self.assertEqual(report['revenue'], order.total_price)
+
+    def test_admin_actions_and_report_page(self):
+        order = self.buy('buyer', self.cars)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', None)
+        self.client.force_login(admin)
+        self.client.post('/admin/store/order/', {
+            'action': 'make_completed', 'select_across': '1', '_selected_action': Order.objects.values_list('id', flat=True),
+        })
+        self.assertEqual(set(DailySales.objects.values_list('status', flat=True)), {'shipped'})
+
+        # Отчет читает только сводку
+        with self.assertNumQueries(8): # сессия, пользователь, итоги, 5 разрезов
+            response = self.client.get('/admin/store/dailysales/?status=shipped&period=month')
+        self.assertEqual(response.context['report']['count'], order.items.count())
+
+    def test_report_requires_view_permission(self):
+        staff = User.objects.create_user('manager', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/admin/store/dailysales/').status_code, 403)
+
+        staff.user_permissions.add(Permission.objects.get(codename='view_dailysales'))
+        self.assertEqual(self.client.get('/admin/store/dailysales/').status_code, 200)
+
+
+class BenchmarkTests(TransactionTestCase):
+    def test_generator_is_deterministic(self):
+        def cars(seed):
+            fields = ('brand', 'model', 'country', 'slug', 'year', 'price', 'body_type', 'tuning_details')
+            return [
+                tuple(getattr(car, name) for name in fields)
+                for car in fake_cars(random.Random(seed), 50, fake_categories(3))
+            ]
+
+        self.assertEqual(cars(7), cars(7))
+        self.assertNotEqual(cars(7), cars(8))
+
+    def test_views_within_query_budgets(self):
+        # Задержки на CI непредсказуемы, число SQL-запросов - нет
+        results = run_benchmarks('tiny', iterations=3)
+        self.assertEqual(
+            set(results['views']), {'catalog_anonymous', 'catalog', 'car_detail', 'cart_detail', 'profile', 'checkout'}
+        )
+        self.assertEqual(check_budgets(results, load_budgets(), metrics=('queries',)), [])
+
+
+@override_settings(PERF_SAMPLE_RATE=1.0)
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.car = create_car(category, 0)
+
+    def test_server_timing_and_log_record(self):
+        with self.assertLogs('store.performance') as logs:
+            response = self.client.get(f'/car/{self.car.slug}/')
+        self.assertRegex(
+            response['Server-Timing'], r'^total;dur=[\d.]+, sql;dur=[\d.]+;desc="[1-9]\d* queries", tpl;dur=[\d.]+$'
+        )
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'car_detail')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['sql_count'], 0)
+        self.assertGreater(record['template_ms'], 0)
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_logged_only_when_slow(self):
+        with mock.patch('logging.Logger.info') as info:
+            self.client.get(f'/car/{self.car.slug}/')
+        info.assert_not_called()
+        with override_settings(PERF_SLOW_MS=0), self.assertLogs('store.performance') as logs:
+            self.client.get(f'/car/{self.car.slug}/')
+        self.assertTrue(json.loads(logs.records[0].getMessage())['slow'])
+
+    def test_nested_card_renders_are_timed_once(self):
+        # Часы идут только в рендеринге шаблонов: каждый render() - секунда
+        clock = [0.0]
+        render = BackendTemplate.render
+
+        def slow_render(template, *args, **kwargs):
+            clock[0] += 1
+            return render(template, *args, **kwargs)
+
+        create_car(self.car.category, 1)
+        cache.clear() # страница и карточки рендерятся заново
+        with mock.patch('store.instrumentation.time', mock.Mock(perf_counter=lambda: clock[0])):
+            with mock.patch.object(BackendTemplate, 'render', autospec=True, side_effect=slow_render) as rendered:
+                response = self.client.get('/catalog/')
+        self.assertGreater(rendered.call_count, 2) # страница и карточки через render_to_string
+        self.assertIn(f'tpl;dur={rendered.call_count * 1000:.1f}', response['Server-Timing'])
+
+    def test_duplicate_queries_share_fingerprint(self):
+        stats = RequestStats()
+        for car_id in range(3):
+            stats.add_query('SELECT "store_car"."id" FROM "store_car" WHERE "store_car"."id" = %s', 0)
+        stats.add_query('SELECT * FROM "store_car" WHERE "id" IN (%s, %s)', 0)
+        stats.add_query('SELECT * FROM "store_car" WHERE "id" IN (%s, %s, %s)', 0)
+
+        duplicates = stats.duplicates(threshold=2)
+        self.assertEqual([duplicate['count'] for duplicate in duplicates], [3, 2])
+        self.assertEqual(duplicates[1]['sql'], 'SELECT * FROM "store_car" WHERE "id" IN (...)')
+
+
+@override_settings(REPLICA_PIN_SECONDS=15)
+class PrimaryAfterWriteMiddlewareTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.seen = []
+
+    def view(self, request):
+        self.seen.append(_pinned.get())
+        if request.method == 'POST':
+            PrimaryReplicaRouter().db_for_write(Car)
+        return HttpResponse()
+
+    async def async_view(self, request):
+        # Запись ORM в async-представлении идет через sync_to_async, в другом потоке
+        return await sync_to_async(self.view)(request)
+
+    def test_write_pins_visitor_to_primary(self):
+        middleware = PrimaryAfterWriteMiddleware(self.view)
+        self.assertFalse(iscoroutinefunction(middleware))
+        self.assertNotIn(PRIMARY_PIN_COOKIE, middleware(self.factory.get('/')).cookies)
+        self.assertIn(PRIMARY_PIN_COOKIE, middleware(self.factory.post('/')).cookies)
+        pinned = self.factory.get('/')
+        pinned.COOKIES[PRIMARY_PIN_COOKIE] = '1'
+        middleware(pinned)
+        self.assertEqual(self.seen, [False, False, True])
+        self.assertFalse(_wrote.get())
+
+    def test_async_chain_stays_async(self):
+        middleware = PrimaryAfterWriteMiddleware(self.async_view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertNotIn(PRIMARY_PIN_COOKIE, async_to_sync(middleware)(self.factory.get('/')).cookies)
+        response = async_to_sync(middleware)(self.factory.post('/'))
+        self.assertEqual(response.cookies[PRIMARY_PIN_COOKIE]['max-age'], 15)
+        self.assertFalse(_wrote.get())
+
+
+class SessionCartTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cars = [create_car(category, number) for number in range(3)]
+        self.user = User.objects.create_user('buyer', password='secret-pass-42')
+
+    def add(self, car, tuning='base'):
+        return self.client.post(f'/cart/add/{car.id}/', {'tuning_type': tuning})
+
+    def test_anonymous_cart_lives_in_session(self):
+        self.add(self.cars[0], 'premium')
+        self.add(self.cars[0], 'standard') # та же машина - меняется комплектация
+        self.assertEqual(self.client.session[CART_SESSION_KEY]['lines'], {f'{self.cars[0].id}:standard': 1})
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.get('/cart/')
+        self.assertEqual([item.unit_price for item in response.context['priced_cart']], [1150000])
+        # Страницы с бейджем корзины мимо общего кэша
+        self.assertContains(self.client.get('/catalog/'), 'Корзина')
+
+    def test_anonymous_add_requires_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        cache.clear()
+        page = client.get(f'/car/{self.cars[0].slug}/')
+        cached = client.get(f'/car/{self.cars[0].slug}/')
+        # Страница по-прежнему из общего кэша и без токена
+        self.assertIsNone(cached.context)
+        self.assertContains(cached, 'name="csrfmiddlewaretoken" value=""')
+        self.assertEqual(cached.content, page.content)
+
+        self.assertEqual(client.post(f'/cart/add/{self.cars[0].id}/').status_code, 403)
+        self.assertNotIn(CART_SESSION_KEY, client.session)
+
+        response = client.get('/csrf/')
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        token = response.json()['token']
+        response = client.post(f'/cart/add/{self.cars[0].id}/', {'csrfmiddlewaretoken': token})
+        self.assertRedirects(response, '/cart/', fetch_redirect_response=False)
+        self.assertEqual(client.session[CART_SESSION_KEY]['lines'], {f'{self.cars[0].id}:base': 1})
+
+    def test_login_merges_anonymous_cart(self):
+        fill_cart(self.user, [self.cars[0]])
+        self.add(self.cars[1])
+        reserve_cars(User.objects.create_user('other'), [self.cars[2].id])
+        self.add(self.cars[2]) # аноним не резервирует - машину при входе отбросим
+
+        self.client.post('/login/', {'username': 'buyer', 'password': 'secret-pass-42'})
+        self.assertEqual(
+            set(CartItem.objects.filter(cart__user=self.user).values_list('car_id', flat=True)),
+            {self.cars[0].id, self.cars[1].id},
+        )
+        self.assertTrue(Reservation.objects.filter(car=self.cars[1], user=self.user).exists())
+
+    def test_clicks_write_cart_rows_in_one_batch_at_checkout(self):
+        self.client.force_login(self.user)
+        for car in self.cars:
+            self.add(car)
+        self.client.get(f'/cart/remove/{self.cars[2].id}/')
+        self.assertFalse(CartItem.objects.exists())
+
+        self.assertRedirects(self.client.get('/checkout/'), '/profile/')
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(sorted(order.items.values_list('car_id', flat=True)), [self.cars[0].id, self.cars[1].id])
+        self.assertEqual(self.client.session[CART_SESSION_KEY]['lines'], {})
+
+
+class TunedPriceTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='JDM', slug='jdm')
+        self.cheap = create_car(category, 0, price=1000000)
+        self.dear = create_car(category, 1, price=1200000)
+
+    def test_columns_follow_price_changes(self):
+        apply_price_change(Car.objects.filter(pk=self.cheap.pk), 'price_amount', 1)
+        self.assertEqual(
+            Car.objects.values_list('price', 'price_standard', 'price_premium').get(pk=self.cheap.pk),
+            (1000001, 1150001, 1300001),
+        )
+
+    def test_catalog_filters_by_tuned_price(self):
+        response = self.client.get('/catalog/', {'tuning': 'premium', 'price_max': 1400000, 'sort': 'price_asc'})
+        self.assertEqual([car.pk for car in response.context['cars']], [self.cheap.pk])
+        self.assertContains(response, '1300000 ₽')
+        self.assertEqual(response.context['total'], 1)
+
+    def test_cart_uses_tuned_price(self):
+        user = User.objects.create_user('buyer')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, car=self.dear, tuning_type='standard')
+        self.assertEqual(place_order(user).total_price, 1380000)
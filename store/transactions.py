@@ -0,0 +1,51 @@
+import logging
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    atomic() для транзакций, которые читают, а потом пишут (оформление заказа,
+    резервы, сводки). В SQLite внешняя транзакция начинается с BEGIN IMMEDIATE:
+    блокировка записи берется сразу, и параллельные писатели ждут друг друга
+    (OPTIONS['timeout']), а не падают с "database is locked", когда отложенная
+    транзакция пытается перейти от чтения к записи.
+
+    Остальные atomic() (в том числе только читающие транзакции админки)
+    начинаются обычным BEGIN и блокировку записи не берут.
+    Работает и как декоратор.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    immediate = connection.vendor == 'sqlite' and not connection.in_atomic_block
+    if immediate:
+        # Режим читается при подключении - сначала подключаемся, потом подменяем
+        connection.ensure_connection()
+        mode, connection.transaction_mode = connection.transaction_mode, 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            if immediate:
+                connection.transaction_mode = mode
+            yield
+    finally:
+        if immediate:
+            connection.transaction_mode = mode
+
+
+def on_commit_logged(func, description, using=None):
+    """
+    transaction.on_commit для побочных обновлений (счетчики, сводки), которые
+    можно пересчитать командой. Сбой не превращает уже закоммиченный запрос
+    в ошибку 500 (robust=True) и не теряет остальные колбэки, а пишется в лог
+    store.transactions с описанием: что именно не обновилось и чем это исправить.
+    """
+    def run():
+        try:
+            func()
+        except Exception:
+            logger.exception('Не выполнено после коммита: %s', description)
+            raise
+    transaction.on_commit(run, using=using, robust=True)
@@ -1,30 +1,81 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from .forms import UserRegistrationForm, CarFilterForm
 from django.contrib.auth.decorators import login_required
-from .models import Car, Cart, CartItem, Order, OrderItem
-
-
-def home(request):
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
+from .carts import SessionCart
+from .copurchases import also_bought_cars, also_bought_lines, rank_cars
+from .facets import aget_facet_index
+from .models import TUNING_MARKUPS, Car, Order, OrderItem
+from .orders import CarUnavailableError, EmptyCartError, place_order
+from .page_cache import anonymous_page_cache
+from .pagination import KeysetPaginator
+from .reservations import release_cars, reserve_cars
+
+CATALOG_PAGE_SIZE = 12
+HISTORY_PAGE_SIZE = 10
+# Поля, которые карточкам машин (store/includes/car_card.html) не нужны
+CARD_DEFERRED_FIELDS = ('description', 'tuning_details')
+
+
+# Витрина (главная, каталог, карточка машины) - async-представления:
+# под ASGI запросы к базе идут через async ORM, независимые выполняются одновременно.
+# Шаблоны по-прежнему синхронные (request.user, счетчик корзины в шапке
+# обращаются к базе), поэтому рендер - один переход в поток в конце.
+arender = sync_to_async(render)
+
+
+@anonymous_page_cache()
+async def home(request):
     # Получаем 3 последних добавленных авто для "Слайдера/Героя"
-    featured_cars = Car.objects.filter(is_available=True).order_by('-created_at')[:3]
-    return render(request, 'store/index.html', {'featured_cars': featured_cars})
+    featured_cars = Car.objects.filter(is_available=True).defer(*CARD_DEFERRED_FIELDS).order_by('-created_at')[:3]
+    return await arender(request, 'store/index.html', {'featured_cars': [car async for car in featured_cars]})
+
+@anonymous_page_cache()
+async def car_detail(request, slug):
+    # Похожие машины посчитаны заранее (store/similar.py): один запрос по индексу (car, rank).
+    # Машину ищем по slug, а не по id найденной машины - тогда оба запроса не зависят друг от друга
+    similar_cars = (
+        Car.objects.filter(neighbour_of__car__slug=slug, is_available=True)
+        .defer(*CARD_DEFERRED_FIELDS)
+        .order_by('neighbour_of__rank')[:3]
+    )
 
-def catalog(request):
-    # Получаем все машины для каталога [cite: 10]
-    cars = Car.objects.filter(is_available=True)
-    return render(request, 'store/catalog.html', {'cars': cars})
+    async def load_similar():
+        return [similar async for similar in similar_cars]
 
-def car_detail(request, slug):
-    car = get_object_or_404(Car, slug=slug, is_available=True)
-    
-    # Ищем авто той же категории, исключая текущую машину, берем 3 штуки
-    related_cars = Car.objects.filter(category=car.category, is_available=True).exclude(id=car.id)[:3]
-    
-    return render(request, 'store/car_detail.html', {
+    car, related_cars = await asyncio.gather(
+        aget_object_or_404(Car, slug=slug, is_available=True),
+        load_similar(),
+    )
+    if not related_cars:
+        # Соседи еще не посчитаны (новая машина до коммита, пустая таблица) - машины той же категории
+        related_cars = [
+            related async for related in Car.objects.filter(category_id=car.category_id, is_available=True)
+            .exclude(id=car.id)
+            .defer(*CARD_DEFERRED_FIELDS)[:3]
+        ]
+
+    # "С этой моделью также покупают": модели из истории заказов -> машины в наличии
+    lines = [line async for line in also_bought_lines([(car.brand, car.model)])]
+    also_bought = []
+    if lines:
+        cars = [other async for other in also_bought_cars(lines).defer(*CARD_DEFERRED_FIELDS)]
+        also_bought = rank_cars(cars, lines, 3)
+
+    return await arender(request, 'store/car_detail.html', {
         'car': car,
-        'related_cars': related_cars
+        'related_cars': related_cars,
+        'also_bought': also_bought,
     })
 
 def register_view(request):
@@ -57,124 +108,139 @@ def logout_view(request):
     logout(request)
     return redirect('home')
 
-@login_required(login_url='login')
 def add_to_cart(request, car_id):
-    car = get_object_or_404(Car, id=car_id)
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    
+    car = get_object_or_404(Car.objects.only('id', 'is_available'), id=car_id)
+
     # Получаем тип тюнинга из формы (если метода POST нет, то 'base')
     tuning_choice = request.POST.get('tuning_type', 'base')
-    
-    # Ищем, есть ли уже такая машина С ТАКИМ ЖЕ тюнингом в корзине
-    cart_item, item_created = CartItem.objects.get_or_create(
-        cart=cart, 
-        car=car,
-        tuning_type=tuning_choice # Важно! Разные тюнинги - разные позиции
-    )
-    
-    if not item_created:
-        cart_item.quantity += 1
-        cart_item.save()
-    
+    if tuning_choice not in TUNING_MARKUPS:
+        tuning_choice = 'base'
+
+    if request.user.is_authenticated:
+        # Машина одна на весь магазин: сначала резервируем ее за покупателем
+        if not reserve_cars(request.user, [car.id]):
+            messages.error(request, 'Этот автомобиль уже зарезервирован другим покупателем.')
+            return redirect('catalog')
+    elif not car.is_available:
+        # Анонимный посетитель резерв не получает - он появится при входе (store/carts.py)
+        messages.error(request, 'Этот автомобиль уже продан.')
+        return redirect('catalog')
+
+    # Пишется только сессия, Cart/CartItem обновятся пачкой (store/carts.py)
+    cart = SessionCart(request)
+    cart.add(car.id, tuning_choice)
+    cart.save()
     return redirect('cart_detail')
 
-@login_required(login_url='login')
+@never_cache
+@require_GET
+def csrf_token(request):
+    """
+    CSRF-токен для форм на кэшированных страницах (корзина в car_detail.html).
+    Страница из общего кэша токена не содержит, форма берет его отсюда перед отправкой;
+    заодно ставится cookie csrftoken, с которой токен сверит CsrfViewMiddleware.
+    """
+    return JsonResponse({'token': get_token(request)})
+
 def cart_detail(request):
-    # Получаем корзину, если нет - создаем пустую (на всякий случай)
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    return render(request, 'store/cart.html', {'cart': cart})
+    # Корзина из сессии: позиции, цены и итоги - одним запросом к машинам
+    priced_cart = SessionCart(request).priced()
+
+    # Рекомендации по истории заказов для моделей из корзины
+    also_bought = []
+    if priced_cart:
+        lines = list(also_bought_lines({(item.car.brand, item.car.model) for item in priced_cart}))
+        if lines:
+            cars = also_bought_cars(lines, exclude_ids=[item.car_id for item in priced_cart])
+            also_bought = rank_cars(cars.defer(*CARD_DEFERRED_FIELDS), lines, 4)
+
+    return render(request, 'store/cart.html', {
+        'priced_cart': priced_cart,
+        'also_bought': also_bought,
+        'cart_total_items': priced_cart.total_items, # бейдж в шапке без лишнего запроса
+    })
 
-@login_required(login_url='login')
-def remove_from_cart(request, item_id):
-    item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    item.delete()
+def remove_from_cart(request, car_id):
+    cart = SessionCart(request)
+    if cart.remove(car_id):
+        cart.save()
+        if request.user.is_authenticated:
+            release_cars(request.user, [car_id]) # Освобождаем резерв для других покупателей
     return redirect('cart_detail')
 
-def catalog(request):
-    # Начинаем с полного списка доступных машин
-    cars = Car.objects.filter(is_available=True)
-    
-    # Инициализируем форму, передавая GET-параметры (если они есть)
-    form = CarFilterForm(request.GET)
+@anonymous_page_cache(params=[*CarFilterForm.base_fields, 'cursor'])
+async def catalog(request):
+    # Начинаем с полного списка доступных машин (длинные тексты карточкам не нужны)
+    cars = Car.objects.filter(is_available=True).defer(*CARD_DEFERRED_FIELDS)
     
-    # Создаем контейнер для фильтрации
-    filter_params = {}
+    # Инициализируем форму, передавая GET-параметры (если они есть).
+    # Варианты фильтров - из индекса фасетов (обычно из кэша)
+    form = CarFilterForm(request.GET, facets=await aget_facet_index())
     
-    if form.is_valid():
-        # 1. Фильтр по Категории
-        category = form.cleaned_data.get('category')
-        if category:
-            filter_params['category'] = category
-            
-        # 2. Фильтр по Марке
-        brand = form.cleaned_data.get('brand')
-        if brand:
-            filter_params['brand__iexact'] = brand # __iexact для нечувствительности к регистру
-            
-        # 3. Фильтр по Стране
-        country = form.cleaned_data.get('country')
-        if country:
-            filter_params['country__iexact'] = country
-            
-        # 4. Фильтр по Цене (от)
-        price_min = form.cleaned_data.get('price_min')
-        if price_min is not None:
-            filter_params['price__gte'] = price_min # greater than or equal
-            
-        # 5. Фильтр по Цене (до)
-        price_max = form.cleaned_data.get('price_max')
-        if price_max is not None:
-            filter_params['price__lte'] = price_max # less than or equal
-            
-        # Применяем все собранные фильтры к QuerySet
-        cars = cars.filter(**filter_params)
+    # Применяем фильтры формы (категория, марка, страна, цена) и поиск
+    cars = form.filter_queryset(cars)
+
+    # Курсорная пагинация: каждая страница - одно обращение к индексу,
+    # без OFFSET и без подсчета всех найденных машин.
+    # Счетчики фасетов и общее число найденных машин берутся из индекса фасетов
+    # под текущие цены и поиск - его загружаем одновременно со страницей
+    paginator = KeysetPaginator(cars, form.get_ordering(), per_page=CATALOG_PAGE_SIZE)
+    page, facets = await asyncio.gather(
+        paginator.aget_page(request.GET.get('cursor')),
+        aget_facet_index(*form.get_facet_params()),
+    )
+    total = form.annotate_facets(facets)
         
-    return render(request, 'store/catalog.html', {
-        'cars': cars,
+    return await arender(request, 'store/catalog.html', {
+        'cars': page,
+        'page': page,
+        'total': total,
         'form': form, # Передаем форму в шаблон для отображения
+        # Карточки с ценой выбранной комплектации
+        'card_variant': 'catalog' if form.get_tuning() == 'base' else f'catalog_{form.get_tuning()}',
     })
 
 @login_required(login_url='login')
 def checkout(request):
-    # 1. Получаем корзину
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    
-    # Если корзина пуста, редиректим обратно
-    if not cart.items.exists():
+    # Вся работа (цены, заказ, позиции, очистка корзины) - одна транзакция
+    # Сначала переносим корзину из сессии в базу - place_order читает CartItem
+    cart = SessionCart(request)
+    cart.flush()
+    try:
+        place_order(request.user)
+    except EmptyCartError:
+        # Если корзина пуста, редиректим обратно
         return redirect('cart_detail')
+    except CarUnavailableError:
+        messages.error(request, 'Часть автомобилей из корзины уже продана или зарезервирована. Удалите их и попробуйте снова.')
+        return redirect('cart_detail')
+    cart.ordered()
 
-    # 2. Создаем Заказ
-    order = Order.objects.create(
-        user=request.user,
-        total_price=cart.get_total_price(),
-        status='new'
-    )
-
-    # 3. Переносим товары из Корзины в OrderItem
-    for item in cart.items.all():
-        OrderItem.objects.create(
-            order=order,
-            car=item.car,
-            price=item.get_cost(), # Берем пересчитанную цену
-            tuning_type=item.tuning_type # Переносим тип тюнинга
-        )
-    
-    # 4. Очищаем корзину
-    cart.items.all().delete()
-
-    # 5. Редирект в личный кабинет (или на страницу успеха)
+    # Редирект в личный кабинет (или на страницу успеха)
     return redirect('profile')
 
 @login_required(login_url='login')
 def profile_view(request):
-    # Получаем все заказы пользователя, от новых к старым
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    
-    # Разделяем на Действующие и Завершенные
-    active_orders = orders.filter(status__in=['new', 'processing'])
-    history_orders = orders.filter(status__in=['shipped', 'cancelled'])
+    # Заказы пользователя без лишних колонок
+    orders = Order.objects.filter(user=request.user).only('id', 'status', 'total_price', 'created_at')
+
+    # Действующие заказы: один запрос на заказы и один на все их позиции вместе с машинами
+    # (из машины берем только то, что выводится в шаблоне)
+    items = OrderItem.objects.select_related('car').only(
+        'id', 'order_id', 'price', 'tuning_type', 'car__id', 'car__brand', 'car__model'
+    )
+    active_orders = (
+        orders.filter(status__in=Order.ACTIVE_STATUSES)
+        .order_by('-created_at', '-id')
+        .prefetch_related(Prefetch('items', queryset=items))
+    )
+
+    # История: курсорная пагинация по (created_at, id), позиции не выводятся
+    history = KeysetPaginator(
+        orders.filter(status__in=Order.HISTORY_STATUSES), '-created_at', per_page=HISTORY_PAGE_SIZE
+    ).get_page(request.GET.get('cursor'))
 
     return render(request, 'store/profile.html', {
         'active_orders': active_orders,
-        'history_orders': history_orders
-    })
\ No newline at end of file
+        'history_orders': history,
+    })